@@ -12,6 +12,17 @@ class Settings(BaseSettings):
     panel_address: str = "panel.example.com:443"
     panel_api_port: int = 8000
     
+    apply_batch_concurrency: int = 8
+    restore_concurrency: int = 16
+    
+    rathole_shared_server: bool = False
+    
+    restart_backoff_base: float = 1.0
+    restart_backoff_max: float = 60.0
+    restart_stable_after: float = 60.0
+    
+    usage_report_interval: float = 60.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
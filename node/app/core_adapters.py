@@ -1,14 +1,26 @@
 """Core adapters for different tunnel types"""
 from typing import Protocol, Dict, Any, Optional, List
-import subprocess
+import asyncio
+import hashlib
+import json
 import os
 import psutil
-import time
 import logging
+import time
 from pathlib import Path
 import shutil
 
+from app.config import settings
+from app.process_supervisor import process_supervisor, pkill
+from app.readiness import READY_TIMEOUTS
+
 logger = logging.getLogger(__name__)
+def spec_hash(tunnel_core: str, spec: Dict[str, Any]) -> str:
+    """Stable hash of a tunnel's effective spec, compared by the panel during sync"""
+    payload = json.dumps({"core": tunnel_core, "spec": spec}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
 def parse_address_port(address_str: str):
     """Parse address:port string, returns (host, port, is_ipv6)"""
     import re
@@ -55,11 +67,11 @@ class CoreAdapter(Protocol):
     """Protocol for core adapters"""
     name: str
     
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]) -> None:
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]) -> None:
         """Apply tunnel configuration"""
         ...
     
-    def remove(self, tunnel_id: str) -> None:
+    async def remove(self, tunnel_id: str) -> None:
         """Remove tunnel"""
         ...
     
@@ -75,79 +87,48 @@ class RatholeAdapter:
     def __init__(self):
         self.config_dir = Path("/etc/smite-node/rathole")
         self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.processes = {}
+        # Shared server mode: group name -> {"header", "bind_port", "services": {tunnel_id: toml}}
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.shared_tunnels: Dict[str, str] = {}
+        self.group_locks: Dict[str, asyncio.Lock] = {}
+    
+    def _key(self, tunnel_id: str) -> str:
+        group = self.shared_tunnels.get(tunnel_id)
+        return f"{self.name}:{group or tunnel_id}"
+    
+    def _config_path(self, tunnel_id: str) -> Path:
+        group = self.shared_tunnels.get(tunnel_id)
+        return self.config_dir / f"{group or tunnel_id}.toml"
+    
+    def _binary(self) -> str:
+        return "/usr/local/bin/rathole" if os.path.exists("/usr/local/bin/rathole") else "rathole"
     
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]):
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]):
         """Apply Rathole tunnel - supports both server and client modes"""
-        if tunnel_id in self.processes:
-            logger.info(f"Rathole tunnel {tunnel_id} already exists, removing it first")
-            self.remove(tunnel_id)
-        
         mode = spec.get('mode', 'client')
+        listen_ports: List[int] = []
         
         transport = (spec.get('transport') or spec.get('type') or 'tcp').lower()
         use_websocket = transport == 'websocket' or transport == 'ws'
         websocket_tls = spec.get('websocket_tls', False) or spec.get('tls', False)
         
+        if mode == 'server' and settings.rathole_shared_server:
+            await self._apply_shared(tunnel_id, spec, use_websocket, websocket_tls)
+            return
+        
+        if process_supervisor.get(self._key(tunnel_id)):
+            logger.info(f"Rathole tunnel {tunnel_id} already exists, removing it first")
+            await self.remove(tunnel_id)
+        
         if mode == 'server':
-            bind_addr = spec.get('bind_addr', '0.0.0.0:23333')
-            token = spec.get('token', '').strip()
-            
-            ports = spec.get('ports', [])
-            if not ports:
-                proxy_port = spec.get('proxy_port') or spec.get('remote_port') or spec.get('listen_port')
-                if proxy_port:
-                    ports = [int(proxy_port) if isinstance(proxy_port, (int, str)) and str(proxy_port).isdigit() else proxy_port]
-            
-            if not token:
-                raise ValueError("Rathole server requires 'token' in spec")
-            if not ports:
-                raise ValueError("Rathole server requires 'ports' array or 'proxy_port'/'remote_port' in spec")
-            
-            bind_host, bind_port, is_ipv6 = parse_address_port(bind_addr)
-            if not bind_port:
-                bind_host = "0.0.0.0"
-                bind_port = 23333
-            
-            config = f"""[server]
-bind_addr = "{bind_host}:{bind_port}"
-default_token = "{token}"
-"""
-            
-            if use_websocket:
-                config += f"""
-[server.transport]
-type = "websocket"
-
-[server.transport.websocket]
-"""
-                if websocket_tls:
-                    config += "tls = true\n"
-            
-            for i, port in enumerate(ports):
-                port_num = int(port) if isinstance(port, (int, str)) and str(port).isdigit() else port
-                service_name = f"{tunnel_id}_{i}" if len(ports) > 1 else tunnel_id
-                config += f"""
-[server.services.{service_name}]
-bind_addr = "0.0.0.0:{port_num}"
-"""
+            bind_host, bind_port, header, services = self._server_config(tunnel_id, spec, use_websocket, websocket_tls)
+            listen_ports = [bind_port]
             
             config_path = self.config_dir / f"{tunnel_id}.toml"
             with open(config_path, "w") as f:
-                f.write(config)
+                f.write(header + services)
             
-            try:
-                proc = subprocess.Popen(
-                    ["/usr/local/bin/rathole", "-s", str(config_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-            except FileNotFoundError:
-                proc = subprocess.Popen(
-                    ["rathole", "-s", str(config_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
+            mode_flag = "-s"
         else:
             remote_addr = spec.get('remote_addr', '').strip()
             token = spec.get('token', '').strip()
@@ -204,60 +185,170 @@ local_addr = "{local_addr}"
             with open(config_path, "w") as f:
                 f.write(config)
             
-            try:
-                proc = subprocess.Popen(
-                    ["/usr/local/bin/rathole", "-c", str(config_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-            except FileNotFoundError:
-                proc = subprocess.Popen(
-                    ["rathole", "-c", str(config_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-        
-        self.processes[tunnel_id] = proc
-        time.sleep(0.5)
-        if proc.poll() is not None:
-            stderr = proc.stderr.read().decode() if proc.stderr else "Unknown error"
-            raise RuntimeError(f"rathole failed to start: {stderr}")
+            mode_flag = "-c"
+        
+        try:
+            await process_supervisor.start(
+                self._key(tunnel_id),
+                [self._binary(), mode_flag, str(config_path)],
+                log_path=self.config_dir / f"{tunnel_id}.log",
+                name="rathole",
+                startup_timeout=READY_TIMEOUTS["rathole"] if listen_ports else 0.5,
+                ports=listen_ports
+            )
+        except FileNotFoundError:
+            raise RuntimeError("rathole binary not found. Please install rathole.")
     
-    def remove(self, tunnel_id: str):
-        """Remove Rathole tunnel"""
-        config_path = self.config_dir / f"{tunnel_id}.toml"
+    def _server_config(self, tunnel_id: str, spec: Dict[str, Any], use_websocket: bool, websocket_tls: bool):
+        """Server section and service sections of a server-mode tunnel"""
+        bind_addr = spec.get('bind_addr', '0.0.0.0:23333')
+        token = spec.get('token', '').strip()
+        
+        ports = spec.get('ports', [])
+        if not ports:
+            proxy_port = spec.get('proxy_port') or spec.get('remote_port') or spec.get('listen_port')
+            if proxy_port:
+                ports = [int(proxy_port) if isinstance(proxy_port, (int, str)) and str(proxy_port).isdigit() else proxy_port]
+        
+        if not token:
+            raise ValueError("Rathole server requires 'token' in spec")
+        if not ports:
+            raise ValueError("Rathole server requires 'ports' array or 'proxy_port'/'remote_port' in spec")
         
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
+        bind_host, bind_port, is_ipv6 = parse_address_port(bind_addr)
+        if not bind_port:
+            bind_host = "0.0.0.0"
+            bind_port = 23333
+        
+        header = f"""[server]
+bind_addr = "{bind_host}:{bind_port}"
+default_token = "{token}"
+"""
+        
+        if use_websocket:
+            header += f"""
+[server.transport]
+type = "websocket"
+
+[server.transport.websocket]
+"""
+            if websocket_tls:
+                header += "tls = true\n"
+        
+        services = ""
+        for i, port in enumerate(ports):
+            port_num = int(port) if isinstance(port, (int, str)) and str(port).isdigit() else port
+            service_name = f"{tunnel_id}_{i}" if len(ports) > 1 else tunnel_id
+            services += f"""
+[server.services.{service_name}]
+bind_addr = "0.0.0.0:{port_num}"
+"""
+        return bind_host, bind_port, header, services
+    
+    def _group_lock(self, group: str) -> asyncio.Lock:
+        lock = self.group_locks.get(group)
+        if lock is None:
+            lock = self.group_locks[group] = asyncio.Lock()
+        return lock
+    
+    async def _apply_shared(self, tunnel_id: str, spec: Dict[str, Any], use_websocket: bool, websocket_tls: bool):
+        """Serve a server-mode tunnel from the shared process of its bind port
+        
+        All tunnels on one bind port must use the same token and transport;
+        a tunnel alone on its port may change them, which restarts the process.
+        rathole reloads its config file on change and only adds or drops the
+        services that differ, so the other tunnels keep their connections.
+        """
+        bind_host, bind_port, header, services = self._server_config(tunnel_id, spec, use_websocket, websocket_tls)
+        group = f"shared_{bind_port}"
+        if self.shared_tunnels.get(tunnel_id) != group and process_supervisor.get(self._key(tunnel_id)):
+            logger.info(f"Rathole tunnel {tunnel_id} already exists, removing it first")
+            await self.remove(tunnel_id)
+        
+        async with self._group_lock(group):
+            shared = self.groups.get(group)
+            previous = None
+            if shared and shared["header"] != header:
+                if not set(shared["services"]) <= {tunnel_id}:
+                    raise ValueError(f"Rathole bind port {bind_port} is already used by tunnels with a different token or transport")
+                # Only this tunnel uses the port: rebuild the group, rathole needs a restart for a new header
+                previous = shared
+                await process_supervisor.stop(f"{self.name}:{group}")
+                shared = None
+            if not shared:
+                shared = self.groups[group] = {"header": header, "bind_port": bind_port, "services": {}}
+            shared["services"][tunnel_id] = services
+            self.shared_tunnels[tunnel_id] = group
             try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-            except:
-                pass
-            del self.processes[tunnel_id]
+                await self._sync_group(group)
+            except Exception:
+                if previous:
+                    self.groups[group] = previous
+                else:
+                    shared["services"].pop(tunnel_id, None)
+                    self.shared_tunnels.pop(tunnel_id, None)
+                await self._sync_group(group)
+                raise
+    
+    async def _sync_group(self, group: str):
+        """Write a shared server's config, starting or stopping its process as needed"""
+        shared = self.groups.get(group)
+        key = f"{self.name}:{group}"
+        config_path = self.config_dir / f"{group}.toml"
+        if not shared or not shared["services"]:
+            self.groups.pop(group, None)
+            await process_supervisor.stop(key)
+            if config_path.exists():
+                config_path.unlink()
+            return
+        
+        # Written in place rather than renamed: rathole watches the file itself
+        with open(config_path, "w") as f:
+            f.write(shared["header"] + "".join(shared["services"].values()))
+        if process_supervisor.is_running(key):
+            logger.info(f"Updated shared rathole server {group}: {len(shared['services'])} tunnels")
+            return
         
         try:
-            subprocess.run(["pkill", "-f", f"rathole.*{tunnel_id}"], check=False, timeout=3)
-        except:
-            pass
+            await process_supervisor.start(
+                key,
+                [self._binary(), "-s", str(config_path)],
+                log_path=self.config_dir / f"{group}.log",
+                name="rathole",
+                startup_timeout=READY_TIMEOUTS["rathole"],
+                ports=[shared["bind_port"]]
+            )
+        except FileNotFoundError:
+            raise RuntimeError("rathole binary not found. Please install rathole.")
+        logger.info(f"Started shared rathole server {group}: {len(shared['services'])} tunnels")
+    
+    async def remove(self, tunnel_id: str):
+        """Remove Rathole tunnel"""
+        group = self.shared_tunnels.pop(tunnel_id, None)
+        if group:
+            async with self._group_lock(group):
+                if group in self.groups:
+                    self.groups[group]["services"].pop(tunnel_id, None)
+                await self._sync_group(group)
+            return
+        
+        config_path = self.config_dir / f"{tunnel_id}.toml"
+        
+        await process_supervisor.stop(self._key(tunnel_id))
+        await pkill(f"rathole.*{tunnel_id}")
             
         if config_path.exists():
             config_path.unlink()
     
     def status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get status"""
-        config_path = self.config_dir / f"{tunnel_id}.toml"
-        is_running = False
-        
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            is_running = proc.poll() is None
+        config_path = self._config_path(tunnel_id)
+        is_running = process_supervisor.is_running(self._key(tunnel_id))
         
         return {
             "active": config_path.exists() and is_running,
             "type": "rathole",
+            "shared": tunnel_id in self.shared_tunnels,
             "config_exists": config_path.exists(),
             "process_running": is_running
         }
@@ -302,8 +393,6 @@ class BackhaulAdapter:
         )
         self.config_dir = Path(resolved_config)
         self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.processes: Dict[str, subprocess.Popen] = {}
-        self.log_handles: Dict[str, Any] = {}
         default_binary = binary_path or Path(
             os.environ.get("BACKHAUL_CLIENT_BINARY", "/usr/local/bin/backhaul")
         )
@@ -312,13 +401,17 @@ class BackhaulAdapter:
             Path("backhaul"),
         ]
 
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]):
+    def _key(self, tunnel_id: str) -> str:
+        return f"{self.name}:{tunnel_id}"
+    
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]):
         """Apply Backhaul tunnel - supports both server and client modes"""
-        if tunnel_id in self.processes:
+        if process_supervisor.get(self._key(tunnel_id)):
             logger.info(f"Backhaul tunnel {tunnel_id} already exists, removing it first")
-            self.remove(tunnel_id)
+            await self.remove(tunnel_id)
         
         mode = spec.get('mode', 'client')
+        listen_ports: List[int] = []
         
         if mode == 'server':
             transport = (spec.get("transport") or spec.get("type") or "tcp").lower()
@@ -331,6 +424,9 @@ class BackhaulAdapter:
                 control_port = spec.get("control_port") or spec.get("listen_port") or 3080
                 bind_ip = spec.get("bind_ip", "0.0.0.0")
                 bind_addr = f"{bind_ip}:{control_port}"
+            _, bind_port, _ = parse_address_port(bind_addr)
+            if bind_port:
+                listen_ports = [bind_port]
             
             ports = spec.get("ports")
             logger.info(f"Backhaul {mode} tunnel {tunnel_id}: received ports from spec: {ports} (type: {type(ports)})")
@@ -396,24 +492,7 @@ class BackhaulAdapter:
             config_path = self.config_dir / f"{tunnel_id}.toml"
             config_path.write_text(self._render_toml({"server": server_config}), encoding="utf-8")
             
-            binary_path = self._resolve_binary_path()
-            log_path = self.config_dir / f"backhaul_{tunnel_id}.log"
-            log_fh = log_path.open("w", buffering=1)
-            log_fh.write(f"Starting Backhaul server for tunnel {tunnel_id}\n")
-            log_fh.write(self._render_toml({"server": server_config}))
-            log_fh.flush()
-            
-            try:
-                proc = subprocess.Popen(
-                    [str(binary_path), "-c", str(config_path)],
-                    stdout=log_fh,
-                    stderr=subprocess.STDOUT,
-                    cwd=str(self.config_dir),
-                    start_new_session=True,
-                )
-            except Exception:
-                log_fh.close()
-                raise
+            header = f"Starting Backhaul server for tunnel {tunnel_id}\n" + self._render_toml({"server": server_config})
         else:
             remote_addr = spec.get("remote_addr") or spec.get("control_addr") or spec.get("bind_addr")
             if not remote_addr:
@@ -459,56 +538,25 @@ class BackhaulAdapter:
             config_path = self.config_dir / f"{tunnel_id}.toml"
             config_path.write_text(self._render_toml({"client": config_dict}), encoding="utf-8")
 
-            binary_path = self._resolve_binary_path()
-
-            log_path = self.config_dir / f"backhaul_{tunnel_id}.log"
-            log_fh = log_path.open("w", buffering=1)
-            log_fh.write(f"Starting Backhaul client for tunnel {tunnel_id}\n")
-            log_fh.write(self._render_toml({"client": config_dict}))
-            log_fh.flush()
-
-            try:
-                proc = subprocess.Popen(
-                    [str(binary_path), "-c", str(config_path)],
-                    stdout=log_fh,
-                    stderr=subprocess.STDOUT,
-                )
-            except Exception:
-                log_fh.close()
-                raise
-
-        time.sleep(0.5)
-        if proc.poll() is not None:
-            error_output = ""
-            try:
-                error_output = log_path.read_text(encoding="utf-8")[-1000:]
-            except Exception:
-                pass
-            log_fh.close()
-            raise RuntimeError(f"backhaul failed to start: {error_output}")
+            header = f"Starting Backhaul client for tunnel {tunnel_id}\n" + self._render_toml({"client": config_dict})
 
-        self.processes[tunnel_id] = proc
-        self.log_handles[tunnel_id] = log_fh
+        binary_path = self._resolve_binary_path()
+        await process_supervisor.start(
+            self._key(tunnel_id),
+            [str(binary_path), "-c", str(config_path)],
+            log_path=self.config_dir / f"backhaul_{tunnel_id}.log",
+            name="backhaul",
+            header=header,
+            cwd=str(self.config_dir),
+            startup_timeout=READY_TIMEOUTS["backhaul"] if listen_ports else 0.5,
+            ports=listen_ports,
+            proto="udp" if transport == "udp" else "tcp"
+        )
 
-    def remove(self, tunnel_id: str):
+    async def remove(self, tunnel_id: str):
         config_path = self.config_dir / f"{tunnel_id}.toml"
         
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-            except Exception:
-                pass
-            del self.processes[tunnel_id]
-        if tunnel_id in self.log_handles:
-            try:
-                self.log_handles[tunnel_id].close()
-            except Exception:
-                pass
-            del self.log_handles[tunnel_id]
+        await process_supervisor.stop(self._key(tunnel_id))
 
         if config_path.exists():
             try:
@@ -518,8 +566,7 @@ class BackhaulAdapter:
 
     def status(self, tunnel_id: str) -> Dict[str, Any]:
         config_path = self.config_dir / f"{tunnel_id}.toml"
-        proc = self.processes.get(tunnel_id)
-        is_running = proc is not None and proc.poll() is None
+        is_running = process_supervisor.is_running(self._key(tunnel_id))
         return {
             "active": config_path.exists() and is_running,
             "type": "backhaul",
@@ -572,8 +619,9 @@ class ChiselAdapter:
     def __init__(self):
         self.config_dir = Path("/etc/smite-node/chisel")
         self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.processes = {}
-        self.log_handles = {}
+    
+    def _key(self, tunnel_id: str) -> str:
+        return f"{self.name}:{tunnel_id}"
     
     def _resolve_binary_path(self) -> Path:
         """Resolve chisel binary path"""
@@ -601,18 +649,20 @@ class ChiselAdapter:
             "Chisel binary not found. Expected at CHISEL_BINARY, '/usr/local/bin/chisel', or in PATH."
         )
     
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]):
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]):
         """Apply Chisel tunnel - supports both server and client modes"""
-        if tunnel_id in self.processes:
+        if process_supervisor.get(self._key(tunnel_id)):
             logger.info(f"Chisel tunnel {tunnel_id} already exists, removing it first")
-            self.remove(tunnel_id)
+            await self.remove(tunnel_id)
         
         mode = spec.get('mode', 'client')
+        listen_ports: List[int] = []
         
         if mode == 'server':
             server_port = spec.get('server_port') or spec.get('control_port') or spec.get('listen_port')
             if not server_port:
                 raise ValueError("Chisel server requires 'server_port' or 'control_port' in spec")
+            listen_ports = [int(server_port)]
             
             reverse_port = spec.get('reverse_port') or spec.get('remote_port') or spec.get('listen_port')
             if not reverse_port:
@@ -636,23 +686,11 @@ class ChiselAdapter:
             if fingerprint:
                 cmd.extend(["--fingerprint", fingerprint])
             
-            log_file = self.config_dir / f"{tunnel_id}.log"
-            log_f = open(log_file, 'w', buffering=1)
-            try:
-                log_f.write(f"Starting chisel server for tunnel {tunnel_id}\n")
-                log_f.write(f"Command: {' '.join(cmd)}\n")
-                log_f.write(f"server_port={server_port}, reverse_port={reverse_port}\n")
-                log_f.flush()
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=log_f,
-                    stderr=subprocess.STDOUT,
-                    cwd=str(self.config_dir),
-                    start_new_session=True
-                )
-            except FileNotFoundError:
-                log_f.close()
-                raise RuntimeError("chisel binary not found. Please install chisel.")
+            header = (
+                f"Starting chisel server for tunnel {tunnel_id}\n"
+                f"Command: {' '.join(cmd)}\n"
+                f"server_port={server_port}, reverse_port={reverse_port}\n"
+            )
         else:
             server_url = spec.get('server_url', '').strip()
             
@@ -706,73 +744,34 @@ class ChiselAdapter:
             reverse_specs = [f"R:{port}:127.0.0.1:{port}" for port in ports]
             logger.info(f"Chisel tunnel {tunnel_id}: ports={ports}, server_url={server_url}")
             
-            log_file = self.config_dir / f"{tunnel_id}.log"
-            log_f = open(log_file, 'w', buffering=1)
-            try:
-                log_f.write(f"Starting chisel client for tunnel {tunnel_id}\n")
-                log_f.write(f"Command: {' '.join(cmd)}\n")
-                log_f.write(f"server_url={server_url}, reverse_specs={', '.join(reverse_specs)}\n")
-                log_f.flush()
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=log_f,
-                    stderr=subprocess.STDOUT,
-                    cwd=str(self.config_dir),
-                    start_new_session=True
-                )
-            except FileNotFoundError:
-                log_f.close()
-                raise RuntimeError("chisel binary not found. Please install chisel.")
-        
-        self.log_handles[tunnel_id] = log_f
-        self.processes[tunnel_id] = proc
-        time.sleep(1.0)  # Give it more time to start
-        if proc.poll() is not None:
-            stderr = ""
-            if log_file.exists():
-                with open(log_file, 'r') as f:
-                    stderr = f.read()
-            if tunnel_id in self.log_handles:
-                try:
-                    self.log_handles[tunnel_id].close()
-                except:
-                    pass
-                del self.log_handles[tunnel_id]
-            raise RuntimeError(f"chisel failed to start: {stderr[-500:] if len(stderr) > 500 else stderr}")
-    
-    def remove(self, tunnel_id: str):
-        """Remove Chisel tunnel"""
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-                proc.wait()
-            except:
-                pass
-            del self.processes[tunnel_id]
-        
-        if tunnel_id in self.log_handles:
-            try:
-                self.log_handles[tunnel_id].close()
-            except:
-                pass
-            del self.log_handles[tunnel_id]
+            header = (
+                f"Starting chisel client for tunnel {tunnel_id}\n"
+                f"Command: {' '.join(cmd)}\n"
+                f"server_url={server_url}, reverse_specs={', '.join(reverse_specs)}\n"
+            )
         
         try:
-            subprocess.run(["pkill", "-f", f"chisel.*{tunnel_id}"], check=False, timeout=3)
-        except:
-            pass
+            await process_supervisor.start(
+                self._key(tunnel_id),
+                cmd,
+                log_path=self.config_dir / f"{tunnel_id}.log",
+                name="chisel",
+                header=header,
+                cwd=str(self.config_dir),
+                startup_timeout=READY_TIMEOUTS["chisel"] if listen_ports else 1.0,
+                ports=listen_ports
+            )
+        except FileNotFoundError:
+            raise RuntimeError("chisel binary not found. Please install chisel.")
+    
+    async def remove(self, tunnel_id: str):
+        """Remove Chisel tunnel"""
+        await process_supervisor.stop(self._key(tunnel_id))
+        await pkill(f"chisel.*{tunnel_id}")
     
     def status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get status"""
-        is_running = False
-        
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            is_running = proc.poll() is None
+        is_running = process_supervisor.is_running(self._key(tunnel_id))
         
         return {
             "active": is_running,
@@ -788,8 +787,9 @@ class FrpAdapter:
     def __init__(self):
         self.config_dir = Path("/etc/smite-node/frp")
         self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.processes = {}
-        self.log_handles = {}
+    
+    def _key(self, tunnel_id: str) -> str:
+        return f"{self.name}:{tunnel_id}"
     
     def _resolve_binary_path(self) -> Path:
         """Resolve frpc binary path"""
@@ -816,17 +816,19 @@ class FrpAdapter:
             "frpc binary not found. Expected at FRPC_BINARY, '/usr/local/bin/frpc', or in PATH."
         )
     
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]):
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]):
         """Apply FRP tunnel - supports both server and client modes"""
-        if tunnel_id in self.processes:
+        if process_supervisor.get(self._key(tunnel_id)):
             logger.info(f"FRP tunnel {tunnel_id} already exists, removing it first")
-            self.remove(tunnel_id)
+            await self.remove(tunnel_id)
         
         mode = spec.get('mode', 'client')
+        listen_ports: List[int] = []
         
         if mode == 'server':
             bind_port = spec.get('bind_port', 7000)
             token = spec.get('token')
+            listen_ports = [int(bind_port)]
             
             config_file = self.config_dir / f"frps_{tunnel_id}.yaml"
             config_content = f"""bindPort: {bind_port}
@@ -868,23 +870,12 @@ class FrpAdapter:
                 "-c", str(config_file_abs)
             ]
             
-            log_file = self.config_dir / f"{tunnel_id}.log"
-            log_f = open(log_file, 'w', buffering=1)
-            try:
-                log_f.write(f"Starting FRP server for tunnel {tunnel_id}\n")
-                log_f.write(f"Command: {' '.join(cmd)}\n")
-                log_f.write(f"Config: bind_port={bind_port}, token={'set' if token else 'none'}\n")
-                log_f.flush()
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=log_f,
-                    stderr=subprocess.STDOUT,
-                    cwd=str(self.config_dir),
-                    start_new_session=True
-                )
-            except FileNotFoundError:
-                log_f.close()
-                raise RuntimeError("FRP server binary (frps) not found. Please install FRP.")
+            header = (
+                f"Starting FRP server for tunnel {tunnel_id}\n"
+                f"Command: {' '.join(cmd)}\n"
+                f"Config: bind_port={bind_port}, token={'set' if token else 'none'}\n"
+            )
+            not_found_message = "FRP server binary (frps) not found. Please install FRP."
         else:
             logger.info(f"FRP tunnel {tunnel_id} received spec: {spec}")
             
@@ -959,61 +950,30 @@ serverPort: {server_port}
                 "-c", str(config_file_abs)
             ]
             
-            log_file = self.config_dir / f"{tunnel_id}.log"
-            log_f = open(log_file, 'w', buffering=1)
-            try:
-                log_f.write(f"Starting FRP client for tunnel {tunnel_id}\n")
-                log_f.write(f"Command: {' '.join(cmd)}\n")
-                log_f.write(f"Config: type={tunnel_type}, local={local_ip}:{local_port}, remote={remote_port}, server={server_addr}:{server_port}\n")
-                log_f.flush()
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=log_f,
-                    stderr=subprocess.STDOUT,
-                    cwd=str(self.config_dir),
-                    start_new_session=True,
-                    env=os.environ.copy()
-                )
-            except FileNotFoundError:
-                log_f.close()
-                raise RuntimeError("FRP binary (frpc) not found. Please install FRP.")
-        
-        self.log_handles[tunnel_id] = log_f
-        self.processes[tunnel_id] = proc
-        time.sleep(1.0)
-        if proc.poll() is not None:
-            stderr = ""
-            if log_file.exists():
-                with open(log_file, 'r') as f:
-                    stderr = f.read()
-            if tunnel_id in self.log_handles:
-                try:
-                    self.log_handles[tunnel_id].close()
-                except:
-                    pass
-                del self.log_handles[tunnel_id]
-            raise RuntimeError(f"FRP failed to start: {stderr[-500:] if len(stderr) > 500 else stderr}")
+            header = (
+                f"Starting FRP client for tunnel {tunnel_id}\n"
+                f"Command: {' '.join(cmd)}\n"
+                f"Config: type={tunnel_type}, local={local_ip}:{local_port}, remote={remote_port}, server={server_addr}:{server_port}\n"
+            )
+            not_found_message = "FRP binary (frpc) not found. Please install FRP."
+        
+        try:
+            await process_supervisor.start(
+                self._key(tunnel_id),
+                cmd,
+                log_path=self.config_dir / f"{tunnel_id}.log",
+                name="FRP",
+                header=header,
+                cwd=str(self.config_dir),
+                startup_timeout=READY_TIMEOUTS["frp"] if listen_ports else 1.0,
+                ports=listen_ports
+            )
+        except FileNotFoundError:
+            raise RuntimeError(not_found_message)
     
-    def remove(self, tunnel_id: str):
+    async def remove(self, tunnel_id: str):
         """Remove FRP tunnel"""
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-                proc.wait()
-            except:
-                pass
-            del self.processes[tunnel_id]
-        
-        if tunnel_id in self.log_handles:
-            try:
-                self.log_handles[tunnel_id].close()
-            except:
-                pass
-            del self.log_handles[tunnel_id]
+        await process_supervisor.stop(self._key(tunnel_id))
         
         config_file = self.config_dir / f"frpc_{tunnel_id}.yaml"
         if config_file.exists():
@@ -1022,18 +982,11 @@ serverPort: {server_port}
             except:
                 pass
         
-        try:
-            subprocess.run(["pkill", "-f", f"frpc.*{tunnel_id}"], check=False, timeout=3)
-        except:
-            pass
+        await pkill(f"frpc.*{tunnel_id}")
     
     def status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get status"""
-        is_running = False
-        
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            is_running = proc.poll() is None
+        is_running = process_supervisor.is_running(self._key(tunnel_id))
         
         return {
             "active": is_running,
@@ -1049,8 +1002,9 @@ class GostAdapter:
     def __init__(self):
         self.config_dir = Path("/etc/smite-node/gost")
         self.config_dir.mkdir(parents=True, exist_ok=True)
-        self.processes = {}
-        self.log_handles = {}
+    
+    def _key(self, tunnel_id: str) -> str:
+        return f"{self.name}:{tunnel_id}"
     
     def _resolve_binary_path(self) -> Path:
         """Resolve gost binary path"""
@@ -1077,11 +1031,11 @@ class GostAdapter:
             "GOST binary not found. Expected at GOST_BINARY, '/usr/local/bin/gost', or in PATH."
         )
     
-    def apply(self, tunnel_id: str, spec: Dict[str, Any]):
+    async def apply(self, tunnel_id: str, spec: Dict[str, Any]):
         """Apply GOST forwarding - Iran node forwards to Foreign server"""
-        if tunnel_id in self.processes:
+        if process_supervisor.get(self._key(tunnel_id)):
             logger.info(f"GOST tunnel {tunnel_id} already exists, removing it first")
-            self.remove(tunnel_id)
+            await self.remove(tunnel_id)
         
         ports = spec.get('ports', [])
         if not ports:
@@ -1151,78 +1105,39 @@ class GostAdapter:
             else:
                 raise ValueError(f"Unsupported GOST tunnel type: {tunnel_type}")
         
-        log_file = self.config_dir / f"{tunnel_id}.log"
-        log_f = open(log_file, 'w', buffering=1)
+        header = (
+            f"Starting GOST forwarding for tunnel {tunnel_id}\n"
+            f"Command: {' '.join(cmd)}\n"
+            f"Forwarding: {tunnel_type}://{listen_addr} -> {target_addr}\n"
+        )
+        
         try:
-            log_f.write(f"Starting GOST forwarding for tunnel {tunnel_id}\n")
-            log_f.write(f"Command: {' '.join(cmd)}\n")
-            log_f.write(f"Forwarding: {tunnel_type}://{listen_addr} -> {target_addr}\n")
-            log_f.flush()
-            
-            proc = subprocess.Popen(
+            await process_supervisor.start(
+                self._key(tunnel_id),
                 cmd,
-                stdout=log_f,
-                stderr=subprocess.STDOUT,
+                log_path=self.config_dir / f"{tunnel_id}.log",
+                name="GOST",
+                header=header,
                 cwd=str(self.config_dir),
-                start_new_session=True,
-                close_fds=False
+                startup_timeout=READY_TIMEOUTS["gost"],
+                ports=[int(port) for port in ports if str(port).isdigit()],
+                proto="udp" if tunnel_type == "udp" else "tcp"
             )
+        except RuntimeError:
+            raise
         except Exception as e:
-            log_f.close()
             raise RuntimeError(f"Failed to start GOST: {e}")
         
-        self.log_handles[tunnel_id] = log_f
-        self.processes[tunnel_id] = proc
-        
-        time.sleep(1.5)
-        if proc.poll() is not None:
-            stderr = ""
-            if log_file.exists():
-                with open(log_file, 'r') as f:
-                    stderr = f.read()
-            if tunnel_id in self.log_handles:
-                try:
-                    self.log_handles[tunnel_id].close()
-                except:
-                    pass
-                del self.log_handles[tunnel_id]
-            raise RuntimeError(f"GOST failed to start: {stderr[-500:] if len(stderr) > 500 else stderr}")
-        
         logger.info(f"GOST forwarding started for tunnel {tunnel_id}: {tunnel_type}://{listen_addr} -> {target_addr}")
     
-    def remove(self, tunnel_id: str):
+    async def remove(self, tunnel_id: str):
         """Remove GOST tunnel"""
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            try:
-                proc.terminate()
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-                proc.wait()
-            except:
-                pass
-            del self.processes[tunnel_id]
-        
-        if tunnel_id in self.log_handles:
-            try:
-                self.log_handles[tunnel_id].close()
-            except:
-                pass
-            del self.log_handles[tunnel_id]
-        
-        try:
-            subprocess.run(["pkill", "-f", f"gost.*{tunnel_id}"], check=False, timeout=3, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-        except:
-            pass
+        await process_supervisor.stop(self._key(tunnel_id))
+        await pkill(f"gost.*{tunnel_id}")
     
     def status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get status"""
-        is_running = False
-        
-        if tunnel_id in self.processes:
-            proc = self.processes[tunnel_id]
-            is_running = proc.poll() is None
+        is_running = process_supervisor.is_running(self._key(tunnel_id))
         
         return {
             "active": is_running,
@@ -1252,6 +1167,11 @@ class AdapterManager:
             raise
         self.tunnels_file = self.config_dir / "tunnels.json"
         self.tunnel_configs: Dict[str, Dict[str, Any]] = {}
+        self.tunnel_locks: Dict[str, asyncio.Lock] = {}
+        self.restore_progress: Dict[str, Any] = {
+            "state": "pending", "total": 0, "restored": 0, "failed": 0, "skipped": 0,
+            "started_at": None, "finished_at": None
+        }
         logger.info(f"Tunnel persistence file: {self.tunnels_file}")
     
     def get_adapter(self, tunnel_core: str) -> Optional[CoreAdapter]:
@@ -1319,75 +1239,103 @@ class AdapterManager:
             logger.error(f"Failed to save tunnel configurations to {self.tunnels_file}: {e}", exc_info=True)
     
     async def restore_tunnels(self):
-        """Restore all persisted tunnels on startup"""
-        import logging
-        logger = logging.getLogger(__name__)
+        """Restore all persisted tunnels on startup
         
+        Tunnels are started concurrently, at most settings.restore_concurrency
+        at a time, so startup takes about as long as the slowest readiness waits
+        instead of their sum. Progress is kept in restore_progress. A tunnel the
+        panel applies or removes while the restore runs is left to that call.
+        """
         logger.info(f"Starting tunnel restoration from {self.tunnels_file}")
         logger.info(f"Config directory exists: {self.config_dir.exists()}, writable: {os.access(self.config_dir, os.W_OK) if self.config_dir.exists() else False}")
         logger.info(f"Tunnels file exists: {self.tunnels_file.exists()}")
         
         self._load_tunnels()
+        progress = self.restore_progress
+        progress.update(state="running", total=len(self.tunnel_configs), started_at=time.time())
         
         if not self.tunnel_configs:
             logger.info("No persisted tunnels to restore")
+            progress.update(state="done", finished_at=time.time())
             return
         
         logger.info(f"Restoring {len(self.tunnel_configs)} persisted tunnels...")
-        restored = 0
-        failed = 0
+        semaphore = asyncio.Semaphore(max(1, settings.restore_concurrency))
         
-        for tunnel_id, config in self.tunnel_configs.items():
-            try:
-                tunnel_core = config.get("core")
-                spec = config.get("spec", {})
-                
-                if not tunnel_core:
-                    logger.warning(f"Tunnel {tunnel_id}: Missing core, skipping")
-                    failed += 1
-                    continue
-                
-                if not spec:
-                    logger.warning(f"Tunnel {tunnel_id}: Empty spec, skipping")
-                    failed += 1
-                    continue
-                
-                adapter = self.get_adapter(tunnel_core)
-                if not adapter:
-                    logger.warning(f"Tunnel {tunnel_id}: Unknown core {tunnel_core}, skipping")
-                    failed += 1
-                    continue
-                
-                mode = spec.get('mode', 'N/A')
-                logger.info(f"Restoring tunnel {tunnel_id}: core={tunnel_core}, mode={mode}, spec_keys={list(spec.keys())}")
-                
-                if tunnel_core in ["rathole", "backhaul", "chisel", "frp"] and mode == 'N/A':
-                    logger.warning(f"Tunnel {tunnel_id}: Reverse tunnel missing mode field, defaulting to client")
-                    spec['mode'] = 'client'
-                
+        async def restore(tunnel_id: str, config: Dict[str, Any]):
+            async with semaphore, self._tunnel_lock(tunnel_id):
+                if self.tunnel_configs.get(tunnel_id) is not config or tunnel_id in self.active_tunnels:
+                    progress["skipped"] += 1
+                    return
                 try:
-                    adapter.apply(tunnel_id, spec)
-                    self.active_tunnels[tunnel_id] = adapter
-                    restored += 1
-                    logger.info(f"Successfully restored tunnel {tunnel_id} (core={tunnel_core}, mode={spec.get('mode', 'N/A')})")
-                except Exception as apply_error:
-                    logger.error(f"Failed to apply tunnel {tunnel_id} during restoration: {apply_error}", exc_info=True)
-                    failed += 1
-            except Exception as e:
-                logger.error(f"Failed to restore tunnel {tunnel_id}: {e}", exc_info=True)
-                failed += 1
+                    await self._restore_tunnel(tunnel_id, config)
+                    progress["restored"] += 1
+                except Exception as e:
+                    logger.error(f"Failed to restore tunnel {tunnel_id}: {e}", exc_info=True)
+                    progress["failed"] += 1
         
-        logger.info(f"Tunnel restoration completed: {restored} restored, {failed} failed")
+        try:
+            await asyncio.gather(*(restore(tunnel_id, config) for tunnel_id, config in list(self.tunnel_configs.items())))
+            progress["state"] = "done"
+        except asyncio.CancelledError:
+            progress["state"] = "cancelled"
+            raise
+        finally:
+            progress["finished_at"] = time.time()
+            logger.info(
+                f"Tunnel restoration completed in {progress['finished_at'] - progress['started_at']:.2f}s: "
+                f"{progress['restored']} restored, {progress['failed']} failed, {progress['skipped']} skipped"
+            )
     
-    async def apply_tunnel(self, tunnel_id: str, tunnel_core: str, spec: Dict[str, Any]):
+    async def _restore_tunnel(self, tunnel_id: str, config: Dict[str, Any]):
+        tunnel_core = config.get("core")
+        spec = config.get("spec", {})
+        if not tunnel_core:
+            raise ValueError("Missing core")
+        if not spec:
+            raise ValueError("Empty spec")
+        adapter = self.get_adapter(tunnel_core)
+        if not adapter:
+            raise ValueError(f"Unknown core {tunnel_core}")
+        
+        mode = spec.get('mode', 'N/A')
+        logger.info(f"Restoring tunnel {tunnel_id}: core={tunnel_core}, mode={mode}, spec_keys={list(spec.keys())}")
+        if tunnel_core in ["rathole", "backhaul", "chisel", "frp"] and mode == 'N/A':
+            logger.warning(f"Tunnel {tunnel_id}: Reverse tunnel missing mode field, defaulting to client")
+            spec['mode'] = 'client'
+        
+        await adapter.apply(tunnel_id, spec)
+        self.active_tunnels[tunnel_id] = adapter
+        logger.info(f"Successfully restored tunnel {tunnel_id} (core={tunnel_core}, mode={spec.get('mode', 'N/A')})")
+    
+    def restore_status(self) -> Dict[str, Any]:
+        """Progress of the startup restore"""
+        progress = dict(self.restore_progress)
+        started_at = progress.pop("started_at")
+        finished_at = progress.pop("finished_at")
+        progress["duration"] = round((finished_at or time.time()) - started_at, 3) if started_at else None
+        return progress
+    
+    def _tunnel_lock(self, tunnel_id: str) -> asyncio.Lock:
+        """Serializes restore, apply and remove of one tunnel"""
+        lock = self.tunnel_locks.get(tunnel_id)
+        if lock is None:
+            lock = self.tunnel_locks[tunnel_id] = asyncio.Lock()
+        return lock
+    
+    async def apply_tunnel(self, tunnel_id: str, tunnel_core: str, spec: Dict[str, Any], revision: Optional[int] = None):
         """Apply tunnel using appropriate adapter"""
+        async with self._tunnel_lock(tunnel_id):
+            await self._apply_tunnel(tunnel_id, tunnel_core, spec, revision)
+    
+    async def _apply_tunnel(self, tunnel_id: str, tunnel_core: str, spec: Dict[str, Any], revision: Optional[int]):
         import logging
         logger = logging.getLogger(__name__)
         logger.info(f"Applying tunnel {tunnel_id}: core={tunnel_core}")
         
         if tunnel_id in self.active_tunnels:
             logger.info(f"Tunnel {tunnel_id} already exists, removing it first")
-            await self.remove_tunnel(tunnel_id)
+            await self._remove_tunnel(tunnel_id)
         
         adapter = self.get_adapter(tunnel_core)
         if not adapter:
@@ -1396,33 +1344,117 @@ class AdapterManager:
             raise ValueError(error_msg)
         
         logger.info(f"Using adapter: {adapter.name}, mode={spec.get('mode', 'N/A')}")
-        adapter.apply(tunnel_id, spec)
+        await adapter.apply(tunnel_id, spec)
         self.active_tunnels[tunnel_id] = adapter
         
         self.tunnel_configs[tunnel_id] = {
             "core": tunnel_core,
-            "spec": spec.copy()
+            "spec": spec.copy(),
+            "revision": revision
         }
         logger.info(f"Saving tunnel {tunnel_id} to persistent storage (core={tunnel_core}, mode={spec.get('mode', 'N/A')})")
         self._save_tunnels()
         logger.info(f"Tunnel {tunnel_id} applied and saved successfully (core={tunnel_core}, mode={spec.get('mode', 'N/A')}, total_saved={len(self.tunnel_configs)})")
     
+    async def apply_tunnels_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply many tunnels at once and persist the tunnel file a single time
+        
+        Different tunnels are started concurrently; repeated entries for the
+        same tunnel are applied in order. Returns one result per input item, in input order.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        by_tunnel: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            by_tunnel.setdefault(item["tunnel_id"], []).append(index)
+        
+        semaphore = asyncio.Semaphore(max(1, settings.apply_batch_concurrency))
+        
+        async def apply_group(tunnel_id: str, indexes: List[int]):
+            async with semaphore, self._tunnel_lock(tunnel_id):
+                for index in indexes:
+                    item = items[index]
+                    tunnel_core = item["core"]
+                    spec = item.get("spec") or {}
+                    adapter = self.get_adapter(tunnel_core)
+                    if not adapter:
+                        results[index] = {"tunnel_id": tunnel_id, "status": "error", "message": f"Unknown tunnel core: {tunnel_core}"}
+                        continue
+                    
+                    previous = self.active_tunnels.pop(tunnel_id, None)
+                    self.tunnel_configs.pop(tunnel_id, None)
+                    try:
+                        await self._restart_tunnel(tunnel_id, previous, adapter, spec)
+                    except Exception as e:
+                        logger.error(f"Failed to apply tunnel {tunnel_id} in batch: {e}", exc_info=True)
+                        results[index] = {"tunnel_id": tunnel_id, "status": "error", "message": str(e)}
+                        continue
+                    
+                    self.active_tunnels[tunnel_id] = adapter
+                    self.tunnel_configs[tunnel_id] = {
+                        "core": tunnel_core,
+                        "spec": spec.copy(),
+                        "revision": item.get("revision")
+                    }
+                    results[index] = {"tunnel_id": tunnel_id, "status": "success", "message": "Tunnel applied"}
+        
+        logger.info(f"Applying batch of {len(items)} tunnels ({len(by_tunnel)} distinct)")
+        await asyncio.gather(*(apply_group(tunnel_id, indexes) for tunnel_id, indexes in by_tunnel.items()))
+        
+        if items:
+            self._save_tunnels()
+        return results
+    
+    async def _restart_tunnel(self, tunnel_id: str, previous: Optional[CoreAdapter], adapter: CoreAdapter, spec: Dict[str, Any]):
+        """Stop the running instance of a tunnel (if any) and start it with a new spec"""
+        if previous:
+            await previous.remove(tunnel_id)
+        await adapter.apply(tunnel_id, spec)
+    
     async def remove_tunnel(self, tunnel_id: str):
         """Remove tunnel"""
+        async with self._tunnel_lock(tunnel_id):
+            await self._remove_tunnel(tunnel_id)
+    
+    async def _remove_tunnel(self, tunnel_id: str):
         if tunnel_id in self.active_tunnels:
             adapter = self.active_tunnels[tunnel_id]
-            adapter.remove(tunnel_id)
+            await adapter.remove(tunnel_id)
             del self.active_tunnels[tunnel_id]
         
         if tunnel_id in self.tunnel_configs:
             del self.tunnel_configs[tunnel_id]
             self._save_tunnels()
     
+    def manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Spec hash, panel revision, running state and restart count of every persisted tunnel"""
+        tunnels = {}
+        for tunnel_id, config in self.tunnel_configs.items():
+            tunnel_core = config.get("core")
+            running = False
+            restarts = 0
+            adapter = self.active_tunnels.get(tunnel_id)
+            if adapter:
+                try:
+                    running = bool(adapter.status(tunnel_id).get("active"))
+                except Exception:
+                    running = False
+                restarts = process_supervisor.restart_stats(adapter._key(tunnel_id))["restart_count"]
+            tunnels[tunnel_id] = {
+                "core": tunnel_core,
+                "spec_hash": spec_hash(tunnel_core, config.get("spec", {})),
+                "revision": config.get("revision"),
+                "running": running,
+                "restarts": restarts
+            }
+        return tunnels
+    
     async def get_tunnel_status(self, tunnel_id: str) -> Dict[str, Any]:
         """Get tunnel status"""
         if tunnel_id in self.active_tunnels:
             adapter = self.active_tunnels[tunnel_id]
-            return adapter.status(tunnel_id)
+            status = adapter.status(tunnel_id)
+            status.update(process_supervisor.restart_stats(adapter._key(tunnel_id)))
+            return status
         return {"active": False}
     
     async def cleanup(self):
@@ -0,0 +1,195 @@
+"""In-process Prometheus metrics
+
+Counters and histograms are dicts keyed by label values, updated inline by
+the request middleware and the event-loop lag monitor. Gauges that mirror
+state the agent already keeps (supervised core processes, tunnels) are read
+from it when /metrics is scraped, so a scrape never probes the cores.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Sample = Tuple[str, Iterable[Tuple[str, Any]], Any]
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_metric(name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> List[str]:
+    """Text exposition lines of one metric from (suffix, labels, value) samples"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        rendered = ",".join(f'{key}="{_label(val)}"' for key, val in labels)
+        lines.append(f"{name}{suffix}{{{rendered}}} {value}" if rendered else f"{name}{suffix} {value}")
+    return lines
+
+
+def histogram_samples(labels: Sequence[Tuple[str, Any]], bounds: Sequence[float], counts: Sequence[int], total: float) -> List[Sample]:
+    """Cumulative bucket, sum and count samples from per-bucket counts (the last one is +Inf)"""
+    labels = tuple(labels)
+    samples = []
+    cumulative = 0
+    for bound, count in zip(tuple(bounds) + ("+Inf",), counts):
+        cumulative += count
+        samples.append(("_bucket", labels + (("le", bound),), cumulative))
+    samples.append(("_sum", labels, total))
+    samples.append(("_count", labels, cumulative))
+    return samples
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+    
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        return render_metric(self.name, "counter", self.help_text, [
+            ("", zip(self.labels, key), value) for key, value in self.values.items()
+        ])
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> per-bucket counts with +Inf last, followed by the sum
+        self.values: Dict[tuple, list] = {}
+    
+    def observe(self, value: float, *label_values):
+        slots = self.values.get(label_values)
+        if slots is None:
+            slots = [0] * (len(self.buckets) + 1) + [0.0]
+            self.values[label_values] = slots
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+    
+    def render(self) -> List[str]:
+        samples = []
+        for key, slots in self.values.items():
+            samples.extend(histogram_samples(list(zip(self.labels, key)), self.buckets, slots[:-1], slots[-1]))
+        return render_metric(self.name, "histogram", self.help_text, samples)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+    
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+    
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self) -> List[str]:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return lines
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "smite_http_request_duration_seconds", "API request latency by route template", ("method", "route")
+)
+http_requests = registry.counter(
+    "smite_http_requests_total", "API requests by route template and status code", ("method", "route", "status")
+)
+loop_lag_seconds = registry.histogram(
+    "smite_event_loop_lag_seconds", "How late the event loop woke up a periodic timer", buckets=LOOP_LAG_BUCKETS
+)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware timing every HTTP request by the template of the route it matched"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            # Paths without a route (404s, static files) share one label so scanners cannot add series
+            path = getattr(route, "path", None) or "other"
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], path)
+            http_requests.inc(scope["method"], path, status)
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag as how late a periodic sleep wakes up"""
+    
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag_seconds.observe(lag)
+            if lag >= 1.0:
+                logger.warning(f"Event loop was blocked for {lag:.2f}s")
+    
+    def render(self) -> List[str]:
+        return render_metric(
+            "smite_event_loop_lag_last_seconds", "gauge", "Lag of the most recent event-loop timer", [("", (), self.last_lag)]
+        ) + render_metric(
+            "smite_event_loop_lag_max_seconds", "gauge", "Largest event-loop lag since startup", [("", (), self.max_lag)]
+        )
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -5,7 +5,7 @@ import hashlib
 import socket
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 from app.config import settings
 from app.frp_comm_client import frp_comm_client
 
@@ -214,6 +214,33 @@ class PanelClient:
         except Exception as e:
             logger.error(f"Error reporting FRP status: {e}")
     
+    def _panel_api_url(self) -> str:
+        if "://" in self.panel_address:
+            _, rest = self.panel_address.split("://", 1)
+        else:
+            rest = self.panel_address
+        panel_host = rest.split(":", 1)[0]
+        return f"http://{panel_host}:{settings.panel_api_port}"
+    
+    async def report_usage(self, batch_id: str, samples: Dict[str, int]) -> bool:
+        """Upload per-tunnel byte deltas; the panel ignores a batch_id it has already seen"""
+        if not self.client or not self.node_id:
+            return False
+        
+        try:
+            url = f"{self._panel_api_url()}/api/nodes/{self.node_id}/usage"
+            response = await self.client.post(url, json={
+                "batch_id": batch_id,
+                "samples": samples
+            }, timeout=10.0)
+            if response.status_code == 200:
+                logger.debug(f"Reported usage for {len(samples)} tunnels (batch {batch_id})")
+                return True
+            logger.warning(f"Failed to report usage: {response.status_code} - {response.text}")
+        except Exception as e:
+            logger.debug(f"Error reporting usage: {e}")
+        return False
+    
     async def _generate_fingerprint(self):
         """Generate node fingerprint for identification"""
         import socket
@@ -0,0 +1,276 @@
+"""Asyncio-native supervision of tunnel core processes"""
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+from app.config import settings
+from app.readiness import ports_listening, log_failure
+
+logger = logging.getLogger(__name__)
+
+
+class ManagedProcess:
+    """A core process started by the supervisor"""
+    
+    def __init__(self, key: str, cmd: List[str], log_path: Path, cwd: Optional[str], env: Optional[Dict[str, str]]):
+        self.key = key
+        self.cmd = cmd
+        self.log_path = log_path
+        self.cwd = cwd
+        self.env = env
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.log_handle = None
+        self.log_offset = 0
+        self.started_at: Optional[float] = None
+        self.name = key
+        self.startup_timeout = 1.0
+        self.ports: List[int] = []
+        self.proto = "tcp"
+        self.watch_task: Optional[asyncio.Task] = None
+        self.restart_count = 0
+        self.consecutive_failures = 0
+        self.last_exit_code: Optional[int] = None
+        self.last_restart_at: Optional[float] = None
+        self.restarting = False
+    
+    @property
+    def pid(self) -> Optional[int]:
+        return self.proc.pid if self.proc else None
+    
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.proc.returncode if self.proc else None
+    
+    def is_running(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+    
+    def log_tail(self, limit: int = 500) -> str:
+        try:
+            with open(self.log_path, "r", errors="replace") as f:
+                content = f.read()
+            return content[-limit:]
+        except Exception:
+            return ""
+    
+    def close_log(self):
+        if self.log_handle:
+            try:
+                self.log_handle.close()
+            except Exception:
+                pass
+            self.log_handle = None
+
+
+class ProcessSupervisor:
+    """Starts and stops core processes without blocking the event loop
+    
+    Processes are spawned with asyncio.create_subprocess_exec and their output
+    goes to a per-tunnel log file. Startup returns as soon as the process
+    listens on its ports (or, without ports, survives the startup window) and
+    fails as soon as the process exits or logs a bind/fatal error.
+    
+    Once started, every process is watched through its asyncio child watcher.
+    If it exits without being stopped, only that process is restarted, after
+    an exponential backoff that resets once it has stayed up for stable_after.
+    """
+    
+    def __init__(self, backoff_base: float = 1.0, backoff_max: float = 60.0, stable_after: float = 60.0):
+        self.processes: Dict[str, ManagedProcess] = {}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+    
+    def get(self, key: str) -> Optional[ManagedProcess]:
+        return self.processes.get(key)
+    
+    def is_running(self, key: str) -> bool:
+        managed = self.processes.get(key)
+        return managed is not None and managed.is_running()
+    
+    def restart_stats(self, key: str) -> Dict[str, Any]:
+        """Crash-restart counters for a process"""
+        managed = self.processes.get(key)
+        if not managed:
+            return {"restart_count": 0, "last_exit_code": None, "last_restart_at": None, "restarting": False}
+        return {
+            "restart_count": managed.restart_count,
+            "last_exit_code": managed.last_exit_code,
+            "last_restart_at": managed.last_restart_at,
+            "restarting": managed.restarting,
+        }
+    
+    async def start(
+        self,
+        key: str,
+        cmd: List[str],
+        log_path: Path,
+        name: str,
+        header: str = "",
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        startup_timeout: float = 1.0,
+        ports: Optional[List[int]] = None,
+        proto: str = "tcp"
+    ) -> ManagedProcess:
+        """Start a process and wait until it is ready
+        
+        With ports, waits up to startup_timeout for all of them to be listening;
+        without, the process only has to stay up for startup_timeout. Raises
+        RuntimeError with the tail of the log if the process exits or logs a
+        startup failure first.
+        """
+        if key in self.processes:
+            await self.stop(key)
+        
+        managed = ManagedProcess(key, cmd, log_path, cwd, env)
+        managed.name = name
+        managed.startup_timeout = startup_timeout
+        managed.ports = ports or []
+        managed.proto = proto
+        await self._spawn(managed, header)
+        self.processes[key] = managed
+        
+        try:
+            await self._wait_ready(managed, name, startup_timeout, managed.ports, proto)
+        except Exception:
+            await self.stop(key)
+            raise
+        managed.watch_task = asyncio.create_task(self._watch(managed))
+        return managed
+    
+    async def _watch(self, managed: ManagedProcess):
+        """Restart a process with backoff whenever it exits on its own"""
+        try:
+            while True:
+                returncode = await managed.proc.wait()
+                if self.processes.get(managed.key) is not managed:
+                    return
+                managed.close_log()
+                managed.last_exit_code = returncode
+                if managed.started_at and time.time() - managed.started_at >= self.stable_after:
+                    managed.consecutive_failures = 0
+                logger.warning(f"{managed.name} process {managed.key} exited with code {returncode}")
+                
+                managed.restarting = True
+                while True:
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** managed.consecutive_failures))
+                    managed.consecutive_failures += 1
+                    logger.info(f"Restarting {managed.key} in {delay:.1f}s (attempt {managed.consecutive_failures})")
+                    await asyncio.sleep(delay)
+                    if self.processes.get(managed.key) is not managed:
+                        return
+                    try:
+                        await self._spawn(managed, f"Restarting after exit code {managed.last_exit_code}\n", mode="a")
+                        await self._wait_ready(managed, managed.name, managed.startup_timeout, managed.ports, managed.proto)
+                    except Exception as e:
+                        logger.error(f"Failed to restart {managed.key}: {e}")
+                        await self._terminate(managed)
+                        continue
+                    break
+                managed.restarting = False
+                managed.restart_count += 1
+                managed.last_restart_at = time.time()
+                logger.info(f"Restarted {managed.key} (restart #{managed.restart_count}, PID={managed.pid})")
+        except asyncio.CancelledError:
+            pass
+    
+    async def _spawn(self, managed: ManagedProcess, header: str = "", mode: str = "w"):
+        log_f = open(managed.log_path, mode, buffering=1)
+        if header:
+            log_f.write(header)
+            log_f.flush()
+        managed.log_offset = log_f.tell()
+        try:
+            managed.proc = await asyncio.create_subprocess_exec(
+                *managed.cmd,
+                stdout=log_f,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=managed.cwd,
+                env=managed.env,
+                start_new_session=True
+            )
+        except Exception:
+            log_f.close()
+            raise
+        managed.log_handle = log_f
+        managed.started_at = time.time()
+    
+    async def _wait_ready(
+        self,
+        managed: ManagedProcess,
+        name: str,
+        startup_timeout: float,
+        ports: List[int],
+        proto: str
+    ):
+        ports = [int(p) for p in ports if p]
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if not managed.is_running():
+                raise RuntimeError(f"{name} failed to start: {managed.log_tail()}")
+            failure = log_failure(managed.log_path, managed.log_offset)
+            if failure:
+                raise RuntimeError(f"{name} failed to start: {failure}")
+            if ports and await ports_listening(ports, proto, managed.pid):
+                return
+            if time.monotonic() >= deadline:
+                if ports:
+                    logger.warning(f"{name} port(s) {ports} not listening after {startup_timeout}s, but process is running. PID: {managed.pid}")
+                return
+            await asyncio.sleep(0.05)
+    
+    async def stop(self, key: str, timeout: float = 5.0):
+        """Terminate a process, killing it if it does not exit within timeout"""
+        managed = self.processes.pop(key, None)
+        if not managed:
+            return
+        if managed.watch_task and managed.watch_task is not asyncio.current_task():
+            managed.watch_task.cancel()
+            await asyncio.gather(managed.watch_task, return_exceptions=True)
+        await self._terminate(managed, timeout)
+    
+    async def _terminate(self, managed: ManagedProcess, timeout: float = 5.0):
+        proc = managed.proc
+        if proc and proc.returncode is None:
+            try:
+                proc.terminate()
+                await asyncio.wait_for(proc.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                try:
+                    proc.kill()
+                    await proc.wait()
+                except ProcessLookupError:
+                    pass
+            except ProcessLookupError:
+                pass
+            except Exception as e:
+                logger.debug(f"Error stopping {managed.key}: {e}")
+        managed.close_log()
+    
+    async def stop_all(self):
+        """Stop every supervised process"""
+        await asyncio.gather(*(self.stop(key) for key in list(self.processes.keys())), return_exceptions=True)
+
+
+async def pkill(pattern: str, timeout: float = 3.0):
+    """Kill stray processes matching a command-line pattern without blocking"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "pkill", "-f", pattern,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+    except Exception:
+        pass
+
+
+process_supervisor = ProcessSupervisor(
+    backoff_base=settings.restart_backoff_base,
+    backoff_max=settings.restart_backoff_max,
+    stable_after=settings.restart_stable_after,
+)
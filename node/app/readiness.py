@@ -0,0 +1,126 @@
+"""Readiness detection for tunnel core processes"""
+import asyncio
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Optional, Set
+
+# Upper bound on how long each core may take to open its listen socket
+READY_TIMEOUTS = {
+    "gost": 3.0,
+    "rathole": 5.0,
+    "backhaul": 5.0,
+    "chisel": 5.0,
+    "frp": 5.0,
+}
+
+FAILURE_PATTERN = re.compile(
+    r"address already in use|bind: permission denied|cannot assign requested address|panic:|\bfatal\b",
+    re.IGNORECASE
+)
+
+_PROC_NET = {
+    "tcp": ("/proc/net/tcp", "/proc/net/tcp6"),
+    "udp": ("/proc/net/udp", "/proc/net/udp6"),
+}
+_TCP_LISTEN = "0A"
+
+
+def socket_inodes(pid: int) -> Optional[Set[str]]:
+    """Inodes of the sockets held by a process and its direct children
+    
+    Returns None when the process's /proc/<pid>/fd cannot be read.
+    """
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            pids += [int(p) for p in f.read().split()]
+    except (OSError, ValueError):
+        pass
+    inodes: Set[str] = set()
+    found = False
+    for owner in pids:
+        fd_dir = f"/proc/{owner}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        found = found or owner == pid
+        for fd in fds:
+            try:
+                target = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                inodes.add(target[8:-1])
+    return inodes if found else None
+
+
+def listening_ports(proto: str = "tcp", pid: Optional[int] = None) -> Optional[Set[int]]:
+    """Ports with a listening TCP socket (or bound UDP socket), read from /proc/net
+    
+    With a pid, only sockets owned by that process (or its children) count, so
+    a port held by some other process does not look like ours. Returns None
+    when /proc/net is not available.
+    """
+    inodes = socket_inodes(pid) if pid else None
+    ports: Set[int] = set()
+    found = False
+    for path in _PROC_NET.get(proto, ()):
+        try:
+            with open(path, "r") as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        found = True
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            if proto == "tcp" and fields[3] != _TCP_LISTEN:
+                continue
+            if inodes is not None and fields[9] not in inodes:
+                continue
+            try:
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+            except (IndexError, ValueError):
+                continue
+    return ports if found else None
+
+
+async def _connect_probe(port: int) -> bool:
+    for host in ("127.0.0.1", "::1"):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=0.2)
+        except Exception:
+            continue
+        writer.close()
+        return True
+    return False
+
+
+async def ports_listening(ports: Iterable[int], proto: str = "tcp", pid: Optional[int] = None) -> bool:
+    """True once every port has a listen socket, owned by pid when one is given"""
+    ports = [int(p) for p in ports]
+    open_ports = listening_ports(proto, pid)
+    if open_ports is not None:
+        return all(p in open_ports for p in ports)
+    if proto != "tcp":
+        return False
+    for port in ports:
+        if not await _connect_probe(port):
+            return False
+    return True
+
+
+def log_failure(log_path: Path, offset: int = 0) -> Optional[str]:
+    """Return the first log line after offset that reports a fatal startup error"""
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            f.seek(offset)
+            for line in f:
+                if FAILURE_PATTERN.search(line):
+                    return line.strip()
+    except OSError:
+        pass
+    return None
@@ -1,7 +1,7 @@
 """Agent API endpoints"""
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import logging
 
 router = APIRouter()
@@ -14,6 +14,11 @@ class TunnelApply(BaseModel):
     core: str
     type: str
     spec: Dict[str, Any]
+    revision: Optional[int] = None
+
+
+class TunnelApplyBatch(BaseModel):
+    tunnels: List[TunnelApply]
 
 
 class TunnelRemove(BaseModel):
@@ -31,7 +36,8 @@ async def apply_tunnel(data: TunnelApply, request: Request):
         await adapter_manager.apply_tunnel(
             tunnel_id=data.tunnel_id,
             tunnel_core=data.core,
-            spec=data.spec
+            spec=data.spec,
+            revision=data.revision
         )
         logger.info(f"Tunnel {data.tunnel_id} applied successfully")
         return {"status": "success", "message": "Tunnel applied"}
@@ -40,6 +46,27 @@ async def apply_tunnel(data: TunnelApply, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/tunnels/apply-batch")
+async def apply_tunnels_batch(data: TunnelApplyBatch, request: Request):
+    """Apply several tunnel configurations, persisting once"""
+    adapter_manager = request.app.state.adapter_manager
+    
+    logger.info(f"Applying batch of {len(data.tunnels)} tunnels")
+    try:
+        results = await adapter_manager.apply_tunnels_batch([t.model_dump() for t in data.tunnels])
+    except Exception as e:
+        logger.error(f"Failed to apply tunnel batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    applied = sum(1 for r in results if r["status"] == "success")
+    return {
+        "status": "success",
+        "applied": applied,
+        "failed": len(results) - applied,
+        "results": results
+    }
+
+
 @router.post("/tunnels/remove")
 async def remove_tunnel(data: TunnelRemove, request: Request):
     """Remove tunnel"""
@@ -64,6 +91,17 @@ async def get_tunnel_status(tunnel_id: str, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/tunnels/manifest")
+async def get_tunnel_manifest(request: Request):
+    """Get spec hash and revision of every tunnel on this node"""
+    adapter_manager = request.app.state.adapter_manager
+    
+    return {
+        "status": "ok",
+        "tunnels": adapter_manager.manifest()
+    }
+
+
 @router.get("/status")
 async def get_status(request: Request):
     """Get node status"""
@@ -72,6 +110,7 @@ async def get_status(request: Request):
     return {
         "status": "ok",
         "active_tunnels": len(adapter_manager.active_tunnels),
-        "tunnels": list(adapter_manager.active_tunnels.keys())
+        "tunnels": list(adapter_manager.active_tunnels.keys()),
+        "restore": adapter_manager.restore_status()
     }
 
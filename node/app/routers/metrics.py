@@ -0,0 +1,57 @@
+"""Prometheus metrics endpoint"""
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from app.metrics import registry, render_metric, loop_lag_monitor, PROMETHEUS_CONTENT_TYPE
+from app.process_supervisor import process_supervisor
+
+
+router = APIRouter()
+
+
+def _core_process_lines() -> List[str]:
+    processes: Dict[Tuple[str, str], int] = {}
+    restarts: Dict[str, int] = {}
+    for key, managed in process_supervisor.processes.items():
+        core = key.split(":", 1)[0]
+        state = "running" if managed.is_running() else "stopped"
+        processes[(core, state)] = processes.get((core, state), 0) + 1
+        restarts[core] = restarts.get(core, 0) + managed.restart_count
+    return render_metric(
+        "smite_core_processes", "gauge", "Supervised core processes",
+        [("", (("core", core), ("state", state)), count) for (core, state), count in sorted(processes.items())]
+    ) + render_metric(
+        "smite_core_restarts_total", "counter", "Crash restarts of supervised core processes",
+        [("", (("core", core),), count) for core, count in sorted(restarts.items())]
+    )
+
+
+def _tunnel_lines(adapter_manager) -> List[str]:
+    """Persisted tunnels by core; pending ones have not been applied since startup"""
+    counts: Dict[Tuple[str, str], int] = {}
+    for tunnel_id, config in list(adapter_manager.tunnel_configs.items()):
+        adapter = adapter_manager.active_tunnels.get(tunnel_id)
+        if adapter is None:
+            status = "pending"
+        elif process_supervisor.is_running(adapter._key(tunnel_id)):
+            status = "running"
+        else:
+            status = "stopped"
+        key = (str(config.get("core")), status)
+        counts[key] = counts.get(key, 0) + 1
+    return render_metric(
+        "smite_tunnels", "gauge", "Tunnels by core and status",
+        [("", (("core", core), ("status", status)), count) for (core, status), count in sorted(counts.items())]
+    )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Node metrics in Prometheus text format"""
+    lines = registry.render() + loop_lag_monitor.render() + _core_process_lines()
+    adapter_manager = getattr(request.app.state, "adapter_manager", None)
+    if adapter_manager is not None:
+        lines += _tunnel_lines(adapter_manager)
+    return Response("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,152 @@
+"""Per-tunnel traffic accounting from iptables counters"""
+import asyncio
+import logging
+import re
+import shutil
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REVERSE_CORES = {"rathole", "backhaul", "chisel", "frp"}
+
+_COMMENT_RE = re.compile(r"/\* smite:(\S+) \*/")
+
+
+def public_ports(tunnel_core: str, spec: Dict[str, Any]) -> List[str]:
+    """Ports (or "start:end" ranges) where users reach a tunnel on this node
+    
+    Only the side that exposes the public ports is metered, so reverse tunnel
+    clients return nothing and bytes are never counted twice.
+    """
+    if tunnel_core in REVERSE_CORES and spec.get("mode", "client") != "server":
+        return []
+    
+    result = []
+    ports = spec.get("ports") or []
+    if isinstance(ports, (int, str)):
+        ports = [ports]
+    for entry in ports:
+        if isinstance(entry, dict):
+            entry = entry.get("remote") or entry.get("listen") or entry.get("port")
+        if entry is None:
+            continue
+        text = str(entry).split("=", 1)[0].strip()
+        if ":" in text:
+            text = text.rsplit(":", 1)[1]
+        text = text.replace("-", ":")
+        if re.fullmatch(r"\d+(:\d+)?", text):
+            result.append(text)
+    
+    if not result:
+        for key in ("remote_port", "listen_port", "public_port", "proxy_port", "reverse_port"):
+            value = spec.get(key)
+            if value and str(value).isdigit():
+                result.append(str(value))
+                break
+    return sorted(set(result))
+
+
+class TrafficMeter:
+    """Counts bytes per tunnel with iptables accounting rules
+    
+    Each public port gets target-less rules in a dedicated chain (INPUT
+    --dport and OUTPUT --sport, tcp and udp, IPv4 and IPv6), so the kernel
+    counts the bytes and nothing is proxied in userspace. collect() reads the
+    counters and returns what each tunnel moved since the previous call.
+    """
+    
+    CHAIN = "SMITE_ACCT"
+    
+    def __init__(self):
+        self.binaries = [b for b in ("iptables", "ip6tables") if shutil.which(b)]
+        self.installed: Dict[str, List[str]] = {}
+        self.last: Dict[str, int] = {}
+        self.available: Optional[bool] = None
+        self.primed = False
+    
+    async def _run(self, *args: str, stdin: Optional[str] = None) -> Tuple[int, str]:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        output, _ = await proc.communicate(stdin.encode() if stdin is not None else None)
+        return proc.returncode, output.decode(errors="replace")
+    
+    async def _setup(self) -> bool:
+        if self.available is not None:
+            return self.available
+        usable = []
+        for binary in self.binaries:
+            code, output = await self._run(binary, "-w", "-N", self.CHAIN)
+            if code != 0 and "exists" not in output:
+                logger.warning(f"Traffic accounting disabled for {binary}: {output.strip()}")
+                continue
+            for hook in ("INPUT", "OUTPUT"):
+                code, _ = await self._run(binary, "-w", "-C", hook, "-j", self.CHAIN)
+                if code != 0:
+                    await self._run(binary, "-w", "-I", hook, "-j", self.CHAIN)
+            usable.append(binary)
+        self.binaries = usable
+        self.available = bool(usable)
+        if not self.available:
+            logger.warning("Traffic accounting unavailable (iptables missing or no NET_ADMIN)")
+        return self.available
+    
+    async def _read_counters(self) -> Dict[str, int]:
+        counters: Dict[str, int] = {}
+        for binary in self.binaries:
+            code, output = await self._run(binary, "-w", "-nvxL", self.CHAIN)
+            if code != 0:
+                continue
+            for line in output.splitlines():
+                match = _COMMENT_RE.search(line)
+                fields = line.split()
+                if not match or len(fields) < 2 or not fields[1].isdigit():
+                    continue
+                counters[match.group(1)] = counters.get(match.group(1), 0) + int(fields[1])
+        return counters
+    
+    async def _install(self, desired: Dict[str, List[str]]):
+        lines = ["*filter", f":{self.CHAIN} - [0:0]"]
+        for tunnel_id, ports in sorted(desired.items()):
+            for port in ports:
+                for proto in ("tcp", "udp"):
+                    comment = f'-m comment --comment "smite:{tunnel_id}"'
+                    lines.append(f"-A {self.CHAIN} -p {proto} --dport {port} {comment}")
+                    lines.append(f"-A {self.CHAIN} -p {proto} --sport {port} {comment}")
+        lines.append("COMMIT")
+        rules = "\n".join(lines) + "\n"
+        for binary in self.binaries:
+            code, output = await self._run(f"{binary}-restore", "-w", "--noflush", stdin=rules)
+            if code != 0:
+                logger.warning(f"Failed to install accounting rules with {binary}-restore: {output.strip()}")
+        self.installed = {tunnel_id: list(ports) for tunnel_id, ports in desired.items()}
+    
+    async def collect(self, desired: Dict[str, List[str]]) -> Dict[str, int]:
+        """Return bytes per tunnel since the last call and install rules for desired ports"""
+        if not await self._setup():
+            return {}
+        
+        counters = await self._read_counters()
+        if not self.primed:
+            # Counters left by a previous agent run were already reported up to its last read
+            self.last = counters
+            self.primed = True
+        deltas = {}
+        for tunnel_id, value in counters.items():
+            previous = self.last.get(tunnel_id, 0)
+            delta = value - previous if value >= previous else value
+            if delta > 0:
+                deltas[tunnel_id] = delta
+        self.last = counters
+        
+        if desired != self.installed:
+            # Rebuilding the chain resets its counters, which were just read
+            await self._install(desired)
+            self.last = {}
+        return deltas
+
+
+traffic_meter = TrafficMeter()
@@ -3,15 +3,19 @@ Smite Node - Lightweight Agent
 """
 import asyncio
 import logging
+import uuid
 from contextlib import asynccontextmanager
+from typing import Dict
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.routers import agent
+from app.routers import agent, metrics
 from app.panel_client import PanelClient
 from app.core_adapters import AdapterManager
+from app.traffic_meter import traffic_meter, public_ports
+from app.metrics import loop_lag_monitor, RequestMetricsMiddleware
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,9 +37,47 @@ async def registration_loop(panel_client: PanelClient):
             logger.debug(f"Periodic registration error (will retry): {e}")
 
 
+async def usage_report_loop(panel_client: PanelClient, adapter_manager: AdapterManager):
+    """Meter tunnel traffic and upload the deltas to the panel in batches"""
+    pending: Dict[str, int] = {}
+    batch = None
+    while True:
+        try:
+            await asyncio.sleep(settings.usage_report_interval)
+            desired = {}
+            for tunnel_id, config in adapter_manager.tunnel_configs.items():
+                ports = public_ports(config.get("core"), config.get("spec", {}))
+                if ports:
+                    desired[tunnel_id] = ports
+            for tunnel_id, used in (await traffic_meter.collect(desired)).items():
+                pending[tunnel_id] = pending.get(tunnel_id, 0) + used
+            
+            # An unacknowledged batch is resent as-is so the panel can drop duplicates
+            if batch is None and pending:
+                batch = (str(uuid.uuid4()), pending)
+                pending = {}
+            if batch and await panel_client.report_usage(*batch):
+                batch = None
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.debug(f"Usage report error (will retry): {e}")
+
+
+async def restore_tunnels(adapter_manager: AdapterManager):
+    """Restore persisted tunnels after startup"""
+    try:
+        await adapter_manager.restore_tunnels()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to restore tunnels on startup: {e}", exc_info=True)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
+    await loop_lag_monitor.start()
     h2_client = PanelClient()
     registration_task = None
     try:
@@ -59,12 +101,24 @@ async def lifespan(app: FastAPI):
     adapter_manager = AdapterManager()
     app.state.adapter_manager = adapter_manager
     
-    try:
-        await adapter_manager.restore_tunnels()
-    except Exception as e:
-        logger.error(f"Failed to restore tunnels on startup: {e}", exc_info=True)
+    # Restore in the background so the API (and the restore progress) is served meanwhile
+    app.state.restore_task = asyncio.create_task(restore_tunnels(adapter_manager))
+    
+    if app.state.h2_client:
+        app.state.usage_task = asyncio.create_task(usage_report_loop(app.state.h2_client, adapter_manager))
     
     yield
+    app.state.restore_task.cancel()
+    try:
+        await app.state.restore_task
+    except asyncio.CancelledError:
+        pass
+    if hasattr(app.state, 'usage_task'):
+        app.state.usage_task.cancel()
+        try:
+            await app.state.usage_task
+        except asyncio.CancelledError:
+            pass
     if hasattr(app.state, 'registration_task') and app.state.registration_task:
         app.state.registration_task.cancel()
         try:
@@ -78,6 +132,7 @@ async def lifespan(app: FastAPI):
             pass
     if hasattr(app.state, 'adapter_manager'):
         await app.state.adapter_manager.cleanup()
+    await loop_lag_monitor.stop()
 
 
 app = FastAPI(
@@ -94,9 +149,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 
 app.include_router(agent.router, prefix="/api/agent", tags=["agent"])
+app.include_router(metrics.router, tags=["metrics"])
 
 
 @app.get("/")
@@ -3,10 +3,12 @@ import logging
 import os
 import shutil
 import subprocess
-import time
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
+from app.readiness import wait_until_ready, READY_TIMEOUTS
+from app.core_supervisor import core_supervisor
+
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +83,7 @@ class BackhaulManager:
         log_fh.write(f"Starting Backhaul server for tunnel {tunnel_id}\n")
         log_fh.write(config_content)
         log_fh.flush()
+        log_offset = log_fh.tell()
 
         try:
             proc = subprocess.Popen(
@@ -97,24 +100,39 @@ class BackhaulManager:
         self.processes[tunnel_id] = proc
         self.log_handles[tunnel_id] = log_fh
 
-        time.sleep(1.0)
-        if proc.poll() is not None:
-            error_output = ""
-            try:
-                error_output = log_path.read_text(encoding="utf-8")[-1000:]
-            except Exception:
-                pass
-            self._cleanup_process(tunnel_id)
-            raise RuntimeError(
-                f"Backhaul server failed to start (exit code {proc.returncode}). "
-                f"Log tail: {error_output}"
+        spec = spec or {}
+        transport = (spec.get("transport") or spec.get("type") or "tcp").lower()
+        try:
+            control_port = int(str(self._bind_addr(spec)).rsplit(":", 1)[1])
+        except (IndexError, ValueError):
+            control_port = None
+        
+        try:
+            wait_until_ready(
+                proc,
+                "Backhaul server",
+                log_path,
+                ports=[control_port] if control_port else [],
+                proto="udp" if transport == "udp" else "tcp",
+                timeout=READY_TIMEOUTS["backhaul"],
+                log_offset=log_offset,
             )
+        except RuntimeError:
+            self._cleanup_process(tunnel_id)
+            raise
 
+        core_supervisor.watch(
+            f"backhaul:{tunnel_id}",
+            proc,
+            lambda: self.start_server(tunnel_id, spec),
+        )
+        
         logger.info("Started Backhaul server for tunnel %s using config %s", tunnel_id, config_path)
         return True
 
     def stop_server(self, tunnel_id: str):
         """Stop Backhaul server for a tunnel"""
+        core_supervisor.unwatch(f"backhaul:{tunnel_id}")
         if tunnel_id in self.processes:
             proc = self.processes[tunnel_id]
             try:
@@ -165,15 +183,7 @@ class BackhaulManager:
                 pass
             del self.log_handles[tunnel_id]
 
-    def _build_server_config(self, spec: dict) -> str:
-        transport = (spec.get("transport") or spec.get("type") or "tcp").lower()
-        server_options = dict(spec.get("server_options") or {})
-
-        # UDP over TCP helper toggle
-        accept_udp = spec.get("accept_udp", server_options.get("accept_udp", False))
-        if transport in {"tcp", "tcpmux"} and accept_udp:
-            server_options["accept_udp"] = True
-
+    def _bind_addr(self, spec: dict) -> str:
         bind_addr = spec.get("bind_addr")
         if not bind_addr:
             control_port = spec.get("control_port")
@@ -187,7 +197,18 @@ class BackhaulManager:
             if bind_ip == "::":
                 bind_ip = "0.0.0.0"
             bind_addr = f"{bind_ip}:{control_port}"
+        return bind_addr
 
+    def _build_server_config(self, spec: dict) -> str:
+        transport = (spec.get("transport") or spec.get("type") or "tcp").lower()
+        server_options = dict(spec.get("server_options") or {})
+        
+        # UDP over TCP helper toggle
+        accept_udp = spec.get("accept_udp", server_options.get("accept_udp", False))
+        if transport in {"tcp", "tcpmux"} and accept_udp:
+            server_options["accept_udp"] = True
+        
+        bind_addr = self._bind_addr(spec)
         ports = self._build_ports(spec)
 
         server_config: Dict[str, Any] = {
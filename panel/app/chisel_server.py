@@ -1,12 +1,13 @@
 """Chisel server management for panel"""
 import os
 import subprocess
-import time
 import logging
 from pathlib import Path
 from typing import Dict, Optional
 
 from app.utils import parse_address_port, format_address_port
+from app.readiness import wait_until_ready, READY_TIMEOUTS
+from app.core_supervisor import core_supervisor
 
 logger = logging.getLogger(__name__)
 
@@ -69,6 +70,7 @@ class ChiselServerManager:
                 log_f.write(f"Config: server_port={server_port}, auth={auth is not None}, fingerprint={fingerprint is not None}\n")
                 log_f.write(f"Command: {' '.join(cmd)}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     cmd,
                     stdout=log_f,
@@ -79,6 +81,7 @@ class ChiselServerManager:
             except FileNotFoundError:
                 log_f.write(f"Starting chisel server (system binary) for tunnel {tunnel_id}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     ["chisel"] + cmd[1:],  # Use system binary
                     stdout=log_f,
@@ -90,60 +93,35 @@ class ChiselServerManager:
             self.active_servers[f"{tunnel_id}_log"] = log_f
             self.active_servers[tunnel_id] = proc
             
-            time.sleep(1.0)
-            if proc.poll() is not None:
-                try:
-                    if log_file.exists():
-                        with open(log_file, 'r') as f:
-                            error_output = f.read()
-                    else:
-                        error_output = "Log file not found"
-                    error_msg = f"chisel server failed to start (exit code: {proc.poll()}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                    logger.error(error_msg)
-                except Exception as e:
-                    error_msg = f"chisel server failed to start (exit code: {proc.poll()}), could not read log: {e}"
-                    logger.error(error_msg)
-                finally:
-                    del self.active_servers[tunnel_id]
-                    if f"{tunnel_id}_log" in self.active_servers:
-                        try:
-                            self.active_servers[f"{tunnel_id}_log"].close()
-                        except:
-                            pass
-                        del self.active_servers[f"{tunnel_id}_log"]
-                    if tunnel_id in self.server_configs:
-                        del self.server_configs[tunnel_id]
-                raise RuntimeError(error_msg)
-            
             try:
-                import socket
-                max_retries = 3
-                port_listening = False
-                for attempt in range(max_retries):
-                    time.sleep(0.5)  # Give it time to bind
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(1)
-                    result = sock.connect_ex(('127.0.0.1', server_port))
-                    sock.close()
-                    if result == 0:
-                        port_listening = True
-                        break
-                
-                if not port_listening:
-                    if proc.poll() is not None:
-                        error_msg = f"Chisel server process exited (code: {proc.poll()}) before port verification"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
-                    else:
-                        logger.warning(f"Chisel server port {server_port} not listening after {max_retries} attempts, but process is running. PID: {proc.pid}")
-                else:
-                    logger.info(f"Chisel server port {server_port} verified as listening")
-            except Exception as e:
-                if proc.poll() is not None:
-                    error_msg = f"Chisel server process died during verification (code: {proc.poll()}): {e}"
-                    logger.error(error_msg)
-                    raise RuntimeError(error_msg)
-                logger.warning(f"Could not verify chisel server port is listening: {e}")
+                listening = wait_until_ready(
+                    proc,
+                    "chisel server",
+                    log_file,
+                    ports=[server_port],
+                    timeout=READY_TIMEOUTS["chisel"],
+                    log_offset=log_offset
+                )
+            except RuntimeError as e:
+                logger.error(str(e))
+                del self.active_servers[tunnel_id]
+                if f"{tunnel_id}_log" in self.active_servers:
+                    try:
+                        self.active_servers[f"{tunnel_id}_log"].close()
+                    except:
+                        pass
+                    del self.active_servers[f"{tunnel_id}_log"]
+                if tunnel_id in self.server_configs:
+                    del self.server_configs[tunnel_id]
+                raise
+            if listening:
+                logger.info(f"Chisel server port {server_port} verified as listening")
+            
+            core_supervisor.watch(
+                f"chisel:{tunnel_id}",
+                proc,
+                lambda: self.start_server(tunnel_id, server_port, auth, fingerprint, use_ipv6)
+            )
             
             logger.info(f"Started Chisel server for tunnel {tunnel_id} on port {server_port} (PID: {proc.pid})")
             return True
@@ -154,6 +132,7 @@ class ChiselServerManager:
     
     def stop_server(self, tunnel_id: str):
         """Stop Chisel server for a tunnel"""
+        core_supervisor.unwatch(f"chisel:{tunnel_id}")
         if tunnel_id in self.active_servers:
             proc = self.active_servers[tunnel_id]
             try:
@@ -19,6 +19,13 @@ class Settings(BaseSettings):
     db_name: str = "smite"
     db_user: str = "smite"
     db_password: str = "changeme"
+    db_busy_timeout_ms: int = 5000
+    db_cache_size_mb: int = 32
+    db_synchronous: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    db_pool_size: int = 5
+    db_pool_max_overflow: int = 10
+    migration_batch_size: int = 500
+    migration_batch_pause: float = 0.05
     
     node_port: int = 4443
     node_cert_path: str = "./certs/ca.crt"
@@ -26,6 +33,38 @@ class Settings(BaseSettings):
     node_server_cert_path: str = "./certs/ca-server.crt"
     node_server_key_path: str = "./certs/ca-server.key"
     
+    node_pool_max_connections: int = 10
+    node_pool_keepalive_expiry: float = 30.0
+    node_apply_batch_window: float = 0.02
+    node_apply_batch_max: int = 50
+    node_apply_batch_retry_after: float = 600.0
+    
+    node_health_interval: float = 15.0
+    node_health_jitter: float = 3.0
+    node_health_ewma_alpha: float = 0.3
+    
+    reapply_concurrency: int = 16
+    reapply_per_node_concurrency: int = 4
+    startup_restore_concurrency: int = 8
+    
+    gost_consolidated: bool = False
+    gost_api_port: int = 18090
+    
+    port_forward_engine: Literal["stream", "splice", "buffer", "protocol"] = "stream"
+    port_forward_workers: int = 0
+    port_forward_uvloop: bool = False
+    port_forward_idle_timeout: float = 0.0
+    
+    restart_backoff_base: float = 1.0
+    restart_backoff_max: float = 60.0
+    restart_stable_after: float = 60.0
+    
+    usage_rollup_interval: float = 60.0
+    usage_raw_retention_hours: float = 24.0
+    usage_minute_retention_days: float = 2.0
+    usage_hour_retention_days: float = 60.0
+    usage_day_retention_days: float = 730.0
+    
     secret_key: str = "changeme-secret-key-change-in-production"
     
     class Config:
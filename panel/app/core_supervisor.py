@@ -0,0 +1,213 @@
+"""Crash-restart supervision of panel-side core processes"""
+import asyncio
+import logging
+import os
+import subprocess
+import time
+from typing import Callable, Dict, Any, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WatchedProcess:
+    """A core process registered by one of the panel managers"""
+    
+    def __init__(self, key: str):
+        self.key = key
+        self.proc: Optional[subprocess.Popen] = None
+        self.restart: Optional[Callable[[], Any]] = None
+        self.started_at = time.time()
+        self.pidfd: Optional[int] = None
+        self.restart_task: Optional[asyncio.Task] = None
+        self.restarting = False
+        self.restart_count = 0
+        self.consecutive_failures = 0
+        self.last_exit_code: Optional[int] = None
+        self.last_restart_at: Optional[float] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "running": self.proc is not None and self.proc.poll() is None,
+            "restart_count": self.restart_count,
+            "last_exit_code": self.last_exit_code,
+            "last_restart_at": self.last_restart_at,
+            "restart_pending": self.restart_task is not None,
+        }
+
+
+class CoreSupervisor:
+    """Restarts crashed panel-side core processes with exponential backoff
+    
+    Managers register every process they start with watch() and drop it with
+    unwatch() when they stop it on purpose. Exits are picked up through a
+    pidfd reader on the event loop (with a periodic poll as fallback), and only
+    the process that exited is restarted, through its manager's start method.
+    The backoff resets once a process has stayed up for stable_after seconds.
+    watch() and unwatch() may be called from worker threads; they are handed
+    over to the event loop.
+    """
+    
+    def __init__(self, backoff_base: float = 1.0, backoff_max: float = 60.0, stable_after: float = 60.0, poll_interval: float = 5.0):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.poll_interval = poll_interval
+        self.entries: Dict[str, WatchedProcess] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start watching registered processes"""
+        await self.stop()
+        self.loop = asyncio.get_running_loop()
+        for entry in self.entries.values():
+            self._add_reader(entry)
+        self.task = asyncio.create_task(self._poll_loop())
+        logger.info(f"Core supervisor started: backoff={self.backoff_base}s..{self.backoff_max}s")
+    
+    async def stop(self):
+        """Stop watching; running processes are left alone"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for entry in self.entries.values():
+            self._remove_reader(entry)
+            if entry.restart_task:
+                entry.restart_task.cancel()
+                entry.restart_task = None
+        self.loop = None
+    
+    def _defer_to_loop(self, func: Callable[..., Any], *args) -> bool:
+        """Hand a call made from a worker thread over to the event loop thread"""
+        if self.loop is None:
+            return False
+        try:
+            if asyncio.get_running_loop() is self.loop:
+                return False
+        except RuntimeError:
+            pass
+        self.loop.call_soon_threadsafe(func, *args)
+        return True
+    
+    def watch(self, key: str, proc: subprocess.Popen, restart: Callable[[], Any]):
+        """Register a started process and the call that starts it again"""
+        if self._defer_to_loop(self.watch, key, proc, restart):
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = WatchedProcess(key)
+            self.entries[key] = entry
+        else:
+            self._remove_reader(entry)
+        entry.proc = proc
+        entry.restart = restart
+        entry.started_at = time.time()
+        self._add_reader(entry)
+    
+    def unwatch(self, key: str):
+        """Forget a process that is being stopped on purpose"""
+        if self._defer_to_loop(self.unwatch, key):
+            return
+        entry = self.entries.get(key)
+        if not entry or entry.restarting:
+            # A manager restarting the process stops the dead one first
+            return
+        del self.entries[key]
+        self._remove_reader(entry)
+        if entry.restart_task:
+            entry.restart_task.cancel()
+            entry.restart_task = None
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Restart counters of every watched process"""
+        return {key: entry.to_dict() for key, entry in self.entries.items()}
+    
+    def _add_reader(self, entry: WatchedProcess):
+        if self.loop is None or entry.proc is None or not hasattr(os, "pidfd_open"):
+            return
+        try:
+            entry.pidfd = os.pidfd_open(entry.proc.pid)
+            self.loop.add_reader(entry.pidfd, self._on_exit, entry.key, entry.proc)
+        except OSError:
+            # Already reaped or pidfd unsupported; the poll loop covers it
+            if entry.pidfd is not None:
+                os.close(entry.pidfd)
+            entry.pidfd = None
+    
+    def _remove_reader(self, entry: WatchedProcess):
+        if entry.pidfd is None:
+            return
+        if self.loop is not None:
+            try:
+                self.loop.remove_reader(entry.pidfd)
+            except Exception:
+                pass
+        try:
+            os.close(entry.pidfd)
+        except OSError:
+            pass
+        entry.pidfd = None
+    
+    def _on_exit(self, key: str, proc: subprocess.Popen):
+        entry = self.entries.get(key)
+        if not entry or entry.proc is not proc or entry.restart_task or self.loop is None:
+            return
+        returncode = proc.poll()
+        if returncode is None:
+            return
+        self._remove_reader(entry)
+        entry.last_exit_code = returncode
+        if time.time() - entry.started_at >= self.stable_after:
+            entry.consecutive_failures = 0
+        logger.warning(f"Core process {key} (PID {proc.pid}) exited with code {returncode}")
+        entry.restart_task = self.loop.create_task(self._restart(entry))
+    
+    async def _restart(self, entry: WatchedProcess):
+        try:
+            while True:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** entry.consecutive_failures))
+                entry.consecutive_failures += 1
+                logger.info(f"Restarting {entry.key} in {delay:.1f}s (attempt {entry.consecutive_failures})")
+                await asyncio.sleep(delay)
+                if self.entries.get(entry.key) is not entry:
+                    return
+                entry.restarting = True
+                try:
+                    # Manager start methods block (Popen, readiness waits), so keep them off the loop
+                    await asyncio.to_thread(entry.restart)
+                except Exception as e:
+                    logger.error(f"Failed to restart {entry.key}: {e}")
+                    continue
+                finally:
+                    entry.restarting = False
+                entry.restart_count += 1
+                entry.last_restart_at = time.time()
+                logger.info(f"Restarted {entry.key} (restart #{entry.restart_count})")
+                return
+        finally:
+            entry.restart_task = None
+    
+    async def _poll_loop(self):
+        """Fallback for processes without a pidfd reader"""
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                for key, entry in list(self.entries.items()):
+                    if entry.proc is not None and entry.restart_task is None and entry.proc.poll() is not None:
+                        self._on_exit(key, entry.proc)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Core supervisor poll loop error: {e}", exc_info=True)
+
+
+core_supervisor = CoreSupervisor(
+    backoff_base=settings.restart_backoff_base,
+    backoff_max=settings.restart_backoff_max,
+    stable_after=settings.restart_stable_after,
+)
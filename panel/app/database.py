@@ -3,7 +3,8 @@ import os
 import logging
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import event
 from app.config import settings
 
 Base = declarative_base()
@@ -13,40 +14,44 @@ if settings.db_type == "sqlite":
 else:
     raise ValueError(f"Unsupported DB type: {settings.db_type}")
 
-engine = create_async_engine(db_url, echo=False)
+# aiosqlite defaults to NullPool, which opens a connection (and a thread) per
+# session; keep a few open so the pragmas below run once per connection
+engine = create_async_engine(
+    db_url,
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_pool_max_overflow
+)
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 logger = logging.getLogger(__name__)
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection
+    
+    WAL lets the API read while background loops write, NORMAL sync is
+    durable in WAL mode except on power loss, and busy_timeout makes writers
+    wait for the lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.db_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.db_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.db_cache_size_mb) * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 async def migrate_db():
-    """Migrate database schema - add missing columns"""
+    """Apply pending schema migrations (see app.migrations)"""
     if settings.db_type != "sqlite":
         return
     
-    async with engine.begin() as conn:
-        result = await conn.execute(text(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='tunnels'"
-        ))
-        if not result.scalar():
-            return
-        
-        result = await conn.execute(text(
-            "PRAGMA table_info(tunnels)"
-        ))
-        columns = [row[1] for row in result.fetchall()]
-        
-        if "foreign_node_id" not in columns:
-            logger.info("Adding foreign_node_id column to tunnels table")
-            await conn.execute(text(
-                "ALTER TABLE tunnels ADD COLUMN foreign_node_id VARCHAR"
-            ))
-        
-        if "iran_node_id" not in columns:
-            logger.info("Adding iran_node_id column to tunnels table")
-            await conn.execute(text(
-                "ALTER TABLE tunnels ADD COLUMN iran_node_id VARCHAR"
-            ))
+    from app.migrations import migration_runner
+    await migration_runner.upgrade()
 
 
 async def init_db():
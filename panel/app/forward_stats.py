@@ -0,0 +1,124 @@
+"""Per-forward connection counters for PortForwarder
+
+The relay code bumps plain attributes of a ForwardStats on the hot path;
+nothing is locked, timed or allocated per chunk. Snapshots are plain dicts,
+so worker processes can send theirs over a pipe and the parent can merge
+them per port before rendering JSON or Prometheus text.
+"""
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List
+
+from app.metrics import histogram_samples, render_metric
+
+# Upper bounds (seconds) of the connect latency histogram buckets; the last slot is +Inf
+CONNECT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTERS = (
+    "connections_total",
+    "connections_active",
+    "bytes_in",
+    "bytes_out",
+    "connect_failures",
+    "connect_timeouts",
+    "relay_errors",
+    "connect_seconds_sum",
+)
+
+
+class ForwardStats:
+    """Counters of one forwarded port
+    
+    bytes_in is what clients sent towards the target, bytes_out what the
+    target sent back. relay_errors counts connections that ended on a socket
+    error instead of a clean close.
+    """
+    
+    __slots__ = ("local_port", "target", "started_at", "connect_buckets") + COUNTERS
+    
+    def __init__(self, local_port: int, target: str):
+        self.local_port = local_port
+        self.target = target
+        self.started_at = time.time()
+        self.connections_total = 0
+        self.connections_active = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connect_failures = 0
+        self.connect_timeouts = 0
+        self.relay_errors = 0
+        self.connect_seconds_sum = 0.0
+        self.connect_buckets = [0] * (len(CONNECT_BUCKETS) + 1)
+    
+    def opened(self):
+        self.connections_total += 1
+        self.connections_active += 1
+    
+    def closed(self):
+        self.connections_active -= 1
+    
+    def add_in(self, nbytes: int):
+        self.bytes_in += nbytes
+    
+    def add_out(self, nbytes: int):
+        self.bytes_out += nbytes
+    
+    def connected(self, seconds: float):
+        """Record how long a successful dial to the target took"""
+        self.connect_seconds_sum += seconds
+        self.connect_buckets[bisect_left(CONNECT_BUCKETS, seconds)] += 1
+    
+    def snapshot(self) -> dict:
+        snapshot = {name: getattr(self, name) for name in COUNTERS}
+        snapshot.update({
+            "local_port": self.local_port,
+            "target": self.target,
+            "started_at": self.started_at,
+            "connect_buckets": list(self.connect_buckets),
+        })
+        return snapshot
+
+
+def merge_snapshots(snapshots: Iterable[dict]) -> List[dict]:
+    """Sum snapshots of the same port, e.g. one from each forward worker"""
+    merged: Dict[int, dict] = {}
+    for snapshot in snapshots:
+        current = merged.get(snapshot["local_port"])
+        if current is None:
+            merged[snapshot["local_port"]] = dict(snapshot, connect_buckets=list(snapshot["connect_buckets"]))
+            continue
+        for name in COUNTERS:
+            current[name] += snapshot[name]
+        for index, count in enumerate(snapshot["connect_buckets"]):
+            current["connect_buckets"][index] += count
+        current["started_at"] = min(current["started_at"], snapshot["started_at"])
+    return sorted(merged.values(), key=lambda snapshot: snapshot["local_port"])
+
+
+def render_prometheus(snapshots: Iterable[dict]) -> str:
+    """Prometheus text exposition of forward snapshots"""
+    snapshots = list(snapshots)
+    
+    def labels(snapshot: dict, *extra) -> tuple:
+        return (("port", snapshot["local_port"]), ("target", snapshot["target"])) + extra
+    
+    histogram = []
+    for s in snapshots:
+        histogram.extend(histogram_samples(labels(s), CONNECT_BUCKETS, s["connect_buckets"], s["connect_seconds_sum"]))
+    
+    lines = (
+        render_metric("smite_forward_connections_total", "counter", "Client connections accepted",
+                      [("", labels(s), s["connections_total"]) for s in snapshots])
+        + render_metric("smite_forward_connections_active", "gauge", "Client connections currently relayed",
+                        [("", labels(s), s["connections_active"]) for s in snapshots])
+        + render_metric("smite_forward_bytes_total", "counter", "Bytes relayed; in is client to target, out is target to client",
+                        [("", labels(s, ("direction", "in")), s["bytes_in"]) for s in snapshots]
+                        + [("", labels(s, ("direction", "out")), s["bytes_out"]) for s in snapshots])
+        + render_metric("smite_forward_connect_failures_total", "counter", "Failed dials to the target",
+                        [("", labels(s, ("reason", "error")), s["connect_failures"]) for s in snapshots]
+                        + [("", labels(s, ("reason", "timeout")), s["connect_timeouts"]) for s in snapshots])
+        + render_metric("smite_forward_relay_errors_total", "counter", "Connections that ended on a socket error",
+                        [("", labels(s), s["relay_errors"]) for s in snapshots])
+        + render_metric("smite_forward_connect_seconds", "histogram", "Time to connect to the target", histogram)
+    )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,254 @@
+"""Multi-process worker mode for PortForwarder
+
+Each worker is a separate process with its own event loop and its own
+PortForwarder. Every worker listens on every forwarded port with
+SO_REUSEPORT, so the kernel spreads incoming connections across them and
+relaying never competes with the panel's API for the main event loop.
+
+The parent talks to each worker over a multiprocessing pipe: it sends
+(request_id, command, args) and the worker answers (request_id, error,
+result) once the command is applied. The parent keeps the full set of forwards,
+restarts a worker that dies (with backoff) and replays the forwards to it.
+A worker exits when its pipe closes, so workers never outlive the panel.
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.forward_stats import merge_snapshots
+from app.relay import install_uvloop
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 10.0
+
+
+def _worker_main(conn: Connection, engine: str):
+    if settings.port_forward_uvloop:
+        install_uvloop()
+    asyncio.run(_worker_loop(conn, engine))
+
+
+async def _worker_loop(conn: Connection, engine: str):
+    from app.port_forwarder import PortForwarder
+    
+    forwarder = PortForwarder(engine, reuse_port=True, idle_timeout=settings.port_forward_idle_timeout)
+    loop = asyncio.get_running_loop()
+    messages: asyncio.Queue = asyncio.Queue()
+    
+    def on_message():
+        try:
+            messages.put_nowait(conn.recv())
+        except (EOFError, OSError):
+            loop.remove_reader(conn.fileno())
+            messages.put_nowait(None)
+    
+    loop.add_reader(conn.fileno(), on_message)
+    try:
+        while True:
+            message = await messages.get()
+            if message is None:
+                break
+            request_id, command, args = message
+            error = None
+            result = None
+            try:
+                if command == "start":
+                    await forwarder.start_forward(*args, wait=True)
+                elif command == "stop":
+                    await forwarder.stop_forward(*args)
+                elif command == "stats":
+                    result = await forwarder.get_stats()
+                else:
+                    raise ValueError(f"Unknown command: {command}")
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            conn.send((request_id, error, result))
+    finally:
+        await forwarder.cleanup_all()
+
+
+class ForwardWorker:
+    """Parent-side handle of one worker process"""
+    
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn: Optional[Connection] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.started_at = 0.0
+        self.restart_count = 0
+        self.consecutive_failures = 0
+        self.restart_task: Optional[asyncio.Task] = None
+
+
+class ForwardWorkerPool:
+    """Runs forwards in N worker processes sharing each port via SO_REUSEPORT"""
+    
+    def __init__(self, workers: int, engine: str):
+        self.context = multiprocessing.get_context("spawn")
+        self.engine = engine
+        self.workers = [ForwardWorker(index) for index in range(max(1, workers))]
+        self.forwards: Dict[int, Tuple[str, int]] = {}
+        self.request_ids = itertools.count()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            self._spawn(worker)
+        logger.info(f"Started {len(self.workers)} forward workers ({self.engine} relay)")
+    
+    async def stop(self):
+        """Close the control channels and wait for the workers to exit"""
+        for worker in self.workers:
+            if worker.restart_task:
+                worker.restart_task.cancel()
+                worker.restart_task = None
+            self._detach(worker)
+        for worker in self.workers:
+            process = worker.process
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, 5)
+            if process.is_alive():
+                process.kill()
+                await asyncio.to_thread(process.join)
+            worker.process = None
+        self.forwards.clear()
+        logger.info("Forward workers stopped")
+    
+    async def start_forward(self, local_port: int, node_address: str, remote_port: int):
+        """Start a forward in every worker; raises if any worker fails to listen"""
+        self.forwards[local_port] = (node_address, remote_port)
+        errors = await self._broadcast("start", local_port, node_address, remote_port)
+        if errors:
+            self.forwards.pop(local_port, None)
+            await self._broadcast("stop", local_port)
+            raise RuntimeError(errors[0])
+    
+    async def stop_forward(self, local_port: int):
+        self.forwards.pop(local_port, None)
+        for error in await self._broadcast("stop", local_port):
+            logger.warning(f"Forward worker failed to stop port {local_port}: {error}")
+    
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [{
+            "worker": worker.index,
+            "pid": worker.process.pid if worker.process else None,
+            "alive": bool(worker.process and worker.process.is_alive()),
+            "restart_count": worker.restart_count,
+        } for worker in self.workers]
+    
+    async def get_forward_stats(self) -> List[dict]:
+        """Per-port counters summed over the live workers"""
+        live = [worker for worker in self.workers if worker.conn is not None]
+        replies = await asyncio.gather(*(self._query(worker, "stats") for worker in live), return_exceptions=True)
+        snapshots = []
+        for worker, reply in zip(live, replies):
+            if isinstance(reply, Exception):
+                logger.warning(f"Forward worker {worker.index} did not report stats: {reply}")
+                continue
+            snapshots.extend(reply)
+        return merge_snapshots(snapshots)
+    
+    async def _broadcast(self, command: str, *args) -> List[str]:
+        live = [worker for worker in self.workers if worker.conn is not None]
+        results = await asyncio.gather(*(self._request(worker, command, *args) for worker in live), return_exceptions=True)
+        return [str(result) for result in results if result is not None]
+    
+    async def _query(self, worker: ForwardWorker, command: str, *args) -> Any:
+        """Send a command and return its result, raising if the worker reports an error"""
+        error, result = await self._call(worker, command, *args)
+        if error:
+            raise RuntimeError(error)
+        return result
+    
+    async def _request(self, worker: ForwardWorker, command: str, *args) -> Optional[str]:
+        """Send a command and return the worker's error message, if any"""
+        error, _ = await self._call(worker, command, *args)
+        return error
+    
+    async def _call(self, worker: ForwardWorker, command: str, *args) -> Tuple[Optional[str], Any]:
+        request_id = next(self.request_ids)
+        future = self.loop.create_future()
+        worker.pending[request_id] = future
+        try:
+            worker.conn.send((request_id, command, args))
+            return await asyncio.wait_for(future, timeout=REQUEST_TIMEOUT)
+        finally:
+            worker.pending.pop(request_id, None)
+    
+    def _spawn(self, worker: ForwardWorker):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.engine),
+            name=f"smite-forward-{worker.index}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.started_at = time.time()
+        self.loop.add_reader(parent_conn.fileno(), self._on_reply, worker)
+        self.loop.add_reader(process.sentinel, self._on_exit, worker)
+    
+    def _detach(self, worker: ForwardWorker):
+        """Stop listening to a worker and fail its outstanding requests"""
+        if worker.conn is not None:
+            self.loop.remove_reader(worker.conn.fileno())
+            worker.conn.close()
+            worker.conn = None
+        if worker.process is not None:
+            self.loop.remove_reader(worker.process.sentinel)
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError(f"forward worker {worker.index} exited"))
+        worker.pending.clear()
+    
+    def _on_reply(self, worker: ForwardWorker):
+        try:
+            request_id, error, result = worker.conn.recv()
+        except (EOFError, OSError):
+            self.loop.remove_reader(worker.conn.fileno())
+            return
+        future = worker.pending.get(request_id)
+        if future and not future.done():
+            future.set_result((error, result))
+    
+    def _on_exit(self, worker: ForwardWorker):
+        process = worker.process
+        self._detach(worker)
+        # The sentinel is ready, so the process has exited and join returns at once
+        process.join(1)
+        logger.warning(f"Forward worker {worker.index} (PID {process.pid}) exited with code {process.exitcode}")
+        if time.time() - worker.started_at >= settings.restart_stable_after:
+            worker.consecutive_failures = 0
+        worker.restart_task = self.loop.create_task(self._restart(worker))
+    
+    async def _restart(self, worker: ForwardWorker):
+        try:
+            delay = min(settings.restart_backoff_max, settings.restart_backoff_base * (2 ** worker.consecutive_failures))
+            worker.consecutive_failures += 1
+            await asyncio.sleep(delay)
+            self._spawn(worker)
+            worker.restart_count += 1
+            for local_port, (node_address, remote_port) in list(self.forwards.items()):
+                error = await self._request(worker, "start", local_port, node_address, remote_port)
+                if error:
+                    logger.error(f"Forward worker {worker.index} failed to restore port {local_port}: {error}")
+            logger.info(f"Restarted forward worker {worker.index} with {len(self.forwards)} forwards")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to restart forward worker {worker.index}: {e}")
+        finally:
+            if worker.restart_task is asyncio.current_task():
+                worker.restart_task = None
@@ -1,11 +1,13 @@
 """FRP server management for panel"""
 import os
 import subprocess
-import time
 import logging
 from pathlib import Path
 from typing import Dict, Optional
 
+from app.readiness import wait_until_ready, READY_TIMEOUTS
+from app.core_supervisor import core_supervisor
+
 logger = logging.getLogger(__name__)
 
 
@@ -92,6 +94,7 @@ class FrpServerManager:
                 log_f.write(f"Config: bind_port={bind_port}, token={'set' if token else 'none'}\n")
                 log_f.write(f"Command: {' '.join(cmd)}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     cmd,
                     stdout=log_f,
@@ -102,6 +105,7 @@ class FrpServerManager:
             except FileNotFoundError:
                 log_f.write(f"Starting FRP server (system binary) for tunnel {tunnel_id}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     ["frps"] + cmd[1:],
                     stdout=log_f,
@@ -113,61 +117,35 @@ class FrpServerManager:
             self.active_servers[f"{tunnel_id}_log"] = log_f
             self.active_servers[tunnel_id] = proc
             
-            time.sleep(1.0)
-            if proc.poll() is not None:
-                try:
-                    if log_file.exists():
-                        with open(log_file, 'r') as f:
-                            error_output = f.read()
-                    else:
-                        error_output = "Log file not found"
-                    error_msg = f"FRP server failed to start (exit code: {proc.poll()}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                    logger.error(error_msg)
-                except Exception as e:
-                    error_msg = f"FRP server failed to start (exit code: {proc.poll()}), could not read log: {e}"
-                    logger.error(error_msg)
-                finally:
-                    del self.active_servers[tunnel_id]
-                    if f"{tunnel_id}_log" in self.active_servers:
-                        try:
-                            self.active_servers[f"{tunnel_id}_log"].close()
-                        except:
-                            pass
-                        del self.active_servers[f"{tunnel_id}_log"]
-                    if tunnel_id in self.server_configs:
-                        del self.server_configs[tunnel_id]
-                raise RuntimeError(error_msg)
-            
-            # Verify server is actually listening
             try:
-                import socket
-                max_retries = 3
-                port_listening = False
-                for attempt in range(max_retries):
-                    time.sleep(0.5)
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(1)
-                    result = sock.connect_ex(('127.0.0.1', bind_port))
-                    sock.close()
-                    if result == 0:
-                        port_listening = True
-                        break
-                
-                if not port_listening:
-                    if proc.poll() is not None:
-                        error_msg = f"FRP server process exited (code: {proc.poll()}) before port verification"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
-                    else:
-                        logger.warning(f"FRP server port {bind_port} not listening after {max_retries} attempts, but process is running. PID: {proc.pid}")
-                else:
-                    logger.info(f"FRP server port {bind_port} verified as listening")
-            except Exception as e:
-                if proc.poll() is not None:
-                    error_msg = f"FRP server process died during verification (code: {proc.poll()}): {e}"
-                    logger.error(error_msg)
-                    raise RuntimeError(error_msg)
-                logger.warning(f"Could not verify FRP server port is listening: {e}")
+                listening = wait_until_ready(
+                    proc,
+                    "FRP server",
+                    log_file,
+                    ports=[bind_port],
+                    timeout=READY_TIMEOUTS["frp"],
+                    log_offset=log_offset
+                )
+            except RuntimeError as e:
+                logger.error(str(e))
+                del self.active_servers[tunnel_id]
+                if f"{tunnel_id}_log" in self.active_servers:
+                    try:
+                        self.active_servers[f"{tunnel_id}_log"].close()
+                    except:
+                        pass
+                    del self.active_servers[f"{tunnel_id}_log"]
+                if tunnel_id in self.server_configs:
+                    del self.server_configs[tunnel_id]
+                raise
+            if listening:
+                logger.info(f"FRP server port {bind_port} verified as listening")
+            
+            core_supervisor.watch(
+                f"frp:{tunnel_id}",
+                proc,
+                lambda: self.start_server(tunnel_id, bind_port, token)
+            )
             
             logger.info(f"Started FRP server for tunnel {tunnel_id} on port {bind_port} (PID: {proc.pid})")
             return True
@@ -178,6 +156,7 @@ class FrpServerManager:
     
     def stop_server(self, tunnel_id: str):
         """Stop FRP server for a tunnel"""
+        core_supervisor.unwatch(f"frp:{tunnel_id}")
         if tunnel_id in self.active_servers:
             proc = self.active_servers[tunnel_id]
             try:
@@ -6,6 +6,10 @@ from pathlib import Path
 from typing import Dict, Optional
 
 from app.utils import parse_address_port, format_address_port
+from app.readiness import wait_until_ready, READY_TIMEOUTS
+from app.core_supervisor import core_supervisor
+from app.config import settings
+from app.gost_service_host import GostServiceHost, gost_service
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +22,15 @@ class GostForwarder:
         self.config_dir.mkdir(parents=True, exist_ok=True)
         self.active_forwards: Dict[str, subprocess.Popen] = {}
         self.forward_configs: Dict[str, dict] = {}
+        # Optional: run all forwards as services of a single gost v3 process
+        self.service_host: Optional[GostServiceHost] = None
+        if settings.gost_consolidated:
+            self.service_host = GostServiceHost(self.config_dir, settings.gost_api_port)
     
     def start_forward(self, tunnel_id: str, local_port: int, forward_to: str, tunnel_type: str = "tcp", path: str = None, use_ipv6: bool = False) -> bool:
         """
         Start forwarding using gost - forwards directly to target (no node)
-
+        
         Args:
             tunnel_id: Unique tunnel identifier
             local_port: Port on panel to listen on
@@ -30,7 +38,7 @@ class GostForwarder:
             tunnel_type: Type of forwarding (tcp, udp, ws, grpc)
             path: Optional path for WS tunnels (ignored, kept for compatibility)
             use_ipv6: Whether to use IPv6 for listening (default: False for IPv4)
-
+        
         Returns:
             True if started successfully
         """
@@ -75,6 +83,7 @@ class GostForwarder:
                     s.close()
                 except Exception:
                     bind_ip = "[::]" if use_ipv6 else "0.0.0.0"
+                listen_addr = f"{bind_ip}:{local_port}"
                 cmd = [
                     "/usr/local/bin/gost",
                     f"-L=ws://{bind_ip}:{local_port}/tcp://{target_addr}"
@@ -92,6 +101,21 @@ class GostForwarder:
             else:
                 raise ValueError(f"Unsupported tunnel type: {tunnel_type}")
             
+            if self.service_host:
+                self.service_host.add(
+                    tunnel_id,
+                    gost_service(tunnel_id, tunnel_type, listen_addr, target_addr),
+                    local_port,
+                    proto="udp" if tunnel_type == "udp" else "tcp"
+                )
+                self.forward_configs[tunnel_id] = {
+                    "local_port": local_port,
+                    "forward_to": forward_to,
+                    "tunnel_type": tunnel_type
+                }
+                logger.info(f"Added gost service for tunnel {tunnel_id}: {tunnel_type}://:{local_port} -> {forward_to}")
+                return True
+            
             gost_binary = "/usr/local/bin/gost"
             import os
             if not os.path.exists(gost_binary):
@@ -118,6 +142,7 @@ class GostForwarder:
                 log_f.write(f"Tunnel ID: {tunnel_id}\n")
                 log_f.write(f"Local port: {local_port}, Forward to: {forward_to}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     cmd,
                     stdout=log_f,
@@ -135,120 +160,15 @@ class GostForwarder:
                 logger.error(error_msg, exc_info=True)
                 raise RuntimeError(error_msg)
             
-            time.sleep(1.5)
-            poll_result = proc.poll()
-            if poll_result is not None:
-                try:
-                    if log_file.exists():
-                        with open(log_file, 'r') as f:
-                            stderr = f.read()
-                    else:
-                        stderr = "Log file not found"
-                    stdout = ""
-                except Exception as e:
-                    stderr = f"Could not read log file: {e}"
-                    stdout = ""
-                error_msg = f"gost failed to start (exit code: {poll_result}): {stderr[-500:] if len(stderr) > 500 else stderr or 'Unknown error'}"
-                logger.error(error_msg)
-                raise RuntimeError(error_msg)
-            
-            if tunnel_type != "udp":
-                time.sleep(0.5)
-                poll_result = proc.poll()
-                if poll_result is not None:
-                    try:
-                        if log_file.exists():
-                            with open(log_file, 'r') as f:
-                                error_output = f.read()
-                            error_msg = f"gost process died after startup (exit code: {poll_result}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                        else:
-                            error_msg = f"gost process died after startup (exit code: {poll_result}), log file not found"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
-                    except Exception as e:
-                        error_msg = f"gost process died after startup (exit code: {poll_result}), could not read error: {e}"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
-                
-                if tunnel_type != "ws":
-                    import socket
-                    port_listening = False
-                    try:
-                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        sock.settimeout(1)
-                        result = sock.connect_ex(('127.0.0.1', local_port))
-                        sock.close()
-                        port_listening = (result == 0)
-                        if not port_listening:
-                            try:
-                                sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                                sock.settimeout(1)
-                                result = sock.connect_ex(('::1', local_port))
-                                sock.close()
-                                port_listening = (result == 0)
-                            except:
-                                pass
-                        if not port_listening:
-                            time.sleep(0.5)
-                            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                            sock.settimeout(1)
-                            result = sock.connect_ex(('127.0.0.1', local_port))
-                            sock.close()
-                            if result == 0:
-                                port_listening = True
-                            else:
-                                try:
-                                    sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                                    sock.settimeout(1)
-                                    result = sock.connect_ex(('::1', local_port))
-                                    sock.close()
-                                    port_listening = (result == 0)
-                                except:
-                                    pass
-                        
-                        poll_result = proc.poll()
-                        if poll_result is not None:
-                            try:
-                                if log_file.exists():
-                                    with open(log_file, 'r') as f:
-                                        error_output = f.read()
-                                    error_msg = f"gost process died after startup (exit code: {poll_result}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                                else:
-                                    error_msg = f"gost process died after startup (exit code: {poll_result}), log file not found"
-                                logger.error(error_msg)
-                                raise RuntimeError(error_msg)
-                            except Exception as e:
-                                error_msg = f"gost process died after startup (exit code: {poll_result}), could not read error: {e}"
-                                logger.error(error_msg)
-                                raise RuntimeError(error_msg)
-                        elif not port_listening:
-                            logger.warning(f"Port {local_port} not listening after gost start (checked IPv4 and IPv6), but process is running. PID: {proc.pid}")
-                    except Exception as e:
-                        logger.warning(f"Could not verify port {local_port} is listening: {e}")
-                        poll_result = proc.poll()
-                        if poll_result is not None:
-                            error_msg = f"gost process died during port check (exit code: {poll_result})"
-                            logger.error(error_msg)
-                            raise RuntimeError(error_msg)
-                else:
-                    logger.info(f"WS tunnel on port {local_port}: skipping port verification (WebSocket requires handshake)")
-            else:
-                time.sleep(0.5)
-                poll_result = proc.poll()
-                if poll_result is not None:
-                    try:
-                        if log_file.exists():
-                            with open(log_file, 'r') as f:
-                                error_output = f.read()
-                            error_msg = f"gost UDP process died after startup (exit code: {poll_result}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                        else:
-                            error_msg = f"gost UDP process died after startup (exit code: {poll_result}), log file not found"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
-                    except Exception as e:
-                        error_msg = f"gost UDP process died after startup (exit code: {poll_result}), could not read error: {e}"
-                        logger.error(error_msg)
-                        raise RuntimeError(error_msg)
+            wait_until_ready(
+                proc,
+                "gost",
+                log_file,
+                ports=[local_port],
+                proto="udp" if tunnel_type == "udp" else "tcp",
+                timeout=READY_TIMEOUTS["gost"],
+                log_offset=log_offset
+            )
             
             self.active_forwards[tunnel_id] = proc
             self.forward_configs[tunnel_id] = {
@@ -257,15 +177,26 @@ class GostForwarder:
                 "tunnel_type": tunnel_type
             }
             
+            core_supervisor.watch(
+                f"gost:{tunnel_id}",
+                proc,
+                lambda: self.start_forward(tunnel_id, local_port, forward_to, tunnel_type, path, use_ipv6)
+            )
+            
             logger.info(f"Started gost forwarding for tunnel {tunnel_id}: {tunnel_type}://:{local_port} -> {forward_to}, PID={proc.pid}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Failed to start gost forwarding for tunnel {tunnel_id}: {e}")
             raise
     
     def stop_forward(self, tunnel_id: str):
         """Stop forwarding for a tunnel"""
+        if self.service_host:
+            self.service_host.remove(tunnel_id)
+            self.forward_configs.pop(tunnel_id, None)
+            return
+        core_supervisor.unwatch(f"gost:{tunnel_id}")
         if tunnel_id in self.active_forwards:
             proc = self.active_forwards[tunnel_id]
             try:
@@ -301,6 +232,8 @@ class GostForwarder:
     
     def is_forwarding(self, tunnel_id: str) -> bool:
         """Check if forwarding is active for a tunnel"""
+        if self.service_host:
+            return self.service_host.has(tunnel_id)
         if tunnel_id not in self.active_forwards:
             return False
         proc = self.active_forwards[tunnel_id]
@@ -323,6 +256,8 @@ class GostForwarder:
     
     def get_forwarding_tunnels(self) -> list:
         """Get list of tunnel IDs with active forwarding"""
+        if self.service_host:
+            return self.service_host.names()
         active = []
         for tunnel_id, proc in list(self.active_forwards.items()):
             if proc.poll() is None:
@@ -335,6 +270,10 @@ class GostForwarder:
     
     def cleanup_all(self):
         """Stop all forwarding"""
+        if self.service_host:
+            self.service_host.stop()
+            self.forward_configs.clear()
+            return
         tunnel_ids = list(self.active_forwards.keys())
         for tunnel_id in tunnel_ids:
             self.stop_forward(tunnel_id)
@@ -0,0 +1,194 @@
+"""Single gost process serving many panel-side forwards"""
+import json
+import logging
+import os
+import secrets
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.readiness import wait_until_ready, ports_listening, READY_TIMEOUTS, POLL_INTERVAL
+from app.core_supervisor import core_supervisor
+
+logger = logging.getLogger(__name__)
+
+SUPERVISOR_KEY = "gost:consolidated"
+
+
+def gost_service(name: str, tunnel_type: str, listen_addr: str, target_addr: str) -> dict:
+    """gost v3 service that forwards one listener to one target"""
+    return {
+        "name": name,
+        "addr": listen_addr,
+        "handler": {"type": "udp" if tunnel_type == "udp" else "tcp"},
+        "listener": {"type": tunnel_type},
+        "forwarder": {"nodes": [{"name": f"{name}-target", "addr": target_addr}]},
+    }
+
+
+class GostServiceHost:
+    """Runs every panel-side forward as a service of one gost process
+    
+    Needs gost v3. The process starts from a generated config file with the
+    web API enabled on loopback; forwards are then created, replaced and
+    deleted through that API, so changing one forward neither spawns a
+    process nor interrupts the others. The config file is rewritten on every
+    change, so when core_supervisor restarts the process it comes back with
+    the current set of services.
+    """
+    
+    def __init__(self, config_dir: Path, api_port: int):
+        self.config_file = config_dir / "gost_consolidated.json"
+        self.log_file = config_dir / "gost_consolidated.log"
+        self.api_port = api_port
+        self.api_url = f"http://127.0.0.1:{api_port}"
+        self.credentials = ("smite", secrets.token_urlsafe(24))
+        self.client = httpx.Client(base_url=self.api_url, auth=self.credentials, timeout=5)
+        self.services: Dict[str, dict] = {}
+        self.proc: Optional[subprocess.Popen] = None
+        self.log_f = None
+        self.lock = threading.RLock()
+    
+    def add(self, name: str, service: dict, port: int, proto: str = "tcp"):
+        """Create or replace a service and wait until its port is listening"""
+        with self.lock:
+            previous = self.services.get(name)
+            self.services[name] = service
+            self._write_config()
+            try:
+                if not self._alive():
+                    self._start_process()
+                elif previous:
+                    self._api("PUT", f"/config/services/{name}", service)
+                else:
+                    self._api("POST", "/config/services", service)
+            except Exception:
+                if previous:
+                    self.services[name] = previous
+                else:
+                    self.services.pop(name, None)
+                self._write_config()
+                raise
+        
+        deadline = time.monotonic() + READY_TIMEOUTS["gost"]
+        while not ports_listening([port], proto, self.proc.pid):
+            if time.monotonic() >= deadline:
+                logger.warning(f"gost service {name} port {port} not listening after {READY_TIMEOUTS['gost']}s")
+                return
+            time.sleep(POLL_INTERVAL)
+    
+    def remove(self, name: str):
+        """Delete a service, leaving the others running"""
+        with self.lock:
+            if self.services.pop(name, None) is None:
+                return
+            self._write_config()
+            if self._alive():
+                try:
+                    self._api("DELETE", f"/config/services/{name}")
+                except Exception as e:
+                    logger.warning(f"Failed to delete gost service {name}: {e}")
+    
+    def has(self, name: str) -> bool:
+        return name in self.services and self._alive()
+    
+    def names(self) -> List[str]:
+        return list(self.services) if self._alive() else []
+    
+    def stop(self):
+        """Stop the gost process and drop all services"""
+        with self.lock:
+            core_supervisor.unwatch(SUPERVISOR_KEY)
+            self._stop_process()
+            self.services.clear()
+            self._write_config()
+    
+    def _alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+    
+    def _api(self, method: str, path: str, body: Optional[dict] = None):
+        response = self.client.request(method, path, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"gost API {method} {path} failed ({response.status_code}): {response.text.strip()}")
+    
+    def _write_config(self):
+        username, password = self.credentials
+        config = {
+            "api": {
+                "addr": f"127.0.0.1:{self.api_port}",
+                "auth": {"username": username, "password": password},
+            },
+            "services": list(self.services.values()),
+        }
+        self.config_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.config_file.with_suffix(".tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_file, self.config_file)
+    
+    def _binary(self) -> str:
+        gost_binary = "/usr/local/bin/gost"
+        if not os.path.exists(gost_binary):
+            gost_binary = shutil.which("gost")
+            if not gost_binary:
+                raise RuntimeError("gost binary not found at /usr/local/bin/gost or in PATH")
+        return gost_binary
+    
+    def _start_process(self):
+        self._stop_process()
+        self._write_config()
+        cmd = [self._binary(), "-C", str(self.config_file)]
+        logger.info(f"Starting consolidated gost with {len(self.services)} services: {' '.join(cmd)}")
+        
+        self.log_f = open(self.log_file, "a", buffering=1)
+        self.log_f.write(f"Starting gost with command: {' '.join(cmd)}\n")
+        self.log_f.flush()
+        log_offset = self.log_f.tell()
+        self.proc = subprocess.Popen(
+            cmd,
+            stdout=self.log_f,
+            stderr=subprocess.STDOUT,
+            cwd=str(self.config_file.parent),
+            start_new_session=True,
+            close_fds=False
+        )
+        wait_until_ready(
+            self.proc,
+            "gost",
+            self.log_file,
+            ports=[self.api_port],
+            timeout=READY_TIMEOUTS["gost"],
+            log_offset=log_offset
+        )
+        core_supervisor.watch(SUPERVISOR_KEY, self.proc, self._restart)
+        logger.info(f"Consolidated gost started, PID={self.proc.pid}")
+    
+    def _restart(self):
+        with self.lock:
+            # add() may already have brought the process back
+            if not self._alive():
+                self._start_process()
+    
+    def _stop_process(self):
+        if self.proc is not None:
+            try:
+                self.proc.terminate()
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            except Exception as e:
+                logger.warning(f"Error stopping consolidated gost: {e}")
+            self.proc = None
+        if self.log_f is not None:
+            try:
+                self.log_f.close()
+            except Exception:
+                pass
+            self.log_f = None
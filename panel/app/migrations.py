@@ -0,0 +1,237 @@
+"""Versioned schema migrations
+
+create_all still creates missing tables. Everything that changes a table that
+already exists (columns, indexes, rebuilds, data fixes) is a numbered
+Migration here. Applied versions are recorded in the schema_migrations table.
+
+A migration has two optional parts:
+- upgrade: runs in a single transaction during startup. Keep it to DDL.
+- backfill: runs after startup in the background, one small transaction per
+  batch, so large tables never hold the write lock for long. It is called
+  repeatedly and must return how many rows it changed; 0 means done. A
+  backfill must only select rows that still need it, so it can resume after
+  a restart.
+
+Migrations must also be safe on databases that were migrated by the old
+ad-hoc checks, or created fresh by create_all. The helpers below check before
+they change anything.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.config import settings
+from app.database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+REVERSE_CORES = ("rathole", "backhaul", "chisel", "frp")
+
+
+async def has_column(conn: AsyncConnection, table: str, column: str) -> bool:
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    return column in [row[1] for row in result.fetchall()]
+
+
+async def add_column(conn: AsyncConnection, table: str, column: str, ddl: str):
+    """Add a column unless it already exists"""
+    if not await has_column(conn, table, column):
+        logger.info(f"Adding {column} column to {table} table")
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+async def create_indexes(conn: AsyncConnection, *names: str):
+    """Create indexes declared on the models, by name, unless they already exist"""
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    
+    def create(sync_conn):
+        for name in names:
+            indexes[name].create(sync_conn, checkfirst=True)
+    
+    await conn.run_sync(create)
+
+
+class Migration:
+    def __init__(
+        self,
+        version: int,
+        name: str,
+        upgrade: Optional[Callable[[AsyncConnection], Awaitable[None]]] = None,
+        backfill: Optional[Callable[[AsyncConnection, int], Awaitable[int]]] = None
+    ):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.backfill = backfill
+
+
+async def _reverse_tunnel_node_columns(conn: AsyncConnection):
+    await add_column(conn, "tunnels", "foreign_node_id", "VARCHAR")
+    await add_column(conn, "tunnels", "iran_node_id", "VARCHAR")
+
+
+async def _lookup_indexes(conn: AsyncConnection):
+    await create_indexes(
+        conn,
+        "ix_tunnels_status_core",
+        "ix_tunnels_node_id",
+        "ix_tunnels_foreign_node_id",
+        "ix_tunnels_iran_node_id",
+        "ix_usage_tunnel_timestamp",
+        "ix_usage_timestamp",
+        "ix_usage_rollups_tunnel_step_bucket",
+        "ix_usage_rollups_step_bucket",
+    )
+
+
+async def _backfill_tunnel_defaults(conn: AsyncConnection, batch_size: int) -> int:
+    """Fill accounting defaults and iran_node_id on rows written before they existed"""
+    cores = ", ".join(f"'{core}'" for core in REVERSE_CORES)
+    result = await conn.execute(text(f"""
+        UPDATE tunnels SET
+            used_mb = COALESCE(used_mb, 0),
+            quota_mb = COALESCE(quota_mb, 0),
+            revision = COALESCE(revision, 1),
+            iran_node_id = CASE
+                WHEN iran_node_id IS NULL AND core IN ({cores}) AND node_id != '' THEN node_id
+                ELSE iran_node_id
+            END
+        WHERE rowid IN (
+            SELECT rowid FROM tunnels
+            WHERE used_mb IS NULL OR quota_mb IS NULL OR revision IS NULL
+                OR (iran_node_id IS NULL AND core IN ({cores}) AND node_id != '')
+            LIMIT :limit
+        )
+    """), {"limit": batch_size})
+    return result.rowcount
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "reverse_tunnel_node_columns", upgrade=_reverse_tunnel_node_columns),
+    Migration(2, "lookup_indexes", upgrade=_lookup_indexes),
+    Migration(3, "tunnel_defaults", backfill=_backfill_tunnel_defaults),
+]
+
+
+class MigrationRunner:
+    """Applies pending migrations in version order and runs their backfills"""
+    
+    def __init__(self, migrations: List[Migration], batch_size: int, batch_pause: float):
+        versions = [m.version for m in migrations]
+        if versions != sorted(set(versions)):
+            raise ValueError("Migration versions must be unique and ascending")
+        self.migrations = migrations
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.task: Optional[asyncio.Task] = None
+        self.progress: Dict[int, Dict[str, Any]] = {}
+    
+    async def _ensure_table(self, conn: AsyncConnection):
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                applied_at DATETIME NOT NULL,
+                backfilled_at DATETIME
+            )
+        """))
+    
+    async def _applied(self, conn: AsyncConnection) -> Dict[int, Optional[str]]:
+        result = await conn.execute(text("SELECT version, backfilled_at FROM schema_migrations"))
+        return {row[0]: row[1] for row in result.fetchall()}
+    
+    async def current_version(self) -> int:
+        async with engine.begin() as conn:
+            await self._ensure_table(conn)
+            applied = await self._applied(conn)
+        return max(applied, default=0)
+    
+    async def upgrade(self):
+        """Apply the upgrade step of every pending migration, each in its own transaction"""
+        async with engine.begin() as conn:
+            await self._ensure_table(conn)
+            applied = await self._applied(conn)
+        
+        for migration in self.migrations:
+            if migration.version in applied:
+                continue
+            logger.info(f"Applying migration {migration.version}: {migration.name}")
+            async with engine.begin() as conn:
+                if migration.upgrade:
+                    await migration.upgrade(conn)
+                await conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at, backfilled_at) VALUES (:version, :name, :now, :backfilled)"),
+                    {
+                        "version": migration.version,
+                        "name": migration.name,
+                        "now": datetime.utcnow(),
+                        "backfilled": None if migration.backfill else datetime.utcnow(),
+                    }
+                )
+    
+    async def pending_backfills(self) -> List[Migration]:
+        async with engine.begin() as conn:
+            await self._ensure_table(conn)
+            applied = await self._applied(conn)
+        return [
+            m for m in self.migrations
+            if m.backfill and m.version in applied and applied[m.version] is None
+        ]
+    
+    def start_backfills(self):
+        """Run pending backfills in the background"""
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.create_task(self._run_backfills())
+    
+    async def stop(self):
+        """Stop backfilling; unfinished backfills resume on the next start"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def _run_backfills(self):
+        try:
+            for migration in await self.pending_backfills():
+                await self._backfill(migration)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Migration backfill failed: {e}", exc_info=True)
+    
+    async def _backfill(self, migration: Migration):
+        progress = {"name": migration.name, "rows": 0, "batches": 0, "done": False}
+        self.progress[migration.version] = progress
+        logger.info(f"Backfilling migration {migration.version}: {migration.name}")
+        while True:
+            async with engine.begin() as conn:
+                changed = await migration.backfill(conn, self.batch_size)
+                if not changed:
+                    await conn.execute(
+                        text("UPDATE schema_migrations SET backfilled_at = :now WHERE version = :version"),
+                        {"now": datetime.utcnow(), "version": migration.version}
+                    )
+            if not changed:
+                break
+            progress["rows"] += changed
+            progress["batches"] += 1
+            # Let API requests and background loops take the write lock between batches
+            await asyncio.sleep(self.batch_pause)
+        progress["done"] = True
+        logger.info(f"Backfill {migration.version} ({migration.name}) finished: {progress['rows']} rows in {progress['batches']} batches")
+    
+    async def get_status(self) -> Dict[str, Any]:
+        return {
+            "current_version": await self.current_version(),
+            "latest_version": self.migrations[-1].version if self.migrations else 0,
+            "backfilling": bool(self.task and not self.task.done()),
+            "backfills": {str(version): dict(progress) for version, progress in self.progress.items()},
+        }
+
+migration_runner = MigrationRunner(MIGRATIONS, settings.migration_batch_size, settings.migration_batch_pause)
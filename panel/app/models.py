@@ -1,5 +1,5 @@
 """Database models"""
-from sqlalchemy import Column, String, Integer, DateTime, Float, JSON, Boolean, Text
+from sqlalchemy import Column, String, Integer, DateTime, Float, JSON, Boolean, Text, Index
 from sqlalchemy.dialects.sqlite import DATETIME as SQLiteDATETIME
 from datetime import datetime
 from app.database import Base
@@ -24,6 +24,12 @@ class Node(Base):
 
 class Tunnel(Base):
     __tablename__ = "tunnels"
+    __table_args__ = (
+        Index("ix_tunnels_status_core", "status", "core"),
+        Index("ix_tunnels_node_id", "node_id"),
+        Index("ix_tunnels_foreign_node_id", "foreign_node_id"),
+        Index("ix_tunnels_iran_node_id", "iran_node_id"),
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     name = Column(String, nullable=False)
@@ -54,6 +60,10 @@ class Admin(Base):
 
 class Usage(Base):
     __tablename__ = "usage"
+    __table_args__ = (
+        Index("ix_usage_tunnel_timestamp", "tunnel_id", "timestamp"),
+        Index("ix_usage_timestamp", "timestamp"),
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     tunnel_id = Column(String, nullable=False)
@@ -62,6 +72,21 @@ class Usage(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        Index("ix_usage_rollups_tunnel_step_bucket", "tunnel_id", "step", "bucket"),
+        Index("ix_usage_rollups_step_bucket", "step", "bucket"),
+    )
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    tunnel_id = Column(String, nullable=False)
+    node_id = Column(String, nullable=False)
+    step = Column(Integer, nullable=False)  # Bucket width in seconds: 60, 3600 or 86400
+    bucket = Column(DateTime, nullable=False)  # Bucket start (UTC)
+    bytes_used = Column(Integer, default=0)
+
+
 class CoreResetConfig(Base):
     __tablename__ = "core_reset_config"
     
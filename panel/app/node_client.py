@@ -3,32 +3,381 @@ import httpx
 import ssl
 import logging
 import asyncio
-from typing import Dict, Any, Optional, Tuple
+import time
+from typing import Dict, Any, Optional, Tuple, List
 from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.config import settings
 from app.database import AsyncSessionLocal
 from app.models import Node, Settings
+from app.metrics import node_request_seconds, node_request_errors
 
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # type: ignore  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PooledClient:
+    """A node's shared client and the route it was built for"""
+    
+    def __init__(self, node_address: str, using_frp: bool, client: httpx.AsyncClient):
+        self.node_address = node_address
+        self.using_frp = using_frp
+        self.client = client
+        self.in_flight = 0
+        self.retired = False
+
+
+class NodeConnectionPool:
+    """Process-wide pool of keep-alive HTTP clients, one per node
+    
+    Clients are created lazily and reused across requests so status polls and
+    applies do not pay a TCP/TLS handshake every time. FRP tunnels keep the
+    previous behaviour of not reusing connections. When a node's address or
+    FRP mode changes its client is replaced, and the old one is closed once
+    its in-flight requests finish.
+    """
+    
+    def __init__(self, max_connections: int = 10, keepalive_expiry: float = 30.0):
+        self.max_connections = max(1, max_connections)
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: Dict[str, PooledClient] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.requests_total = 0
+        self.errors_total = 0
+        self.connections_opened = 0
+    
+    async def _get_client(self, node_id: str, node_address: str, using_frp: bool) -> PooledClient:
+        """Get or create the shared client for a node, replacing it if the node's route changed"""
+        previous = self._clients.get(node_id)
+        if previous is not None and not previous.client.is_closed:
+            if previous.node_address == node_address and previous.using_frp == using_frp:
+                return previous
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=0 if using_frp else self.max_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        client = httpx.AsyncClient(
+            verify=False,
+            http2=HTTP2_AVAILABLE and not using_frp,
+            limits=limits,
+        )
+        pooled = PooledClient(node_address, using_frp, client)
+        self._clients[node_id] = pooled
+        if previous is not None:
+            await self._retire(previous)
+        return pooled
+    
+    async def _retire(self, pooled: PooledClient):
+        """Close a replaced client now, or after its last in-flight request"""
+        pooled.retired = True
+        if not pooled.in_flight:
+            await self._close_client(pooled.client)
+    
+    async def _close_client(self, client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing node client: {e}")
+    
+    async def drop_node(self, node_id: str):
+        """Close a deleted node's client"""
+        self._semaphores.pop(node_id, None)
+        pooled = self._clients.pop(node_id, None)
+        if pooled:
+            await self._retire(pooled)
+    
+    def _get_semaphore(self, node_id: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(node_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_connections)
+            self._semaphores[node_id] = semaphore
+        return semaphore
+    
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+    
+    async def request(
+        self,
+        node_id: str,
+        node_address: str,
+        using_frp: bool,
+        method: str,
+        url: str,
+        timeout: httpx.Timeout,
+        **kwargs
+    ) -> httpx.Response:
+        """Send a request through the node's pooled client, bounded per node"""
+        pooled = await self._get_client(node_id, node_address, using_frp)
+        pooled.in_flight += 1
+        try:
+            async with self._get_semaphore(node_id):
+                self.requests_total += 1
+                started = time.perf_counter()
+                try:
+                    response = await pooled.client.request(
+                        method,
+                        url,
+                        timeout=timeout,
+                        extensions={"trace": self._trace},
+                        **kwargs
+                    )
+                except Exception:
+                    self.errors_total += 1
+                    node_request_errors.inc(node_id, "network")
+                    raise
+                finally:
+                    node_request_seconds.observe(time.perf_counter() - started, node_id, method)
+                if response.status_code >= 400:
+                    node_request_errors.inc(node_id, "http")
+                return response
+        finally:
+            pooled.in_flight -= 1
+            if pooled.retired and not pooled.in_flight:
+                await self._close_client(pooled.client)
+    
+    def _open_connections(self, client: httpx.AsyncClient) -> int:
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None) or []
+        count = 0
+        for conn in connections:
+            try:
+                if not conn.is_closed():
+                    count += 1
+            except Exception:
+                pass
+        return count
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Return pool metrics"""
+        open_connections = sum(
+            self._open_connections(pooled.client) for pooled in self._clients.values() if not pooled.client.is_closed
+        )
+        reused = max(self.requests_total - self.connections_opened, 0)
+        return {
+            "clients": len(self._clients),
+            "open_connections": open_connections,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "connections_opened": self.connections_opened,
+            "reuse_ratio": round(reused / self.requests_total, 4) if self.requests_total else 0.0,
+            "http2": HTTP2_AVAILABLE,
+        }
+    
+    async def close(self):
+        """Close all pooled clients"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._semaphores.clear()
+        for pooled in clients:
+            await self._close_client(pooled.client)
+
+
+node_pool = NodeConnectionPool(
+    max_connections=settings.node_pool_max_connections,
+    keepalive_expiry=settings.node_pool_keepalive_expiry,
+)
+
+
+class NodeRouteCache:
+    """In-memory routing table for node addresses and FRP settings
+    
+    Holds the node metadata needed to build an address plus the "frp" settings
+    row, so fan-outs to nodes do not hit the database. Entries are invalidated
+    when nodes register, are deleted, report FRP status, or the FRP setting
+    changes.
+    """
+    
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.frp_settings: Optional[Dict[str, Any]] = None
+        self.frp_loaded = False
+    
+    def set_node(self, node_id: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        metadata = metadata or {}
+        route = {
+            "api_address": metadata.get("api_address"),
+            "frp_remote_port": metadata.get("frp_remote_port"),
+        }
+        # Callers fill in a missing api_address right before sending, so only complete routes are kept
+        if route["api_address"]:
+            self.nodes[node_id] = route
+        return route
+    
+    def set_frp_settings(self, frp_settings: Optional[Dict[str, Any]]):
+        self.frp_settings = frp_settings
+        self.frp_loaded = True
+    
+    def invalidate_node(self, node_id: str):
+        self.nodes.pop(node_id, None)
+    
+    def invalidate_frp(self):
+        self.frp_settings = None
+        self.frp_loaded = False
+    
+    def clear(self):
+        self.nodes.clear()
+        self.invalidate_frp()
+
+
+node_routes = NodeRouteCache()
+
+
+class NodeApplyBatcher:
+    """Coalesces concurrent tunnel applies to the same node into one request
+    
+    Applies arriving for a node within a short window are sent together to the
+    node's /api/agent/tunnels/apply-batch endpoint, so a mass reapply costs one
+    request and one tunnels.json write per node instead of one per tunnel.
+    Nodes that predate the batch endpoint fall back to single applies until
+    they re-register or retry_after seconds pass, so an upgraded node gets
+    batches again.
+    """
+    
+    def __init__(self, window: float = 0.02, max_batch: int = 50, retry_after: float = 600.0):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.retry_after = retry_after
+        # node id -> when the node answered the batch endpoint with 404/405
+        self.unsupported: Dict[str, float] = {}
+        self._pending: Dict[str, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+    
+    async def submit(self, client: "NodeClient", node_id: str, tunnel_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an apply for a node and wait for its individual result"""
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(node_id, [])
+        pending.append((tunnel_data, future))
+        
+        if len(pending) >= self.max_batch:
+            timer = self._timers.pop(node_id, None)
+            if timer:
+                timer.cancel()
+            asyncio.create_task(self._flush(client, node_id))
+        elif node_id not in self._timers:
+            self._timers[node_id] = asyncio.create_task(self._flush_later(client, node_id))
+        
+        return await future
+    
+    def forget(self, node_id: str):
+        """Try batches again for a node, e.g. after it re-registered"""
+        self.unsupported.pop(node_id, None)
+    
+    def _batch_unsupported(self, node_id: str) -> bool:
+        marked_at = self.unsupported.get(node_id)
+        if marked_at is None:
+            return False
+        if time.monotonic() - marked_at >= self.retry_after:
+            del self.unsupported[node_id]
+            return False
+        return True
+    
+    async def _flush_later(self, client: "NodeClient", node_id: str):
+        await asyncio.sleep(self.window)
+        self._timers.pop(node_id, None)
+        await self._flush(client, node_id)
+    
+    async def _flush(self, client: "NodeClient", node_id: str):
+        batch = self._pending.pop(node_id, [])
+        if not batch:
+            return
+        
+        try:
+            if len(batch) == 1 or self._batch_unsupported(node_id):
+                await self._send_single(client, node_id, batch)
+                return
+            
+            logger.debug(f"Sending batch of {len(batch)} tunnel applies to node {node_id}")
+            response = await client._post(
+                node_id,
+                "/api/agent/tunnels/apply-batch",
+                {"tunnels": [data for data, _ in batch]},
+                timeout=httpx.Timeout(30.0 + 2.0 * len(batch))
+            )
+            
+            if response.get("status") == "error":
+                message = response.get("message", "")
+                if "HTTP 404" in message or "HTTP 405" in message:
+                    logger.info(f"Node {node_id} does not support batch apply, falling back to single applies")
+                    self.unsupported[node_id] = time.monotonic()
+                    await self._send_single(client, node_id, batch)
+                    return
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(response)
+                return
+            
+            results = response.get("results") or []
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                result = results[index] if index < len(results) else None
+                if result is None:
+                    future.set_result({"status": "error", "message": "Node returned no result for tunnel"})
+                elif result.get("status") == "success":
+                    future.set_result({"status": "success", "message": result.get("message", "Tunnel applied")})
+                else:
+                    future.set_result({"status": "error", "message": f"Node error: {result.get('message', 'Failed to apply tunnel')}"})
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result({"status": "error", "message": f"Error: {str(e)}"})
+    
+    async def _send_single(self, client: "NodeClient", node_id: str, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        responses = await asyncio.gather(
+            *(client._post(node_id, "/api/agent/tunnels/apply", data) for data, _ in batch)
+        )
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+node_apply_batcher = NodeApplyBatcher(
+    window=settings.node_apply_batch_window,
+    max_batch=settings.node_apply_batch_max,
+    retry_after=settings.node_apply_batch_retry_after,
+)
+
 
 class NodeClient:
     """Client to send requests to nodes via HTTP/HTTPS or FRP"""
     
-    def __init__(self):
+    def __init__(self, pool: Optional[NodeConnectionPool] = None):
         self.timeout = httpx.Timeout(30.0)
+        self.pool = pool or node_pool
     
     async def _get_frp_settings(self) -> Optional[Dict[str, Any]]:
         """Get FRP communication settings"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Settings).where(Settings.key == "frp"))
-            setting = result.scalar_one_or_none()
-            if setting and setting.value and setting.value.get("enabled"):
-                return setting.value
-        return None
-    
-    async def _get_node_address(self, node: Node) -> Tuple[str, bool]:
+        if not node_routes.frp_loaded:
+            frp_settings = None
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Settings).where(Settings.key == "frp"))
+                setting = result.scalar_one_or_none()
+                if setting and setting.value and setting.value.get("enabled"):
+                    frp_settings = setting.value
+            node_routes.set_frp_settings(frp_settings)
+        return node_routes.frp_settings
+    
+    async def _get_node_route(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """Get cached routing metadata for a node, loading it on first use"""
+        route = node_routes.nodes.get(node_id)
+        if route is None:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Node).where(Node.id == node_id))
+                node = result.scalar_one_or_none()
+            if not node:
+                return None
+            route = node_routes.set_node(node_id, node.node_metadata)
+        return route
+    
+    async def _get_node_address(self, node_id: str, route: Dict[str, Any]) -> Tuple[str, bool]:
         """
         Get node address (direct or via FRP)
         Returns: (address, using_frp)
@@ -36,123 +385,141 @@ class NodeClient:
         frp_settings = await self._get_frp_settings()
         
         if frp_settings and frp_settings.get("enabled"):
-            frp_remote_port = node.node_metadata.get("frp_remote_port") if node.node_metadata else None
+            frp_remote_port = route.get("frp_remote_port")
             if frp_remote_port:
                 # Verify FRP server is running before using FRP
                 from app.frp_comm_manager import frp_comm_manager
                 if not frp_comm_manager.is_running():
-                    logger.warning(f"[HTTP] FRP enabled but FRP server not running, falling back to HTTP for node {node.id}")
+                    logger.warning(f"[HTTP] FRP enabled but FRP server not running, falling back to HTTP for node {node_id}")
                     # Fall through to HTTP
                 else:
                     # Use FRP - the server is running, tunnel should be available
                     # Note: If connection fails, retry logic will handle it
-                    logger.info(f"[FRP] Using FRP tunnel to communicate with node {node.id} (remote_port={frp_remote_port})")
+                    logger.debug(f"[FRP] Using FRP tunnel to communicate with node {node_id} (remote_port={frp_remote_port})")
                     return (f"http://127.0.0.1:{frp_remote_port}", True)
             else:
                 # FRP is enabled but node hasn't reported its remote port yet (during initial setup)
-                logger.warning(f"[HTTP] FRP enabled but node {node.id} has no frp_remote_port yet, temporarily using HTTP")
+                logger.warning(f"[HTTP] FRP enabled but node {node_id} has no frp_remote_port yet, temporarily using HTTP")
                 logger.warning(f"[HTTP] This should only happen during node registration. After FRP setup, all communication will use FRP.")
         
         # FRP is not enabled or not available - use HTTP
-        node_address = node.node_metadata.get("api_address", f"http://localhost:8888") if node.node_metadata else f"http://localhost:8888"
+        node_address = route.get("api_address") or "http://localhost:8888"
         if not node_address.startswith("http"):
             node_address = f"http://{node_address}"
-        logger.info(f"[HTTP] Using direct HTTP to communicate with node {node.id} at {node_address}")
+        logger.debug(f"[HTTP] Using direct HTTP to communicate with node {node_id} at {node_address}")
         return (node_address, False)
     
     async def send_to_node(self, node_id: str, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Send request to node via HTTPS or FRP
+        
+        Tunnel applies are grouped per node by the apply batcher.
         """
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Node).where(Node.id == node_id))
-            node = result.scalar_one_or_none()
-            
-            if not node:
-                return {"status": "error", "message": f"Node {node_id} not found"}
-            
-            node_address, using_frp = await self._get_node_address(node)
-            url = f"{node_address.rstrip('/')}{endpoint}"
+        if endpoint == "/api/agent/tunnels/apply":
+            return await node_apply_batcher.submit(self, node_id, data)
+        return await self._post(node_id, endpoint, data)
+    
+    async def _post(
+        self,
+        node_id: str,
+        endpoint: str,
+        data: Dict[str, Any],
+        timeout: Optional[httpx.Timeout] = None
+    ) -> Dict[str, Any]:
+        """POST to a node endpoint, with retries over FRP"""
+        route = await self._get_node_route(node_id)
+        if not route:
+            return {"status": "error", "message": f"Node {node_id} not found"}
+        
+        node_address, using_frp = await self._get_node_address(node_id, route)
+        url = f"{node_address.rstrip('/')}{endpoint}"
+        
+        comm_type = "FRP" if using_frp else "HTTP"
+        logger.debug(f"[{comm_type}] Sending request to node {node_id}: {endpoint}")
+        
+        try:
+            # Retry logic for FRP connections which may need a moment to stabilize
+            max_retries = 5 if using_frp else 1
+            last_error = None
             
-            comm_type = "FRP" if using_frp else "HTTP"
-            logger.debug(f"[{comm_type}] Sending request to node {node_id}: {endpoint}")
+            for attempt in range(max_retries):
+                try:
+                    # FRP clients in the pool never keep connections alive, so each retry dials fresh
+                    if using_frp and attempt > 0:
+                        await asyncio.sleep(2.0)  # Longer delay for FRP retries
+                        logger.info(f"[FRP] Retry {attempt + 1}/{max_retries} for node {node_id} via FRP tunnel")
+                    
+                    response = await self.pool.request(
+                        node_id, node_address, using_frp, "POST", url,
+                        timeout=timeout or self.timeout, json=data
+                    )
+                    response.raise_for_status()
+                    return response.json()
+                except httpx.RequestError as e:
+                    last_error = e
+                    if attempt < max_retries - 1:
+                        if not using_frp:
+                            await asyncio.sleep(0.5)
+                        continue
+                    else:
+                        error_msg = f"Network error: {str(e)}"
+                        if using_frp:
+                            remote_port = url.split(":")[-1].split("/")[0] if ":" in url else "unknown"
+                            error_msg += f" (FRP tunnel connection failed after {max_retries} attempts. The panel may not be able to reach FRP server on 127.0.0.1:{remote_port}. Check if panel and FRP server are in the same network namespace, or check FRP server logs.)"
+                        return {"status": "error", "message": error_msg}
             
+            # Should not reach here, but just in case
+            return {"status": "error", "message": f"Network error: {str(last_error)}"}
+        except httpx.HTTPStatusError as e:
             try:
-                # Retry logic for FRP connections which may need a moment to stabilize
-                max_retries = 5 if using_frp else 1
-                last_error = None
-                
-                for attempt in range(max_retries):
-                    try:
-                        # For FRP, use a new connection each time to avoid connection reuse issues
-                        if using_frp and attempt > 0:
-                            await asyncio.sleep(2.0)  # Longer delay for FRP retries
-                            logger.info(f"[FRP] Retry {attempt + 1}/{max_retries} for node {node_id} via FRP tunnel")
-                        
-                        async with httpx.AsyncClient(
-                            timeout=self.timeout, 
-                            verify=False,
-                            limits=httpx.Limits(max_keepalive_connections=0 if using_frp else 5)  # Disable keep-alive for FRP
-                        ) as client:
-                            response = await client.post(url, json=data)
-                            response.raise_for_status()
-                            return response.json()
-                    except httpx.RequestError as e:
-                        last_error = e
-                        if attempt < max_retries - 1:
-                            if not using_frp:
-                                await asyncio.sleep(0.5)
-                            continue
-                        else:
-                            error_msg = f"Network error: {str(e)}"
-                            if using_frp:
-                                remote_port = url.split(":")[-1].split("/")[0] if ":" in url else "unknown"
-                                error_msg += f" (FRP tunnel connection failed after {max_retries} attempts. The panel may not be able to reach FRP server on 127.0.0.1:{remote_port}. Check if panel and FRP server are in the same network namespace, or check FRP server logs.)"
-                            return {"status": "error", "message": error_msg}
-                
-                # Should not reach here, but just in case
-                return {"status": "error", "message": f"Network error: {str(last_error)}"}
-            except httpx.HTTPStatusError as e:
-                try:
-                    error_detail = e.response.json().get("detail", str(e))
-                except:
-                    error_detail = str(e)
-                return {"status": "error", "message": f"Node error (HTTP {e.response.status_code}): {error_detail}"}
-            except Exception as e:
-                return {"status": "error", "message": f"Error: {str(e)}"}
+                error_detail = e.response.json().get("detail", str(e))
+            except:
+                error_detail = str(e)
+            return {"status": "error", "message": f"Node error (HTTP {e.response.status_code}): {error_detail}"}
+        except Exception as e:
+            return {"status": "error", "message": f"Error: {str(e)}"}
+    
+    async def _get(self, node_id: str, endpoint: str, timeout: httpx.Timeout) -> Dict[str, Any]:
+        """GET a node endpoint"""
+        route = await self._get_node_route(node_id)
+        if not route:
+            return {"status": "error", "message": f"Node {node_id} not found"}
+        
+        node_address, using_frp = await self._get_node_address(node_id, route)
+        url = f"{node_address.rstrip('/')}{endpoint}"
+        
+        comm_type = "FRP" if using_frp else "HTTP"
+        logger.debug(f"[{comm_type}] GET {endpoint} from node {node_id}")
+        
+        try:
+            response = await self.pool.request(
+                node_id, node_address, using_frp, "GET", url, timeout=timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.RequestError as e:
+            return {"status": "error", "message": f"Network error: {str(e)}"}
+        except httpx.HTTPStatusError as e:
+            try:
+                error_detail = e.response.json().get("detail", str(e))
+            except:
+                error_detail = str(e)
+            return {"status": "error", "message": f"Node error (HTTP {e.response.status_code}): {error_detail}"}
+        except Exception as e:
+            return {"status": "error", "message": f"Error: {str(e)}"}
     
     async def get_tunnel_status(self, node_id: str, tunnel_id: str = "") -> Dict[str, Any]:
         """Get tunnel status from node"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Node).where(Node.id == node_id))
-            node = result.scalar_one_or_none()
-            
-            if not node:
-                return {"status": "error", "message": f"Node {node_id} not found"}
-            
-            node_address, using_frp = await self._get_node_address(node)
-            url = f"{node_address.rstrip('/')}/api/agent/status"
-            
-            comm_type = "FRP" if using_frp else "HTTP"
-            logger.debug(f"[{comm_type}] Getting tunnel status from node {node_id}")
-            
-            try:
-                timeout = httpx.Timeout(3.0, connect=2.0)
-                async with httpx.AsyncClient(timeout=timeout, verify=False) as client:
-                    response = await client.get(url)
-                    response.raise_for_status()
-                    return response.json()
-            except httpx.RequestError as e:
-                return {"status": "error", "message": f"Network error: {str(e)}"}
-            except httpx.HTTPStatusError as e:
-                try:
-                    error_detail = e.response.json().get("detail", str(e))
-                except:
-                    error_detail = str(e)
-                return {"status": "error", "message": f"Node error (HTTP {e.response.status_code}): {error_detail}"}
-            except Exception as e:
-                return {"status": "error", "message": f"Error: {str(e)}"}
+        return await self._get(node_id, "/api/agent/status", httpx.Timeout(3.0, connect=2.0))
+    
+    async def get_tunnel_manifest(self, node_id: str) -> Dict[str, Any]:
+        """Get spec hash and revision of every tunnel running on a node"""
+        return await self._get(node_id, "/api/agent/tunnels/manifest", httpx.Timeout(10.0, connect=3.0))
     
     async def apply_tunnel(self, node_id: str, tunnel_data: Dict[str, Any]) -> Dict[str, Any]:
         """Apply tunnel to node"""
         return await self.send_to_node(node_id, "/api/agent/tunnels/apply", tunnel_data)
+    
+    async def apply_tunnels(self, node_id: str, tunnels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply several tunnels to one node, sent as batches; returns results in order"""
+        return list(await asyncio.gather(*(self.apply_tunnel(node_id, data) for data in tunnels)))
@@ -0,0 +1,149 @@
+"""Background node health poller"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+from sqlalchemy import select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Node
+from app.node_client import NodeClient
+
+logger = logging.getLogger(__name__)
+
+
+class NodeHealthPoller:
+    """Probes every node on an interval and keeps a connection-state snapshot
+    
+    API endpoints read the snapshot instead of probing nodes on each request,
+    so page loads never wait on a slow node and the probe rate stays constant
+    no matter how many dashboards are open.
+    """
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.interval = settings.node_health_interval
+        self.jitter = settings.node_health_jitter
+        self.alpha = settings.node_health_ewma_alpha
+        self.snapshot: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    async def start(self):
+        """Start the poller task"""
+        await self.stop()
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._poll_loop())
+        logger.info(f"Node health poller started: interval={self.interval}s, jitter={self.jitter}s")
+    
+    async def stop(self):
+        """Stop the poller task"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            logger.info("Node health poller stopped")
+    
+    def trigger(self):
+        """Run the next poll round immediately (e.g. after a node registers)"""
+        if self._wakeup:
+            self._wakeup.set()
+    
+    def get(self, node_id: str) -> Dict[str, Any]:
+        """Get the snapshot entry for a node"""
+        entry = self.snapshot.get(node_id)
+        if entry is None:
+            return {
+                "status": "connecting",
+                "error_message": "Waiting for first health check",
+                "last_checked": None,
+                "last_success": None,
+                "latency_ms": None,
+                "consecutive_failures": 0,
+            }
+        return entry
+    
+    async def _poll_loop(self):
+        """Background task probing all nodes"""
+        try:
+            while True:
+                try:
+                    await self.poll_once()
+                except Exception as e:
+                    logger.error(f"Error in node health poll: {e}", exc_info=True)
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        except asyncio.CancelledError:
+            logger.info("Node health poll loop cancelled")
+            raise
+    
+    async def poll_once(self):
+        """Probe every registered node once and update the snapshot"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Node.id))
+            node_ids: List[str] = [row[0] for row in result.all()]
+        
+        for node_id in list(self.snapshot.keys()):
+            if node_id not in node_ids:
+                del self.snapshot[node_id]
+        
+        if not node_ids:
+            return
+        
+        await self.probe_nodes(node_ids, jitter=True)
+    
+    async def probe_nodes(self, node_ids: List[str], jitter: bool = False):
+        """Probe the given nodes concurrently, once each, and update the snapshot"""
+        client = NodeClient()
+        await asyncio.gather(*(self._probe(client, node_id, jitter) for node_id in set(node_ids)), return_exceptions=True)
+    
+    async def _probe(self, client: NodeClient, node_id: str, jitter: bool):
+        if jitter and self.jitter > 0:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        
+        started = time.monotonic()
+        try:
+            response = await client.get_tunnel_status(node_id, "")
+        except Exception as e:
+            response = {"status": "error", "message": f"Error: {str(e)}"}
+        latency_ms = (time.monotonic() - started) * 1000
+        
+        previous = self.snapshot.get(node_id, {})
+        entry = {
+            "status": "failed",
+            "error_message": None,
+            "last_checked": datetime.utcnow(),
+            "last_success": previous.get("last_success"),
+            "latency_ms": previous.get("latency_ms"),
+            "consecutive_failures": previous.get("consecutive_failures", 0),
+            "active_tunnels": previous.get("active_tunnels"),
+        }
+        
+        if response and response.get("status") == "ok":
+            entry["status"] = "connected"
+            entry["last_success"] = entry["last_checked"]
+            entry["consecutive_failures"] = 0
+            entry["active_tunnels"] = response.get("active_tunnels")
+            if entry["latency_ms"] is None:
+                entry["latency_ms"] = round(latency_ms, 2)
+            else:
+                entry["latency_ms"] = round(self.alpha * latency_ms + (1 - self.alpha) * entry["latency_ms"], 2)
+        else:
+            error_msg = response.get("message", "Node disconnected") if response else "Node not responding"
+            if "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+                entry["status"] = "reconnecting"
+            entry["error_message"] = error_msg
+            entry["consecutive_failures"] += 1
+        
+        self.snapshot[node_id] = entry
+
+
+node_health_poller = NodeHealthPoller()
@@ -0,0 +1,72 @@
+"""In-memory index of registered nodes for bulk tunnel operations"""
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import flag_modified
+from app.models import Node, Tunnel
+from app.node_client import node_routes
+
+
+def node_role(node: Node) -> Optional[str]:
+    return (node.node_metadata or {}).get("role")
+
+
+class NodeIndex:
+    """All nodes loaded with one query, indexed by id and by role
+    
+    Loops over many tunnels resolve their nodes here instead of querying
+    the nodes table once or more per tunnel.
+    """
+    
+    def __init__(self, nodes: List[Node]):
+        self.by_id: Dict[str, Node] = {node.id: node for node in nodes}
+        self.by_role: Dict[str, List[Node]] = {}
+        for node in nodes:
+            role = node_role(node)
+            if role:
+                self.by_role.setdefault(role, []).append(node)
+        self.modified: Set[str] = set()
+    
+    @classmethod
+    async def load(cls, db: AsyncSession) -> "NodeIndex":
+        result = await db.execute(select(Node))
+        return cls(result.scalars().all())
+    
+    def get(self, node_id: Optional[str]) -> Optional[Node]:
+        return self.by_id.get(node_id) if node_id else None
+    
+    def first(self, role: str) -> Optional[Node]:
+        nodes = self.by_role.get(role)
+        return nodes[0] if nodes else None
+    
+    def reverse_pair(self, tunnel: Tunnel) -> Tuple[Optional[Node], Optional[Node]]:
+        """(iran, foreign) node of a reverse tunnel, falling back to the first node of each role"""
+        iran_node = self.get(tunnel.node_id)
+        foreign_node = None
+        if iran_node and node_role(iran_node) != "iran":
+            foreign_node = iran_node
+            iran_node = None
+        if not foreign_node:
+            foreign_node = self.first("foreign")
+        if not iran_node:
+            iran_node = self.get(tunnel.node_id) or self.first("iran")
+        return iran_node, foreign_node
+    
+    def ensure_api_address(self, node: Node):
+        """Fill in a node's api_address from its IP and port if it has none"""
+        metadata = node.node_metadata or {}
+        if not metadata.get("api_address"):
+            metadata["api_address"] = f"http://{metadata.get('ip_address', node.fingerprint)}:{metadata.get('api_port', 8888)}"
+            node.node_metadata = metadata
+            self.modified.add(node.id)
+    
+    async def save(self, db: AsyncSession):
+        """Persist api_address fixes with a single commit"""
+        if not self.modified:
+            return
+        for node_id in self.modified:
+            flag_modified(self.by_id[node_id], "node_metadata")
+        await db.commit()
+        for node_id in self.modified:
+            node_routes.invalidate_node(node_id)
+        self.modified.clear()
@@ -1,22 +1,46 @@
 """Port forwarding service for panel to forward connections to nodes"""
 import asyncio
+import functools
 import socket
-from typing import Dict, Optional
+import time
+from typing import Dict, List, Optional, Set
 from asyncio import StreamReader, StreamWriter
 import logging
 
+from app.config import settings
+from app.forward_stats import ForwardStats
+from app.relay import ClientRelayProtocol, IdleTimer, relay, resolve_engine, set_keepalive
+
 logger = logging.getLogger(__name__)
 
 
 class PortForwarder:
-    """Manages TCP port forwarding from panel to nodes"""
+    """Manages TCP port forwarding from panel to nodes
+    
+    With workers > 0 the forwards do not run on this event loop at all: they
+    are handed to a ForwardWorkerPool, whose processes each listen on every
+    port with SO_REUSEPORT. A positive idle_timeout closes connections that
+    moved no data in either direction for that many seconds.
+    """
     
-    def __init__(self):
+    def __init__(self, engine: str = "stream", workers: int = 0, reuse_port: bool = False, idle_timeout: float = 0):
         self.active_forwards: Dict[int, asyncio.Task] = {}
         self.forward_configs: Dict[int, dict] = {}  # port -> {node_address, remote_port}
+        self.stats: Dict[int, ForwardStats] = {}
+        self.engine = resolve_engine(engine)
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.idle_timeout = idle_timeout
+        self.pool = None
+    
+    async def start_forward(self, local_port: int, node_address: str, remote_port: int, wait: bool = False) -> bool:
+        """Start forwarding from local_port to node_address:remote_port
         
-    async def start_forward(self, local_port: int, node_address: str, remote_port: int) -> bool:
-        """Start forwarding from local_port to node_address:remote_port"""
+        With wait, returns only once the port is listening and raises if it
+        cannot be bound.
+        """
+        if self.workers:
+            return await self._start_in_workers(local_port, node_address, remote_port)
         try:
             if local_port in self.active_forwards:
                 logger.warning(f"Port {local_port} already being forwarded, stopping old forward")
@@ -26,18 +50,44 @@ class PortForwarder:
                 "node_address": node_address,
                 "remote_port": remote_port
             }
+            stats = ForwardStats(local_port, f"{node_address}:{remote_port}")
+            self.stats[local_port] = stats
             
-            task = asyncio.create_task(self._forward_loop(local_port, node_address, remote_port))
+            started = asyncio.get_running_loop().create_future() if wait else None
+            task = asyncio.create_task(self._forward_loop(local_port, node_address, remote_port, stats, started))
             self.active_forwards[local_port] = task
+            if started:
+                await started
             
             logger.info(f"Started forwarding {local_port} -> {node_address}:{remote_port}")
             return True
+        except Exception as e:
+            logger.error(f"Failed to start forwarding on port {local_port}: {e}")
+            if wait:
+                raise
+            return False
+    
+    async def _start_in_workers(self, local_port: int, node_address: str, remote_port: int) -> bool:
+        try:
+            if self.pool is None:
+                from app.forward_workers import ForwardWorkerPool
+                self.pool = ForwardWorkerPool(self.workers, self.engine)
+                await self.pool.start()
+            await self.pool.start_forward(local_port, node_address, remote_port)
         except Exception as e:
             logger.error(f"Failed to start forwarding on port {local_port}: {e}")
             return False
+        self.forward_configs[local_port] = {
+            "node_address": node_address,
+            "remote_port": remote_port
+        }
+        logger.info(f"Started forwarding {local_port} -> {node_address}:{remote_port} in {self.workers} workers")
+        return True
     
     async def stop_forward(self, local_port: int):
         """Stop forwarding on local_port"""
+        if self.pool:
+            await self.pool.stop_forward(local_port)
         if local_port in self.active_forwards:
             task = self.active_forwards[local_port]
             task.cancel()
@@ -45,29 +95,50 @@ class PortForwarder:
                 await task
             except asyncio.CancelledError:
                 pass
+            except Exception:
+                # The forward already failed, e.g. its port could not be bound
+                pass
             del self.active_forwards[local_port]
-            
+        
         if local_port in self.forward_configs:
             del self.forward_configs[local_port]
-            
+        self.stats.pop(local_port, None)
+        
         logger.info(f"Stopped forwarding on port {local_port}")
     
-    async def _forward_loop(self, local_port: int, node_address: str, remote_port: int):
+    async def _forward_loop(self, local_port: int, node_address: str, remote_port: int, stats: ForwardStats, started: Optional[asyncio.Future] = None):
         """Main forwarding loop - accepts connections and forwards them"""
+        idle = IdleTimer(self.idle_timeout) if self.idle_timeout > 0 else None
+        sweeper = asyncio.create_task(idle.run()) if idle else None
         try:
             if "://" in node_address:
                 node_address = node_address.split("://")[-1]
             node_host = node_address.split(":")[0] if ":" in node_address else node_address
             
             try:
-                server = await asyncio.start_server(
-                    lambda r, w: self._handle_client(r, w, node_host, remote_port),
-                    host='0.0.0.0',
-                    port=local_port,
-                    reuse_address=True,
-                    reuse_port=False
-                )
-                logger.info(f"Forwarding server started on 0.0.0.0:{local_port} -> {node_host}:{remote_port}")
+                if self.engine == "stream":
+                    server = await asyncio.start_server(
+                        lambda r, w: self._handle_client(r, w, node_host, remote_port, stats, idle),
+                        host='0.0.0.0',
+                        port=local_port,
+                        reuse_address=True,
+                        reuse_port=self.reuse_port
+                    )
+                elif self.engine == "protocol":
+                    connects: Set[asyncio.Task] = set()
+                    connect = functools.partial(self._connect_target, node_host, remote_port, stats)
+                    server = await asyncio.get_running_loop().create_server(
+                        lambda: ClientRelayProtocol(connect, stats, connects, idle),
+                        host='0.0.0.0',
+                        port=local_port,
+                        reuse_address=True,
+                        reuse_port=self.reuse_port
+                    )
+                else:
+                    listener = self._listen(local_port)
+                if started:
+                    started.set_result(None)
+                logger.info(f"Forwarding server started on 0.0.0.0:{local_port} -> {node_host}:{remote_port} ({self.engine} relay)")
             except OSError as e:
                 if "Address already in use" in str(e) or e.errno == 98:
                     logger.error(f"Port {local_port} is already in use. Please ensure:")
@@ -77,60 +148,146 @@ class PortForwarder:
                     raise RuntimeError(f"Port {local_port} already in use. Check docker-compose.yml network configuration.")
                 raise
             
+            if self.engine in ("splice", "buffer"):
+                await self._accept_loop(listener, node_host, remote_port, stats, idle)
+                return
+            
             async with server:
                 await server.serve_forever()
         except asyncio.CancelledError:
             logger.info(f"Forwarding on port {local_port} cancelled")
+            if started and not started.done():
+                started.cancel()
             raise
         except Exception as e:
             logger.error(f"Error in forwarding loop for port {local_port}: {e}")
+            if started and not started.done():
+                started.set_exception(e)
+            raise
+        finally:
+            if sweeper:
+                sweeper.cancel()
+    
+    def _listen(self, local_port: int) -> socket.socket:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            listener.bind(('0.0.0.0', local_port))
+            listener.listen(socket.SOMAXCONN)
+            listener.setblocking(False)
+        except Exception:
+            listener.close()
             raise
+        return listener
+    
+    async def _accept_loop(self, listener: socket.socket, target_host: str, target_port: int, stats: ForwardStats, idle: Optional[IdleTimer] = None):
+        """Accept connections on a raw socket and relay each with the configured engine"""
+        loop = asyncio.get_running_loop()
+        connections: Set[asyncio.Task] = set()
+        try:
+            while True:
+                client, _ = await loop.sock_accept(listener)
+                task = asyncio.create_task(self._relay_client(client, target_host, target_port, stats, idle))
+                connections.add(task)
+                task.add_done_callback(connections.discard)
+        finally:
+            listener.close()
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
     
-    async def _handle_client(self, reader: StreamReader, writer: StreamWriter, target_host: str, target_port: int):
+    async def _relay_client(self, client: socket.socket, target_host: str, target_port: int, stats: ForwardStats, idle: Optional[IdleTimer] = None):
+        """Connect to the target and relay a client connection socket-to-socket"""
+        remote = None
+        stats.opened()
+        try:
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            set_keepalive(client)
+            try:
+                remote = await self._connect_target(target_host, target_port, stats)
+            except Exception:
+                return
+            await relay(client, remote, self.engine, stats, idle)
+        except OSError as e:
+            stats.relay_errors += 1
+            logger.debug(f"Relay to {target_host}:{target_port} ended: {e}")
+        finally:
+            stats.closed()
+            client.close()
+            if remote:
+                remote.close()
+    
+    async def _connect_target(self, target_host: str, target_port: int, stats: ForwardStats) -> socket.socket:
+        """Open a connection to the target, recording the dial time or the failure"""
+        loop = asyncio.get_running_loop()
+        sock = self._target_socket()
+        dial_started = time.monotonic()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (target_host, target_port)), timeout=10.0)
+        except asyncio.TimeoutError:
+            sock.close()
+            stats.connect_timeouts += 1
+            logger.warning(f"Timeout connecting to {target_host}:{target_port}")
+            raise
+        except BaseException as e:
+            sock.close()
+            if isinstance(e, Exception):
+                stats.connect_failures += 1
+                logger.warning(f"Failed to connect to {target_host}:{target_port}: {e}")
+            raise
+        stats.connected(time.monotonic() - dial_started)
+        return sock
+    
+    def _target_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        set_keepalive(sock)
+        sock.setblocking(False)
+        return sock
+    
+    async def _handle_client(self, reader: StreamReader, writer: StreamWriter, target_host: str, target_port: int, stats: ForwardStats, idle: Optional[IdleTimer] = None):
         """Handle a client connection by forwarding to target"""
         remote_reader = None
         remote_writer = None
+        # Set by either direction; counted once per connection
+        failed = False
+        stats.opened()
+        count_in, count_out = stats.add_in, stats.add_out
         
         try:
+            client_sock = writer.get_extra_info("socket")
+            if client_sock is not None:
+                set_keepalive(client_sock)
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
-                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
-                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
-                sock.setblocking(False)
-                
-                loop = asyncio.get_event_loop()
-                await asyncio.wait_for(
-                    loop.sock_connect(sock, (target_host, target_port)),
-                    timeout=10.0
-                )
-                
+                sock = await self._connect_target(target_host, target_port, stats)
                 remote_reader, remote_writer = await asyncio.open_connection(sock=sock)
-            except asyncio.TimeoutError:
-                logger.warning(f"Timeout connecting to {target_host}:{target_port}")
+            except Exception:
                 try:
                     writer.close()
                     await writer.wait_closed()
                 except:
                     pass
                 return
-            except Exception as e:
-                logger.warning(f"Failed to connect to {target_host}:{target_port}: {e}")
-                try:
+            
+            if idle:
+                def close_both():
                     writer.close()
-                    await writer.wait_closed()
-                except:
-                    pass
-                return
+                    remote_writer.close()
+                
+                # Closing the transports ends both reads with EOF
+                idle.add(writer, close_both)
+                count_in, count_out = idle.counter(writer, count_in), idle.counter(writer, count_out)
             
-            async def forward(src_reader: StreamReader, dst_writer: StreamWriter, direction: str):
+            async def forward(src_reader: StreamReader, dst_writer: StreamWriter, count):
+                nonlocal failed
                 try:
                     while True:
                         try:
                             data = await asyncio.wait_for(src_reader.read(8192), timeout=60.0)
                             if not data:
                                 break
+                            count(len(data))
                             dst_writer.write(data)
                             await dst_writer.drain()
                         except asyncio.TimeoutError:
@@ -141,9 +298,12 @@ class PortForwarder:
                             except:
                                 break
                         except (ConnectionResetError, BrokenPipeError, OSError, ConnectionAbortedError) as e:
+                            failed = True
+                            logger.debug(f"Relay to {target_host}:{target_port} ended: {e}")
                             break
                 except Exception as e:
-                    pass
+                    failed = True
+                    logger.warning(f"Relay to {target_host}:{target_port} failed: {e}")
                 finally:
                     try:
                         if not dst_writer.is_closing():
@@ -153,13 +313,18 @@ class PortForwarder:
                         pass
             
             await asyncio.gather(
-                forward(reader, remote_writer, "client->node"),
-                forward(remote_reader, writer, "node->client"),
+                forward(reader, remote_writer, count_in),
+                forward(remote_reader, writer, count_out),
                 return_exceptions=True
             )
         except Exception as e:
-            pass
+            logger.warning(f"Error handling connection to {target_host}:{target_port}: {e}")
         finally:
+            if failed:
+                stats.relay_errors += 1
+            if idle:
+                idle.remove(writer)
+            stats.closed()
             try:
                 writer.close()
                 await writer.wait_closed()
@@ -174,18 +339,36 @@ class PortForwarder:
     
     def is_forwarding(self, local_port: int) -> bool:
         """Check if port is being forwarded"""
+        if self.pool:
+            return local_port in self.pool.forwards
         return local_port in self.active_forwards
     
     def get_forwarding_ports(self) -> list:
         """Get list of all forwarding ports"""
+        if self.pool:
+            return list(self.pool.forwards.keys())
         return list(self.active_forwards.keys())
     
+    async def get_stats(self) -> List[dict]:
+        """Per-port counter snapshots, summed over the workers in worker mode"""
+        if self.pool:
+            return await self.pool.get_forward_stats()
+        return [stats.snapshot() for _, stats in sorted(self.stats.items())]
+    
     async def cleanup_all(self):
         """Stop all forwarding"""
+        if self.pool:
+            await self.pool.stop()
+            self.pool = None
+            self.forward_configs.clear()
         ports = list(self.active_forwards.keys())
         for port in ports:
             await self.stop_forward(port)
 
 
-port_forwarder = PortForwarder()
+port_forwarder = PortForwarder(
+    settings.port_forward_engine,
+    workers=settings.port_forward_workers,
+    idle_timeout=settings.port_forward_idle_timeout,
+)
 
@@ -0,0 +1,207 @@
+"""Quota and expiry enforcement for tunnels"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select, or_
+from app.database import AsyncSessionLocal
+from app.models import Tunnel, Node
+from app.node_client import NodeClient
+
+logger = logging.getLogger(__name__)
+
+
+def _stop_panel_side(tunnel: Tunnel):
+    """Stop the processes the panel itself runs for a tunnel"""
+    from app.gost_forwarder import gost_forwarder
+    from app.rathole_server import rathole_server_manager
+    from app.backhaul_manager import backhaul_manager
+    from app.chisel_server import chisel_server_manager
+    from app.frp_server import frp_server_manager
+    
+    managers = {
+        "gost": gost_forwarder.stop_forward,
+        "rathole": rathole_server_manager.stop_server,
+        "backhaul": backhaul_manager.stop_server,
+        "chisel": chisel_server_manager.stop_server,
+        "frp": frp_server_manager.stop_server,
+    }
+    stop = managers.get(tunnel.core)
+    if stop:
+        try:
+            stop(tunnel.id)
+        except Exception as e:
+            logger.error(f"Failed to stop {tunnel.core} for tunnel {tunnel.id}: {e}")
+
+
+async def suspend_tunnel(tunnel_id: str, reason: str) -> bool:
+    """Mark an active tunnel suspended and remove it from the panel and its nodes"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(Tunnel).where(Tunnel.id == tunnel_id))
+        tunnel = result.scalar_one_or_none()
+        if not tunnel or tunnel.status != "active":
+            return False
+        
+        node_ids = {tunnel.node_id, tunnel.iran_node_id, tunnel.foreign_node_id}
+        if tunnel.core in {"rathole", "backhaul", "chisel", "frp"} and not tunnel.foreign_node_id:
+            # Older reverse tunnels run their client on the first foreign node
+            result = await session.execute(select(Node))
+            foreign_ids = [n.id for n in result.scalars().all() if n.node_metadata and n.node_metadata.get("role") == "foreign"]
+            if foreign_ids:
+                node_ids.add(foreign_ids[0])
+        node_ids = [node_id for node_id in node_ids if node_id]
+        
+        tunnel.status = "suspended"
+        tunnel.error_message = reason
+        await session.commit()
+    
+    logger.info(f"Suspending tunnel {tunnel_id}: {reason}")
+    _stop_panel_side(tunnel)
+    
+    client = NodeClient()
+    responses = await asyncio.gather(*(
+        client.send_to_node(node_id, "/api/agent/tunnels/remove", {"tunnel_id": tunnel_id})
+        for node_id in node_ids
+    ))
+    for node_id, response in zip(node_ids, responses):
+        if response.get("status") == "error":
+            logger.warning(f"Failed to remove suspended tunnel {tunnel_id} from node {node_id}: {response.get('message')}")
+    return True
+
+
+def limit_reason(tunnel: Tunnel, now: Optional[datetime] = None) -> Optional[str]:
+    """Why a tunnel may not run right now, or None if it is within its limits"""
+    now = now or datetime.utcnow()
+    if tunnel.expires_at and tunnel.expires_at <= now:
+        return "Expired"
+    if tunnel.quota_mb and tunnel.quota_mb > 0 and (tunnel.used_mb or 0) >= tunnel.quota_mb:
+        return "Quota exceeded"
+    return None
+
+
+class QuotaEnforcer:
+    """Suspends active tunnels once they expire or use up their quota
+    
+    Expiry times sit in a min-heap, so the task only sleeps until the earliest
+    one is due instead of scanning every tunnel on each tick. Quotas are
+    checked against running per-tunnel totals that usage_recorder feeds as
+    usage arrives. Only tunnels with a limit are tracked at all.
+    
+    The rest of the panel calls track() whenever a tunnel is created, changed
+    or reapplied and forget() when it is deleted. Heap entries made stale by
+    those calls are dropped lazily when they reach the top.
+    """
+    
+    MAX_SLEEP = 300.0
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.heap: List[Tuple[datetime, str]] = []
+        self.expiries: Dict[str, datetime] = {}
+        self.quotas: Dict[str, float] = {}
+        self.used: Dict[str, float] = {}
+        self.wakeup = asyncio.Event()
+        self.tasks: Set[asyncio.Task] = set()
+    
+    async def start(self):
+        """Load limited active tunnels and start the expiry task"""
+        await self.stop()
+        self.heap.clear()
+        self.expiries.clear()
+        self.quotas.clear()
+        self.used.clear()
+        
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Tunnel).where(
+                    Tunnel.status == "active",
+                    or_(Tunnel.expires_at.isnot(None), Tunnel.quota_mb > 0)
+                )
+            )
+            tunnels = result.scalars().all()
+        for tunnel in tunnels:
+            self.track(tunnel)
+        
+        self.task = asyncio.create_task(self._expiry_loop())
+        logger.info(f"Quota enforcer started: {len(self.expiries)} expiries, {len(self.quotas)} quotas tracked")
+    
+    async def stop(self):
+        """Stop the expiry task"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            logger.info("Quota enforcer stopped")
+    
+    def track(self, tunnel: Tunnel):
+        """Start or refresh enforcement of a tunnel's limits"""
+        self.forget(tunnel.id)
+        if tunnel.status != "active":
+            return
+        
+        reason = limit_reason(tunnel)
+        if reason:
+            self._suspend(tunnel.id, reason)
+            return
+        
+        if tunnel.quota_mb and tunnel.quota_mb > 0:
+            self.quotas[tunnel.id] = tunnel.quota_mb
+            self.used[tunnel.id] = tunnel.used_mb or 0
+        if tunnel.expires_at:
+            self.expiries[tunnel.id] = tunnel.expires_at
+            heapq.heappush(self.heap, (tunnel.expires_at, tunnel.id))
+            if self.heap[0][1] == tunnel.id:
+                self.wakeup.set()
+    
+    def forget(self, tunnel_id: str):
+        """Stop enforcing a tunnel's limits"""
+        self.expiries.pop(tunnel_id, None)
+        self.quotas.pop(tunnel_id, None)
+        self.used.pop(tunnel_id, None)
+    
+    def add_usage(self, tunnel_id: str, used_mb: float):
+        """Add usage to a tunnel's running total, suspending it when it reaches its quota"""
+        quota = self.quotas.get(tunnel_id)
+        if quota is None:
+            return
+        self.used[tunnel_id] += used_mb
+        if self.used[tunnel_id] >= quota:
+            self._suspend(tunnel_id, "Quota exceeded")
+    
+    def _suspend(self, tunnel_id: str, reason: str):
+        self.forget(tunnel_id)
+        task = asyncio.create_task(suspend_tunnel(tunnel_id, reason))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+    
+    async def _expiry_loop(self):
+        try:
+            while True:
+                self.wakeup.clear()
+                now = datetime.utcnow()
+                while self.heap:
+                    expires_at, tunnel_id = self.heap[0]
+                    if self.expiries.get(tunnel_id) != expires_at:
+                        heapq.heappop(self.heap)
+                    elif expires_at <= now:
+                        heapq.heappop(self.heap)
+                        self._suspend(tunnel_id, "Expired")
+                    else:
+                        break
+                
+                timeout = self.MAX_SLEEP
+                if self.heap:
+                    timeout = min(timeout, (self.heap[0][0] - now).total_seconds())
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+
+
+quota_enforcer = QuotaEnforcer()
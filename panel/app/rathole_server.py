@@ -1,11 +1,12 @@
 """Rathole server management for panel"""
 import subprocess
-import time
 import logging
 from pathlib import Path
 from typing import Dict, Optional
 
 from app.utils import parse_address_port, format_address_port
+from app.readiness import wait_until_ready, READY_TIMEOUTS
+from app.core_supervisor import core_supervisor
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +74,7 @@ bind_addr = "{proxy_bind_addr}"
                 log_f.write(f"Config file: {config_path}\n")
                 log_f.write(f"Config content:\n{config}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     ["/usr/local/bin/rathole", "-s", str(config_path)],
                     stdout=log_f,
@@ -84,6 +86,7 @@ bind_addr = "{proxy_bind_addr}"
                 log_f = open(log_file, 'w', buffering=1)
                 log_f.write(f"Starting rathole server (system binary) for tunnel {tunnel_id}\n")
                 log_f.flush()
+                log_offset = log_f.tell()
                 proc = subprocess.Popen(
                     ["rathole", "-s", str(config_path)],
                     stdout=log_f,
@@ -95,43 +98,33 @@ bind_addr = "{proxy_bind_addr}"
             self.active_servers[f"{tunnel_id}_log"] = log_f
             self.active_servers[tunnel_id] = proc
             
-            time.sleep(1.0)
-            if proc.poll() is not None:
-                try:
-                    if log_file.exists():
-                        with open(log_file, 'r') as f:
-                            error_output = f.read()
-                    else:
-                        error_output = "Log file not found"
-                    error_msg = f"rathole server failed to start (exit code: {proc.poll()}): {error_output[-500:] if len(error_output) > 500 else error_output}"
-                    logger.error(error_msg)
-                except Exception as e:
-                    error_msg = f"rathole server failed to start (exit code: {proc.poll()}), could not read log: {e}"
-                    logger.error(error_msg)
-                finally:
-                    del self.active_servers[tunnel_id]
-                    if f"{tunnel_id}_log" in self.active_servers:
-                        try:
-                            self.active_servers[f"{tunnel_id}_log"].close()
-                        except:
-                            pass
-                        del self.active_servers[f"{tunnel_id}_log"]
-                    if tunnel_id in self.server_configs:
-                        del self.server_configs[tunnel_id]
-                raise RuntimeError(error_msg)
-            
             try:
-                import socket
-                _, port, _ = parse_address_port(bind_addr)
-                if port:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(1)
-                    result = sock.connect_ex(('127.0.0.1', port))
-                    sock.close()
-                    if result != 0:
-                        logger.warning(f"Rathole server port {port} not listening after start, but process is running. PID: {proc.pid}")
-            except Exception as e:
-                logger.warning(f"Could not verify rathole server port is listening: {e}")
+                wait_until_ready(
+                    proc,
+                    "rathole server",
+                    log_file,
+                    ports=[port],
+                    timeout=READY_TIMEOUTS["rathole"],
+                    log_offset=log_offset
+                )
+            except RuntimeError as e:
+                logger.error(str(e))
+                del self.active_servers[tunnel_id]
+                if f"{tunnel_id}_log" in self.active_servers:
+                    try:
+                        self.active_servers[f"{tunnel_id}_log"].close()
+                    except:
+                        pass
+                    del self.active_servers[f"{tunnel_id}_log"]
+                if tunnel_id in self.server_configs:
+                    del self.server_configs[tunnel_id]
+                raise
+            
+            core_supervisor.watch(
+                f"rathole:{tunnel_id}",
+                proc,
+                lambda: self.start_server(tunnel_id, remote_addr, token, proxy_port, use_ipv6)
+            )
             
             logger.info(f"Started Rathole server for tunnel {tunnel_id} on {bind_addr}, proxy port: {proxy_port}")
             return True
@@ -142,6 +135,7 @@ bind_addr = "{proxy_bind_addr}"
     
     def stop_server(self, tunnel_id: str):
         """Stop Rathole server for a tunnel"""
+        core_supervisor.unwatch(f"rathole:{tunnel_id}")
         if tunnel_id in self.active_servers:
             proc = self.active_servers[tunnel_id]
             try:
@@ -0,0 +1,192 @@
+"""Readiness detection for tunnel core processes"""
+import logging
+import os
+import re
+import socket
+import subprocess
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long each core may take to open its listen socket
+READY_TIMEOUTS = {
+    "gost": 3.0,
+    "rathole": 5.0,
+    "backhaul": 5.0,
+    "chisel": 5.0,
+    "frp": 5.0,
+}
+
+FAILURE_PATTERN = re.compile(
+    r"address already in use|bind: permission denied|cannot assign requested address|panic:|\bfatal\b",
+    re.IGNORECASE
+)
+
+POLL_INTERVAL = 0.05
+
+# Without a port to watch, a process that survives this long counts as started
+NO_PORT_GRACE = 1.0
+
+_PROC_NET = {
+    "tcp": ("/proc/net/tcp", "/proc/net/tcp6"),
+    "udp": ("/proc/net/udp", "/proc/net/udp6"),
+}
+_TCP_LISTEN = "0A"
+
+
+def socket_inodes(pid: int) -> Optional[Set[str]]:
+    """Inodes of the sockets held by a process and its direct children
+    
+    Returns None when the process's /proc/<pid>/fd cannot be read.
+    """
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            pids += [int(p) for p in f.read().split()]
+    except (OSError, ValueError):
+        pass
+    inodes: Set[str] = set()
+    found = False
+    for owner in pids:
+        fd_dir = f"/proc/{owner}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        found = found or owner == pid
+        for fd in fds:
+            try:
+                target = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                inodes.add(target[8:-1])
+    return inodes if found else None
+
+
+def listening_ports(proto: str = "tcp", pid: Optional[int] = None) -> Optional[Set[int]]:
+    """Ports with a listening TCP socket (or bound UDP socket), read from /proc/net
+    
+    With a pid, only sockets owned by that process (or its children) count, so
+    a port held by some other process does not look like ours. Returns None
+    when /proc/net is not available.
+    """
+    inodes = socket_inodes(pid) if pid else None
+    ports: Set[int] = set()
+    found = False
+    for path in _PROC_NET.get(proto, ()):
+        try:
+            with open(path, "r") as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        found = True
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            if proto == "tcp" and fields[3] != _TCP_LISTEN:
+                continue
+            if inodes is not None and fields[9] not in inodes:
+                continue
+            try:
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+            except (IndexError, ValueError):
+                continue
+    return ports if found else None
+
+
+def _connect_probe(port: int) -> bool:
+    for family, host in ((socket.AF_INET, "127.0.0.1"), (socket.AF_INET6, "::1")):
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as sock:
+                sock.settimeout(0.2)
+                if sock.connect_ex((host, port)) == 0:
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def ports_listening(ports: Iterable[int], proto: str = "tcp", pid: Optional[int] = None) -> bool:
+    """True once every port has a listen socket, owned by pid when one is given"""
+    ports = [int(p) for p in ports]
+    open_ports = listening_ports(proto, pid)
+    if open_ports is not None:
+        return all(p in open_ports for p in ports)
+    if proto != "tcp":
+        return False
+    return all(_connect_probe(p) for p in ports)
+
+
+def log_failure(log_path: Path, offset: int = 0) -> Optional[str]:
+    """Return the first log line after offset that reports a fatal startup error"""
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            f.seek(offset)
+            for line in f:
+                if FAILURE_PATTERN.search(line):
+                    return line.strip()
+    except OSError:
+        pass
+    return None
+
+
+def _log_tail(log_path: Path, limit: int = 500) -> str:
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            return f.read()[-limit:]
+    except OSError:
+        return "Log file not found"
+
+
+def _stop(proc: subprocess.Popen):
+    try:
+        proc.terminate()
+        proc.wait(timeout=3)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    except Exception:
+        pass
+
+
+def wait_until_ready(
+    proc: subprocess.Popen,
+    name: str,
+    log_path: Path,
+    ports: Iterable[int] = (),
+    proto: str = "tcp",
+    timeout: float = 5.0,
+    log_offset: int = 0
+) -> bool:
+    """Wait until a started process listens on its ports
+    
+    Returns True as soon as the process itself listens on every port. Raises RuntimeError as
+    soon as the process exits or logs a bind/fatal error (stopping it). If the timeout passes
+    with the process still running, logs a warning and returns False. Without
+    ports, the process only has to survive a short grace window.
+    """
+    ports = [int(p) for p in ports if p]
+    deadline = time.monotonic() + (timeout if ports else min(timeout, NO_PORT_GRACE))
+    while True:
+        exit_code = proc.poll()
+        if exit_code is not None:
+            raise RuntimeError(f"{name} failed to start (exit code: {exit_code}): {_log_tail(log_path)}")
+        
+        failure = log_failure(log_path, log_offset)
+        if failure:
+            _stop(proc)
+            raise RuntimeError(f"{name} failed to start: {failure}")
+        
+        if ports and ports_listening(ports, proto, proc.pid):
+            return True
+        
+        if time.monotonic() >= deadline:
+            if ports:
+                logger.warning(f"{name} port(s) {ports} not listening after {timeout}s, but process is running. PID: {proc.pid}")
+                return False
+            return True
+        
+        time.sleep(POLL_INTERVAL)
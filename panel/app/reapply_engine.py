@@ -0,0 +1,169 @@
+"""Bounded-concurrency engine for reapplying many tunnels"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Awaitable, Callable
+from sqlalchemy import select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Tunnel, Node
+
+logger = logging.getLogger(__name__)
+
+REVERSE_CORES = {"rathole", "backhaul", "chisel", "frp"}
+
+
+class ReapplyJob:
+    """Progress of one reapply run"""
+    
+    def __init__(self, tunnel_ids: List[str]):
+        self.id = str(uuid.uuid4())
+        self.tunnel_ids = tunnel_ids
+        self.status = "pending"
+        self.total = len(tunnel_ids)
+        self.applied = 0
+        self.failed = 0
+        self.errors: List[str] = []
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def completed(self) -> int:
+        return self.applied + self.failed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "applied": self.applied,
+            "failed": self.failed,
+            "errors": self.errors[:10],
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ReapplyEngine:
+    """Runs tunnel applies concurrently with a global and a per-node limit
+    
+    Each tunnel is still applied by a single call that pushes the server side
+    before the client side, so ordering within a tunnel is preserved while
+    different tunnels run in parallel.
+    """
+    
+    MAX_JOBS = 20
+    
+    def __init__(self, concurrency: int = 16, per_node_concurrency: int = 4):
+        self.concurrency = max(1, concurrency)
+        self.per_node_concurrency = max(1, per_node_concurrency)
+        self.jobs: "OrderedDict[str, ReapplyJob]" = OrderedDict()
+    
+    def get_job(self, job_id: str) -> Optional[ReapplyJob]:
+        return self.jobs.get(job_id)
+    
+    def _add_job(self, job: ReapplyJob):
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.MAX_JOBS:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest.status in ("pending", "running"):
+                break
+            del self.jobs[oldest_id]
+    
+    async def _resolve_node_ids(self, tunnel_ids: List[str]) -> Dict[str, List[str]]:
+        """Map each tunnel to the node ids its apply will touch"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Tunnel).where(Tunnel.id.in_(tunnel_ids)))
+            tunnels = result.scalars().all()
+            result = await session.execute(select(Node))
+            nodes = result.scalars().all()
+        
+        foreign_ids = [n.id for n in nodes if n.node_metadata and n.node_metadata.get("role") == "foreign"]
+        first_foreign = foreign_ids[0] if foreign_ids else None
+        
+        touched: Dict[str, List[str]] = {}
+        for tunnel in tunnels:
+            node_ids = set()
+            if tunnel.node_id:
+                node_ids.add(tunnel.node_id)
+            if tunnel.core in REVERSE_CORES and first_foreign:
+                node_ids.add(first_foreign)
+            touched[tunnel.id] = sorted(node_ids)
+        return touched
+    
+    def start(
+        self,
+        tunnel_ids: List[str],
+        apply_func: Callable[[str], Awaitable[Dict[str, Any]]],
+        labels: Optional[Dict[str, str]] = None
+    ) -> ReapplyJob:
+        """Start a job in the background and return it immediately"""
+        job = ReapplyJob(tunnel_ids)
+        self._add_job(job)
+        job.task = asyncio.create_task(self._run(job, apply_func, labels or {}))
+        return job
+    
+    async def _run(
+        self,
+        job: ReapplyJob,
+        apply_func: Callable[[str], Awaitable[Dict[str, Any]]],
+        labels: Dict[str, str]
+    ):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        logger.info(f"Reapply job {job.id} started: {job.total} tunnels, concurrency={self.concurrency}, per_node={self.per_node_concurrency}")
+        
+        try:
+            touched = await self._resolve_node_ids(job.tunnel_ids)
+            global_limit = asyncio.Semaphore(self.concurrency)
+            node_limits: Dict[str, asyncio.Semaphore] = {}
+            
+            async def run_one(tunnel_id: str):
+                label = labels.get(tunnel_id, tunnel_id)
+                node_ids = touched.get(tunnel_id, [])
+                semaphores = []
+                for node_id in node_ids:
+                    if node_id not in node_limits:
+                        node_limits[node_id] = asyncio.Semaphore(self.per_node_concurrency)
+                    semaphores.append(node_limits[node_id])
+                
+                async with global_limit:
+                    # Acquire node slots in sorted node order so tunnels sharing nodes cannot deadlock
+                    for semaphore in semaphores:
+                        await semaphore.acquire()
+                    try:
+                        result = await apply_func(tunnel_id)
+                        if result and result.get("status") == "applied":
+                            job.applied += 1
+                        else:
+                            job.failed += 1
+                            job.errors.append(f"Tunnel {label}: Failed to apply")
+                    except Exception as e:
+                        job.failed += 1
+                        job.errors.append(f"Tunnel {label}: {getattr(e, 'detail', None) or str(e)}")
+                    finally:
+                        for semaphore in reversed(semaphores):
+                            semaphore.release()
+            
+            await asyncio.gather(*(run_one(tunnel_id) for tunnel_id in job.tunnel_ids))
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Reapply job {job.id} failed: {e}", exc_info=True)
+            job.status = "error"
+            job.errors.append(str(e))
+        finally:
+            job.finished_at = datetime.utcnow()
+            logger.info(f"Reapply job {job.id} {job.status}: {job.applied} applied, {job.failed} failed")
+
+
+reapply_engine = ReapplyEngine(
+    concurrency=settings.reapply_concurrency,
+    per_node_concurrency=settings.reapply_per_node_concurrency,
+)
@@ -0,0 +1,344 @@
+"""Socket-level relay engines for PortForwarder
+
+Each engine copies both directions of a connection between two connected
+non-blocking sockets and half-closes the destination when the source
+reaches EOF.
+
+- splice: moves bytes kernel-side through a pipe with os.splice (Linux),
+  so the data is never copied into Python.
+- buffer: loop.sock_recv_into on one preallocated buffer per direction,
+  without per-chunk allocations or timers.
+- protocol: asyncio.BufferedProtocol pairs that receive into a reused
+  buffer and write straight to the peer transport, using transport flow
+  control instead of drain(). Fastest under uvloop (see install_uvloop).
+
+The original asyncio streams loop stays in PortForwarder as "stream".
+"""
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from app.forward_stats import ForwardStats
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("stream", "splice", "buffer", "protocol")
+
+SPLICE_CHUNK = 1 << 20
+BUFFER_SIZE = 256 * 1024
+
+
+def splice_supported() -> bool:
+    return hasattr(os, "splice") and hasattr(os, "SPLICE_F_NONBLOCK")
+
+
+def resolve_engine(name: str) -> str:
+    """The engine to use for a configured name, falling back when splice is unavailable"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown relay engine: {name}")
+    if name == "splice" and not splice_supported():
+        return "buffer"
+    return name
+
+
+def install_uvloop() -> bool:
+    """Make new event loops uvloop loops, if uvloop is installed"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def set_keepalive(sock: socket.socket):
+    """Probe an idle connection after a minute so dead peers are dropped"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class IdleTimer:
+    """Closes the connections of one forward that moved no data for timeout seconds
+    
+    Connections are added with the call that closes them, and their counters
+    are wrapped with counter() so every read stores the time of the last
+    sweep: a dict write, no clock read. One task per forward runs run() and
+    sweeps a few times per timeout.
+    """
+    
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.interval = min(5.0, timeout / 2)
+        self.now = 0.0
+        self.last_seen: Dict[Hashable, float] = {}
+        self.closers: Dict[Hashable, Callable[[], None]] = {}
+    
+    def add(self, key: Hashable, close: Callable[[], None]):
+        self.last_seen[key] = self.now
+        self.closers[key] = close
+    
+    def remove(self, key: Hashable):
+        self.last_seen.pop(key, None)
+        self.closers.pop(key, None)
+    
+    def counter(self, key: Hashable, count: Callable[[int], None]) -> Callable[[int], None]:
+        last_seen = self.last_seen
+        
+        def counted(nbytes: int):
+            count(nbytes)
+            if key in last_seen:
+                last_seen[key] = self.now
+        
+        return counted
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.now = loop.time()
+            for key, seen in list(self.last_seen.items()):
+                if self.now - seen >= self.timeout:
+                    close = self.closers.get(key)
+                    self.remove(key)
+                    if close:
+                        close()
+            await asyncio.sleep(self.interval)
+
+
+async def _wait_fd(loop: asyncio.AbstractEventLoop, fd: int, write: bool = False):
+    future = loop.create_future()
+    
+    def ready():
+        if not future.done():
+            future.set_result(None)
+    
+    if write:
+        loop.add_writer(fd, ready)
+    else:
+        loop.add_reader(fd, ready)
+    try:
+        await future
+    finally:
+        if write:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+
+def _shutdown_write(sock: socket.socket):
+    try:
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+async def _splice_one_way(loop: asyncio.AbstractEventLoop, src: socket.socket, dst: socket.socket, count: Callable[[int], None]) -> int:
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    pipe_r, pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    total = 0
+    try:
+        while True:
+            try:
+                received = os.splice(src_fd, pipe_w, SPLICE_CHUNK, flags=flags)
+            except BlockingIOError:
+                await _wait_fd(loop, src_fd)
+                continue
+            if received == 0:
+                break
+            pending = received
+            while pending:
+                try:
+                    pending -= os.splice(pipe_r, dst_fd, pending, flags=flags)
+                except BlockingIOError:
+                    await _wait_fd(loop, dst_fd, write=True)
+            total += received
+            count(received)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+    _shutdown_write(dst)
+    return total
+
+
+async def _buffer_one_way(loop: asyncio.AbstractEventLoop, src: socket.socket, dst: socket.socket, count: Callable[[int], None]) -> int:
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        received = await loop.sock_recv_into(src, buffer)
+        if received == 0:
+            break
+        await loop.sock_sendall(dst, view[:received])
+        total += received
+        count(received)
+    _shutdown_write(dst)
+    return total
+
+
+async def relay(client: socket.socket, remote: socket.socket, engine: str, stats: ForwardStats, idle: Optional[IdleTimer] = None):
+    """Copy data both ways until both sides are done or either fails
+    
+    Returns the bytes moved (client->remote, remote->client) and counts them
+    in stats as they go. A direction that fails counts as a relay error. With
+    an idle timer, the calling task is cancelled once the connection idles.
+    The sockets are left open; closing them is up to the caller.
+    """
+    loop = asyncio.get_running_loop()
+    one_way = _splice_one_way if engine == "splice" else _buffer_one_way
+    count_in, count_out = stats.add_in, stats.add_out
+    if idle:
+        key = asyncio.current_task()
+        idle.add(key, key.cancel)
+        count_in, count_out = idle.counter(key, count_in), idle.counter(key, count_out)
+    upstream = asyncio.ensure_future(one_way(loop, client, remote, count_in))
+    downstream = asyncio.ensure_future(one_way(loop, remote, client, count_out))
+    try:
+        done, pending = await asyncio.wait({upstream, downstream}, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if any(_result(task) is None for task in done):
+            stats.relay_errors += 1
+    except asyncio.CancelledError:
+        upstream.cancel()
+        downstream.cancel()
+        await asyncio.gather(upstream, downstream, return_exceptions=True)
+        raise
+    finally:
+        if idle:
+            idle.remove(key)
+    return _result(upstream), _result(downstream)
+
+
+def _result(task: asyncio.Future) -> Optional[int]:
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+
+class RelayProtocol(asyncio.BufferedProtocol):
+    """One side of a relayed connection
+    
+    Received bytes are written to the peer's transport from a buffer that is
+    reused for every read. When the peer's transport is over its high-water
+    mark it calls pause_writing here, and reading from the other side pauses
+    until it drains. count is called with the size of every read.
+    """
+    
+    def __init__(self, count: Callable[[int], None], peer: Optional["RelayProtocol"] = None):
+        self.transport: Optional[asyncio.Transport] = None
+        self.count = count
+        self.peer = peer
+        self.buffer = memoryview(bytearray(BUFFER_SIZE))
+        self.eof = False
+        # Bytes received before the peer was connected (uvloop may read before pause_reading applies)
+        self.early: List[bytes] = []
+    
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        # Room for a few full reads before the peer side is paused
+        transport.set_write_buffer_limits(high=4 * BUFFER_SIZE)
+        if self.peer:
+            # Target side: pair up before any data can arrive, then let the client side read
+            if self.peer.transport.is_closing():
+                transport.close()
+                return
+            self.peer.peer = self
+            for data in self.peer.early:
+                transport.write(data)
+            self.peer.early.clear()
+            if self.peer.eof:
+                transport.write_eof()
+            self.peer.transport.resume_reading()
+    
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.buffer
+    
+    def buffer_updated(self, nbytes: int):
+        self.count(nbytes)
+        if self.peer is None:
+            self.early.append(bytes(self.buffer[:nbytes]))
+            return
+        peer_transport = self.peer.transport
+        peer_transport.write(self.buffer[:nbytes])
+        if peer_transport.get_write_buffer_size():
+            # The transport may keep a reference to the unsent part; stop reusing that buffer
+            self.buffer = memoryview(bytearray(BUFFER_SIZE))
+    
+    def eof_received(self) -> bool:
+        self.eof = True
+        if self.peer and self.peer.transport:
+            if self.peer.eof:
+                self.peer.transport.close()
+                self.transport.close()
+            elif self.peer.transport.can_write_eof():
+                self.peer.transport.write_eof()
+        return True
+    
+    def connection_lost(self, exc: Optional[Exception]):
+        if self.peer and self.peer.transport:
+            self.peer.transport.close()
+    
+    def pause_writing(self):
+        if self.peer and self.peer.transport:
+            self.peer.transport.pause_reading()
+    
+    def resume_writing(self):
+        if self.peer and self.peer.transport:
+            self.peer.transport.resume_reading()
+
+
+class ClientRelayProtocol(RelayProtocol):
+    """Accepted side of a relayed connection; connects to the target when it arrives
+    
+    connect returns a connected non-blocking socket to the target, or raises
+    after logging and counting the failure. With an idle timer, the pair is
+    closed once neither side has sent anything for its timeout.
+    """
+    
+    def __init__(self, connect: Callable[[], Awaitable[socket.socket]], stats: ForwardStats, connects: Set[asyncio.Task], idle: Optional[IdleTimer] = None):
+        self.idle = idle
+        self.count_out = idle.counter(self, stats.add_out) if idle else stats.add_out
+        super().__init__(idle.counter(self, stats.add_in) if idle else stats.add_in)
+        self.connect = connect
+        self.stats = stats
+        self.connects = connects
+    
+    def connection_made(self, transport: asyncio.Transport):
+        super().connection_made(transport)
+        self.stats.opened()
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            set_keepalive(sock)
+        if self.idle:
+            self.idle.add(self, transport.close)
+        # Nothing can be relayed until the target is connected
+        transport.pause_reading()
+        task = asyncio.get_running_loop().create_task(self._connect())
+        self.connects.add(task)
+        task.add_done_callback(self.connects.discard)
+    
+    def connection_lost(self, exc: Optional[Exception]):
+        self.stats.closed()
+        if self.idle:
+            self.idle.remove(self)
+        if exc is not None:
+            self.stats.relay_errors += 1
+        super().connection_lost(exc)
+    
+    async def _connect(self):
+        try:
+            sock = await self.connect()
+        except Exception:
+            self.transport.close()
+            return
+        try:
+            await asyncio.get_running_loop().create_connection(lambda: RelayProtocol(self.count_out, peer=self), sock=sock)
+        except Exception as e:
+            sock.close()
+            logger.warning(f"Failed to set up relay connection: {e}")
+            self.transport.close()
@@ -1,17 +1,20 @@
 """Core Health and Reset API endpoints"""
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 import logging
 import asyncio
-import httpx
 
 from app.database import get_db
 from app.models import Tunnel, Node, CoreResetConfig
 from app.node_client import NodeClient
+from app.node_health import node_health_poller
+from app.core_supervisor import core_supervisor
+from app.node_index import NodeIndex
+from app.config import settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -23,6 +26,7 @@ class CoreHealthResponse(BaseModel):
     core: str
     nodes_status: Dict[str, Dict[str, Any]]  # Iran nodes
     servers_status: Dict[str, Dict[str, Any]]  # Foreign servers
+    active_tunnels: int = 0
 
 
 class ResetConfigResponse(BaseModel):
@@ -39,124 +43,56 @@ class ResetConfigUpdate(BaseModel):
 
 
 @router.get("/health", response_model=List[CoreHealthResponse])
-async def get_core_health(request: Request, db: AsyncSession = Depends(get_db)):
-    """Get health status for all cores"""
-    health_data = []
+async def get_core_health(request: Request, refresh: bool = False, db: AsyncSession = Depends(get_db)):
+    """Get health status for all cores
     
+    Node state comes from the health poller snapshot. With refresh=true every
+    node is probed live exactly once before the per-core views are built.
+    """
     result = await db.execute(select(Node))
     all_nodes = result.scalars().all()
     
     iran_nodes_all = {n.id: n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "iran"}
     foreign_nodes_all = {n.id: n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "foreign"}
     
-    for core in CORES:
-        result = await db.execute(select(Tunnel).where(Tunnel.core == core, Tunnel.status == "active"))
-        active_tunnels = result.scalars().all()
-        
-        node_ids = set(t.node_id for t in active_tunnels if t.node_id)
-        
-        for tunnel in active_tunnels:
-            if tunnel.spec and tunnel.spec.get("foreign_node_id"):
-                node_ids.add(tunnel.spec.get("foreign_node_id"))
-        
-        iran_nodes = {}
-        foreign_nodes = {}
-        
-        client = NodeClient()
-        
-        async def check_iran_node(node_id, node):
-            connection_status = {
-                "status": "failed",
-                "error_message": None
-            }
-            
-            try:
-                response = await client.get_tunnel_status(node_id, "")
-                if response and response.get("status") == "ok":
-                    connection_status["status"] = "connected"
-                else:
-                    error_msg = response.get("message", "Node disconnected") if response else "Node not responding"
-                    if "timeout" in error_msg.lower() or "connection" in error_msg.lower():
-                        connection_status["status"] = "reconnecting"
-                    else:
-                        connection_status["status"] = "failed"
-                    connection_status["error_message"] = error_msg
-            except httpx.ConnectError:
-                connection_status["status"] = "connecting"
-                connection_status["error_message"] = "Connecting to node..."
-            except httpx.TimeoutException:
-                connection_status["status"] = "reconnecting"
-                connection_status["error_message"] = "Connection timeout"
-            except Exception as e:
-                logger.error(f"Error checking {core} node {node_id} health: {e}")
-                connection_status["status"] = "failed"
-                connection_status["error_message"] = str(e)
-            
-            return {
-                "id": node_id,
-                "name": node.name,
-                "role": "iran",
-                **connection_status
-            }
-        
-        async def check_foreign_node(node_id, node):
-            connection_status = {
-                "status": "failed",
-                "error_message": None
-            }
-            
-            try:
-                response = await client.get_tunnel_status(node_id, "")
-                if response and response.get("status") == "ok":
-                    connection_status["status"] = "connected"
-                else:
-                    error_msg = response.get("message", "Node disconnected") if response else "Node not responding"
-                    if "timeout" in error_msg.lower() or "connection" in error_msg.lower():
-                        connection_status["status"] = "reconnecting"
-                    else:
-                        connection_status["status"] = "failed"
-                    connection_status["error_message"] = error_msg
-            except httpx.ConnectError:
-                connection_status["status"] = "connecting"
-                connection_status["error_message"] = "Connecting to node..."
-            except httpx.TimeoutException:
-                connection_status["status"] = "reconnecting"
-                connection_status["error_message"] = "Connection timeout"
-            except Exception as e:
-                logger.error(f"Error checking {core} node {node_id} health: {e}")
-                connection_status["status"] = "failed"
-                connection_status["error_message"] = str(e)
-            
-            return {
-                "id": node_id,
-                "name": node.name,
-                "role": "foreign",
-                **connection_status
-            }
-        
-        iran_tasks = [check_iran_node(node_id, node) for node_id, node in iran_nodes_all.items()]
-        foreign_tasks = [check_foreign_node(node_id, node) for node_id, node in foreign_nodes_all.items()]
-        
-        iran_results = await asyncio.gather(*iran_tasks, return_exceptions=True)
-        foreign_results = await asyncio.gather(*foreign_tasks, return_exceptions=True)
-        
-        for result in iran_results:
-            if isinstance(result, Exception):
-                continue
-            iran_nodes[result["id"]] = result
-        
-        for result in foreign_results:
-            if isinstance(result, Exception):
-                continue
-            foreign_nodes[result["id"]] = result
-        
-        health_data.append(CoreHealthResponse(
+    if refresh:
+        await node_health_poller.probe_nodes(list(iran_nodes_all) + list(foreign_nodes_all))
+    
+    def node_status(node_id: str, node: Node, role: str) -> Dict[str, Any]:
+        health = node_health_poller.get(node_id)
+        return {
+            "id": node_id,
+            "name": node.name,
+            "role": role,
+            "status": health["status"],
+            "error_message": health["error_message"]
+        }
+    
+    iran_nodes = {node_id: node_status(node_id, node, "iran") for node_id, node in iran_nodes_all.items()}
+    foreign_nodes = {node_id: node_status(node_id, node, "foreign") for node_id, node in foreign_nodes_all.items()}
+    
+    result = await db.execute(
+        select(Tunnel.core, func.count(Tunnel.id))
+        .where(Tunnel.core.in_(CORES), Tunnel.status == "active")
+        .group_by(Tunnel.core)
+    )
+    tunnel_counts = {core: count for core, count in result.all()}
+    
+    return [
+        CoreHealthResponse(
             core=core,
             nodes_status=iran_nodes,
-            servers_status=foreign_nodes
-        ))
-    
-    return health_data
+            servers_status=foreign_nodes,
+            active_tunnels=tunnel_counts.get(core, 0)
+        )
+        for core in CORES
+    ]
+
+
+@router.get("/restarts")
+async def get_core_restarts():
+    """Crash-restart counters of the core processes running on the panel"""
+    return core_supervisor.get_stats()
 
 
 @router.get("/reset-config", response_model=List[ResetConfigResponse])
@@ -285,36 +221,12 @@ async def _reset_core(core: str, app_or_request, db: AsyncSession):
     active_tunnels = result.scalars().all()
     
     client = NodeClient()
+    nodes = await NodeIndex.load(db)
+    restarts = []
     
     for tunnel in active_tunnels:
         try:
-            iran_node = None
-            foreign_node = None
-            
-            if tunnel.node_id:
-                result = await db.execute(select(Node).where(Node.id == tunnel.node_id))
-                iran_node = result.scalar_one_or_none()
-                if iran_node and iran_node.node_metadata.get("role") != "iran":
-                    foreign_node = iran_node
-                    iran_node = None
-            
-            if not foreign_node:
-                result = await db.execute(select(Node))
-                all_nodes = result.scalars().all()
-                foreign_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "foreign"]
-                if foreign_nodes:
-                    foreign_node = foreign_nodes[0]
-            
-            if not iran_node:
-                if tunnel.node_id:
-                    result = await db.execute(select(Node).where(Node.id == tunnel.node_id))
-                    iran_node = result.scalar_one_or_none()
-                if not iran_node:
-                    result = await db.execute(select(Node))
-                    all_nodes = result.scalars().all()
-                    iran_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "iran"]
-                    if iran_nodes:
-                        iran_node = iran_nodes[0]
+            iran_node, foreign_node = nodes.reverse_pair(tunnel)
             
             if not foreign_node or not iran_node:
                 logger.warning(f"Tunnel {tunnel.id}: Missing foreign or iran node, skipping reset")
@@ -468,50 +380,58 @@ async def _reset_core(core: str, app_or_request, db: AsyncSession):
                 if token:
                     client_spec["token"] = token
             
-            if not iran_node.node_metadata.get("api_address"):
-                iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
-                await db.commit()
-            
-            logger.info(f"Restarting tunnel {tunnel.id}: applying server config to iran node {iran_node.id}")
-            server_response = await client.send_to_node(
-                node_id=iran_node.id,
-                endpoint="/api/agent/tunnels/apply",
-                data={
-                    "tunnel_id": tunnel.id,
-                    "core": core,
-                    "type": tunnel.type,
-                    "spec": server_spec
-                }
-            )
-            
-            if server_response.get("status") == "error":
-                error_msg = server_response.get("message", "Unknown error from iran node")
-                logger.error(f"Failed to restart tunnel {tunnel.id} on iran node {iran_node.id}: {error_msg}")
-                continue
-            
-            if not foreign_node.node_metadata.get("api_address"):
-                foreign_node.node_metadata["api_address"] = f"http://{foreign_node.node_metadata.get('ip_address', foreign_node.fingerprint)}:{foreign_node.node_metadata.get('api_port', 8888)}"
-                await db.commit()
-            
-            logger.info(f"Restarting tunnel {tunnel.id}: applying client config to foreign node {foreign_node.id}")
-            client_response = await client.send_to_node(
-                node_id=foreign_node.id,
-                endpoint="/api/agent/tunnels/apply",
-                data={
-                    "tunnel_id": tunnel.id,
-                    "core": core,
-                    "type": tunnel.type,
-                    "spec": client_spec
-                }
-            )
-            
-            if client_response.get("status") == "error":
-                error_msg = client_response.get("message", "Unknown error from foreign node")
-                logger.error(f"Failed to restart tunnel {tunnel.id} on foreign node {foreign_node.id}: {error_msg}")
-            else:
-                logger.info(f"Successfully restarted tunnel {tunnel.id} on both nodes")
-            
-            await asyncio.sleep(0.5)
+            nodes.ensure_api_address(iran_node)
+            nodes.ensure_api_address(foreign_node)
+            restarts.append((tunnel, iran_node, foreign_node, server_spec, client_spec))
         except Exception as e:
             logger.error(f"Failed to restart tunnel {tunnel.id}: {e}", exc_info=True)
 
+    await nodes.save(db)
+    
+    semaphore = asyncio.Semaphore(settings.reapply_concurrency)
+    
+    async def restart(tunnel: Tunnel, iran_node: Node, foreign_node: Node, server_spec: Dict[str, Any], client_spec: Dict[str, Any]):
+        """Apply the server side first, then the client that connects to it"""
+        async with semaphore:
+            try:
+                logger.info(f"Restarting tunnel {tunnel.id}: applying server config to iran node {iran_node.id}")
+                server_response = await client.send_to_node(
+                    node_id=iran_node.id,
+                    endpoint="/api/agent/tunnels/apply",
+                    data={
+                        "tunnel_id": tunnel.id,
+                        "core": core,
+                        "type": tunnel.type,
+                        "spec": server_spec,
+                        "revision": tunnel.revision
+                    }
+                )
+                
+                if server_response.get("status") == "error":
+                    error_msg = server_response.get("message", "Unknown error from iran node")
+                    logger.error(f"Failed to restart tunnel {tunnel.id} on iran node {iran_node.id}: {error_msg}")
+                    return
+                
+                logger.info(f"Restarting tunnel {tunnel.id}: applying client config to foreign node {foreign_node.id}")
+                client_response = await client.send_to_node(
+                    node_id=foreign_node.id,
+                    endpoint="/api/agent/tunnels/apply",
+                    data={
+                        "tunnel_id": tunnel.id,
+                        "core": core,
+                        "type": tunnel.type,
+                        "spec": client_spec,
+                        "revision": tunnel.revision
+                    }
+                )
+                
+                if client_response.get("status") == "error":
+                    error_msg = client_response.get("message", "Unknown error from foreign node")
+                    logger.error(f"Failed to restart tunnel {tunnel.id} on foreign node {foreign_node.id}: {error_msg}")
+                else:
+                    logger.info(f"Successfully restarted tunnel {tunnel.id} on both nodes")
+            except Exception as e:
+                logger.error(f"Failed to restart tunnel {tunnel.id}: {e}", exc_info=True)
+    
+    await asyncio.gather(*(restart(*args) for args in restarts))
+
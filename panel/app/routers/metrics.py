@@ -0,0 +1,71 @@
+"""Prometheus metrics endpoint"""
+import time
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from sqlalchemy import select, func
+
+from app.database import AsyncSessionLocal
+from app.models import Tunnel
+from app.core_supervisor import core_supervisor
+from app.port_forwarder import port_forwarder
+from app.forward_stats import render_prometheus as render_forwards
+from app.metrics import registry, render_metric, loop_lag_monitor, PROMETHEUS_CONTENT_TYPE
+
+
+router = APIRouter()
+
+TUNNEL_COUNTS_TTL = 15.0
+
+
+class TunnelCounts:
+    """Tunnel counts by core and status, from one grouped query at most every TTL seconds"""
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.loaded_at = 0.0
+    
+    async def get(self) -> Dict[Tuple[str, str], int]:
+        if time.monotonic() - self.loaded_at >= self.ttl:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Tunnel.core, Tunnel.status, func.count(Tunnel.id)).group_by(Tunnel.core, Tunnel.status)
+                )
+                self.counts = {(core, status): count for core, status, count in result.all()}
+            self.loaded_at = time.monotonic()
+        return self.counts
+
+
+tunnel_counts = TunnelCounts(TUNNEL_COUNTS_TTL)
+
+
+def _core_process_lines() -> List[str]:
+    processes: Dict[Tuple[str, str], int] = {}
+    restarts: Dict[str, int] = {}
+    for key, entry in core_supervisor.entries.items():
+        core = key.split(":", 1)[0]
+        state = "running" if entry.proc is not None and entry.proc.poll() is None else "stopped"
+        processes[(core, state)] = processes.get((core, state), 0) + 1
+        restarts[core] = restarts.get(core, 0) + entry.restart_count
+    return render_metric(
+        "smite_core_processes", "gauge", "Supervised panel-side core processes",
+        [("", (("core", core), ("state", state)), count) for (core, state), count in sorted(processes.items())]
+    ) + render_metric(
+        "smite_core_restarts_total", "counter", "Crash restarts of supervised core processes",
+        [("", (("core", core),), count) for core, count in sorted(restarts.items())]
+    )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Panel metrics in Prometheus text format"""
+    counts = await tunnel_counts.get()
+    lines = registry.render() + loop_lag_monitor.render() + _core_process_lines()
+    lines += render_metric(
+        "smite_tunnels", "gauge", "Tunnels by core and status",
+        [("", (("core", core), ("status", status)), count) for (core, status), count in counts.items()]
+    )
+    text = "\n".join(lines) + "\n" + render_forwards(await port_forwarder.get_stats())
+    return Response(text, media_type=PROMETHEUS_CONTENT_TYPE)
@@ -2,15 +2,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel
-import httpx
 import logging
 
 from app.database import get_db
 from app.models import Node, Settings
-from app.node_client import NodeClient
+from app.node_client import node_routes, node_apply_batcher, node_pool
+from app.node_health import node_health_poller
+from app.usage_recorder import usage_recorder
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +79,9 @@ async def create_node(node: NodeCreate, db: AsyncSession = Depends(get_db)):
         existing.node_metadata["role"] = existing_role
         await db.commit()
         await db.refresh(existing)
+        node_routes.invalidate_node(existing.id)
+        # The node may have been upgraded since it last registered
+        node_apply_batcher.forget(existing.id)
         
         response_metadata = existing.node_metadata.copy() if existing.node_metadata else {}
         
@@ -121,6 +125,8 @@ async def create_node(node: NodeCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_node)
     await db.commit()
     await db.refresh(db_node)
+    node_routes.invalidate_node(db_node.id)
+    node_health_poller.trigger()
     
     response_metadata = db_node.node_metadata.copy() if db_node.node_metadata else {}
     
@@ -158,49 +164,23 @@ async def create_node(node: NodeCreate, db: AsyncSession = Depends(get_db)):
 
 @router.get("", response_model=List[NodeResponse])
 async def list_nodes(db: AsyncSession = Depends(get_db)):
-    """List all nodes with connection state"""
-    import asyncio
+    """List all nodes with connection state from the health poller snapshot"""
     result = await db.execute(select(Node))
     nodes = result.scalars().all()
     
-    client = NodeClient()
-    node_responses = []
-    
-    async def check_node_status(node):
-        connection_status = "failed"
-        try:
-            response = await client.get_tunnel_status(node.id, "")
-            if response and response.get("status") == "ok":
-                connection_status = "connected"
-            else:
-                error_msg = response.get("message", "Node disconnected") if response else "Node not responding"
-                if "timeout" in error_msg.lower() or "connection" in error_msg.lower():
-                    if node.node_metadata and node.node_metadata.get("frp_connected"):
-                        connection_status = "connected"
-                    else:
-                        connection_status = "reconnecting"
-                else:
-                    connection_status = "failed"
-        except httpx.ConnectError:
-            if node.node_metadata and node.node_metadata.get("frp_connected"):
-                connection_status = "connected"
-            else:
-                connection_status = "connecting"
-        except httpx.TimeoutException:
-            if node.node_metadata and node.node_metadata.get("frp_connected"):
-                connection_status = "connected"
-            else:
-                connection_status = "reconnecting"
-        except Exception:
-            if node.node_metadata and node.node_metadata.get("frp_connected"):
-                connection_status = "connected"
-            else:
-                connection_status = "failed"
+    results = []
+    for node in nodes:
+        health = node_health_poller.get(node.id)
+        connection_status = health["status"]
+        if connection_status in ("connecting", "reconnecting") and node.node_metadata and node.node_metadata.get("frp_connected"):
+            connection_status = "connected"
         
         metadata = node.node_metadata.copy() if node.node_metadata else {}
         metadata["connection_status"] = connection_status
+        metadata["last_success"] = health["last_success"]
+        metadata["latency_ms"] = health["latency_ms"]
         
-        return NodeResponse(
+        results.append(NodeResponse(
             id=node.id,
             name=node.name,
             fingerprint=node.fingerprint,
@@ -208,28 +188,7 @@ async def list_nodes(db: AsyncSession = Depends(get_db)):
             registered_at=node.registered_at,
             last_seen=node.last_seen,
             metadata=metadata
-        )
-    
-    tasks = [check_node_status(node) for node in nodes]
-    node_responses = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    results = []
-    for i, response in enumerate(node_responses):
-        if isinstance(response, Exception):
-            node = nodes[i]
-            metadata = node.node_metadata.copy() if node.node_metadata else {}
-            metadata["connection_status"] = "failed"
-            results.append(NodeResponse(
-                id=node.id,
-                name=node.name,
-                fingerprint=node.fingerprint,
-                status=node.status,
-                registered_at=node.registered_at,
-                last_seen=node.last_seen,
-                metadata=metadata
-            ))
-        else:
-            results.append(response)
+        ))
     
     return results
 
@@ -279,9 +238,26 @@ async def update_frp_status(node_id: str, frp_status: dict, db: AsyncSession = D
     
     await db.commit()
     await db.refresh(node)
+    node_routes.invalidate_node(node_id)
     return {"status": "success"}
 
 
+class UsageReport(BaseModel):
+    batch_id: Optional[str] = None
+    samples: Dict[str, int]
+
+
+@router.post("/{node_id}/usage")
+async def report_usage(node_id: str, report: UsageReport, db: AsyncSession = Depends(get_db)):
+    """Record per-tunnel traffic deltas uploaded by a node"""
+    result = await db.execute(select(Node.id).where(Node.id == node_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    recorded = await usage_recorder.record(node_id, report.samples, report.batch_id)
+    return {"status": "success", "recorded": recorded}
+
+
 @router.delete("/{node_id}")
 async def delete_node(node_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a node"""
@@ -292,5 +268,8 @@ async def delete_node(node_id: str, db: AsyncSession = Depends(get_db)):
     
     await db.delete(node)
     await db.commit()
+    node_routes.invalidate_node(node_id)
+    node_apply_batcher.forget(node_id)
+    await node_pool.drop_node(node_id)
     return {"status": "deleted"}
 
@@ -79,6 +79,7 @@ async def get_settings(db: AsyncSession = Depends(get_db)):
 async def update_settings(settings_update: SettingsUpdate, request: Request, db: AsyncSession = Depends(get_db)):
     """Update settings"""
     from app.frp_comm_manager import frp_comm_manager
+    from app.node_client import node_routes
     
     if settings_update.frp:
         result = await db.execute(select(Settings).where(Settings.key == "frp"))
@@ -102,6 +103,7 @@ async def update_settings(settings_update: SettingsUpdate, request: Request, db:
         
         await db.commit()
         await db.refresh(setting)
+        node_routes.invalidate_frp()
         
         if new_enabled and not old_enabled:
             try:
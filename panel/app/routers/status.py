@@ -1,17 +1,27 @@
 """Status API endpoints"""
 from fastapi import APIRouter, Depends
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 import psutil
 
 from app.database import get_db
 from app.models import Tunnel, Node
+from app.node_client import node_pool
+from app.migrations import migration_runner
+from app.startup_restore import startup_restore
+from app.port_forwarder import port_forwarder
+from app.forward_stats import render_prometheus
+from app.metrics import PROMETHEUS_CONTENT_TYPE
 
 
 router = APIRouter()
 
 VERSION = "0.1.0"
 
+# cpu_percent(interval=None) reports usage since the previous call; prime it so the first request is meaningful
+psutil.cpu_percent(interval=None)
+
 
 @router.get("/version")
 async def get_version():
@@ -83,10 +93,44 @@ async def get_version():
     return {"version": version}
 
 
+@router.get("/node-pool")
+async def get_node_pool_metrics():
+    """Get panel-to-node connection pool metrics"""
+    return node_pool.metrics()
+
+
+@router.get("/migrations")
+async def get_migration_status():
+    """Get schema version and background backfill progress"""
+    return await migration_runner.get_status()
+
+
+@router.get("/restore")
+async def get_restore_status():
+    """Get progress of the tunnel restore that runs after panel startup"""
+    return startup_restore.get_status()
+
+
+@router.get("/forwards")
+async def get_forward_stats():
+    """Get connection, byte and dial counters of panel-side port forwards"""
+    return {
+        "engine": port_forwarder.engine,
+        "workers": port_forwarder.pool.get_stats() if port_forwarder.pool else [],
+        "forwards": await port_forwarder.get_stats(),
+    }
+
+
+@router.get("/forwards/metrics")
+async def get_forward_metrics():
+    """Get port forward counters in Prometheus text format"""
+    return Response(render_prometheus(await port_forwarder.get_stats()), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @router.get("")
 async def get_status(db: AsyncSession = Depends(get_db)):
     """Get system status"""
-    cpu_percent = psutil.cpu_percent(interval=1)
+    cpu_percent = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory()
     
     tunnel_result = await db.execute(select(func.count(Tunnel.id)))
@@ -1,16 +1,21 @@
 """Tunnels API endpoints"""
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
-from datetime import datetime
+from sqlalchemy.orm.attributes import flag_modified
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
+import asyncio
 import logging
 import time
 
-from app.database import get_db
+from app.database import get_db, AsyncSessionLocal
 from app.models import Tunnel, Node
-from app.node_client import NodeClient
+from app.node_client import NodeClient, node_routes
+from app.reapply_engine import reapply_engine
+from app.usage_rollup import usage_rollup_manager
+from app.quota_enforcer import quota_enforcer, limit_reason
 
 
 router = APIRouter()
@@ -96,11 +101,15 @@ class TunnelCreate(BaseModel):
     foreign_node_id: str | None = None  # For reverse tunnels: foreign node (server side)
     iran_node_id: str | None = None  # For reverse tunnels: iran node (client side)
     spec: dict
+    quota_mb: float = 0.0  # 0 means unlimited
+    expires_at: datetime | None = None
 
 
 class TunnelUpdate(BaseModel):
     name: str | None = None
     spec: dict | None = None
+    quota_mb: float | None = None
+    expires_at: datetime | None = None  # Send null explicitly to clear
 
 
 class TunnelResponse(BaseModel):
@@ -117,6 +126,7 @@ class TunnelResponse(BaseModel):
     revision: int
     used_mb: float = 0.0
     quota_mb: float = 0.0
+    expires_at: datetime | None = None
     created_at: datetime
     updated_at: datetime
     
@@ -124,6 +134,12 @@ class TunnelResponse(BaseModel):
         from_attributes = True
 
 
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 def parse_ports_from_spec(spec: dict) -> list:
     """Parse ports from spec - supports both comma-separated string and list formats"""
     ports = spec.get("ports", [])
@@ -226,6 +242,8 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
         foreign_node_id=foreign_node_id_to_store,
         iran_node_id=iran_node_id_to_store,
         spec=tunnel.spec,
+        quota_mb=tunnel.quota_mb,
+        expires_at=_naive_utc(tunnel.expires_at),
         status="pending"
     )
     db.add(db_tunnel)
@@ -515,7 +533,9 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
             
             if not iran_node.node_metadata.get("api_address"):
                 iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
+                flag_modified(iran_node, "node_metadata")
                 await db.commit()
+                node_routes.invalidate_node(iran_node.id)
             
             logger.info(f"Applying server config to iran node {iran_node.id} for tunnel {db_tunnel.id}")
             server_response = await client.send_to_node(
@@ -525,7 +545,8 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
                     "tunnel_id": db_tunnel.id,
                     "core": db_tunnel.core,
                     "type": db_tunnel.type,
-                    "spec": server_spec
+                    "spec": server_spec,
+                    "revision": db_tunnel.revision
                 }
             )
             
@@ -540,7 +561,9 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
             
             if not foreign_node.node_metadata.get("api_address"):
                 foreign_node.node_metadata["api_address"] = f"http://{foreign_node.node_metadata.get('ip_address', foreign_node.fingerprint)}:{foreign_node.node_metadata.get('api_port', 8888)}"
+                flag_modified(foreign_node, "node_metadata")
                 await db.commit()
+                node_routes.invalidate_node(foreign_node.id)
             
             logger.info(f"Applying client config to foreign node {foreign_node.id} for tunnel {db_tunnel.id}")
             client_response = await client.send_to_node(
@@ -550,7 +573,8 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
                     "tunnel_id": db_tunnel.id,
                     "core": db_tunnel.core,
                     "type": db_tunnel.type,
-                    "spec": client_spec
+                    "spec": client_spec,
+                    "revision": db_tunnel.revision
                 }
             )
             
@@ -581,6 +605,7 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
             
             await db.commit()
             await db.refresh(db_tunnel)
+            quota_enforcer.track(db_tunnel)
             return db_tunnel
         
         
@@ -759,7 +784,9 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
             client = NodeClient()
             if not node.node_metadata.get("api_address"):
                 node.node_metadata["api_address"] = f"http://{node.node_metadata.get('ip_address', node.fingerprint)}:{node.node_metadata.get('api_port', 8888)}"
+                flag_modified(node, "node_metadata")
                 await db.commit()
+                node_routes.invalidate_node(node.id)
             
             spec_for_node = db_tunnel.spec.copy() if db_tunnel.spec else {}
             
@@ -832,7 +859,8 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
                     "tunnel_id": db_tunnel.id,
                     "core": db_tunnel.core,
                     "type": db_tunnel.type,
-                    "spec": spec_for_node
+                    "spec": spec_for_node,
+                    "revision": db_tunnel.revision
                 }
             )
             
@@ -954,7 +982,9 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
                     client = NodeClient()
                     if not iran_node.node_metadata.get("api_address"):
                         iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
+                        flag_modified(iran_node, "node_metadata")
                         await db.commit()
+                        node_routes.invalidate_node(iran_node.id)
                     
                     logger.info(f"Applying GOST forwarding to Iran node {iran_node.id} for tunnel {db_tunnel.id}: {db_tunnel.type} with ports {ports} -> {remote_ip}")
                     response = await client.send_to_node(
@@ -964,7 +994,8 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
                             "tunnel_id": db_tunnel.id,
                             "core": "gost",
                             "type": db_tunnel.type,
-                            "spec": gost_spec
+                            "spec": gost_spec,
+                            "revision": db_tunnel.revision
                         }
                     )
                     
@@ -1063,6 +1094,7 @@ async def create_tunnel(tunnel: TunnelCreate, request: Request, db: AsyncSession
         await db.commit()
         await db.refresh(db_tunnel)
     
+    quota_enforcer.track(db_tunnel)
     return db_tunnel
 
 
@@ -1084,6 +1116,37 @@ async def get_tunnel(tunnel_id: str, db: AsyncSession = Depends(get_db)):
     return tunnel
 
 
+MAX_USAGE_POINTS = 5000
+
+
+@router.get("/{tunnel_id}/usage")
+async def get_tunnel_usage(
+    tunnel_id: str,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    step: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get tunnel traffic over time in step-second buckets (defaults to the last 24 hours)"""
+    result = await db.execute(select(Tunnel.id).where(Tunnel.id == tunnel_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Tunnel not found")
+    
+    end = _naive_utc(to) or datetime.utcnow()
+    start = _naive_utc(from_) or end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if step is None:
+        span = end - start
+        step = 60 if span <= timedelta(hours=6) else 3600 if span <= timedelta(days=7) else 86400
+    if step < 60 or step % 60:
+        raise HTTPException(status_code=400, detail="step must be a multiple of 60 seconds")
+    if (end - start).total_seconds() / step > MAX_USAGE_POINTS:
+        raise HTTPException(status_code=400, detail=f"Range too large for step {step}s (max {MAX_USAGE_POINTS} points)")
+    
+    return await usage_rollup_manager.query(tunnel_id, start, end, step)
+
+
 @router.put("/{tunnel_id}", response_model=TunnelResponse)
 async def update_tunnel(
     tunnel_id: str,
@@ -1110,6 +1173,10 @@ async def update_tunnel(
             ports = tunnel_update.spec.get("ports", [])
             logger.info(f"Backhaul tunnel update {tunnel_id}: preserving ports from update: {ports} (count: {len(ports) if isinstance(ports, list) else 'N/A'})")
         tunnel.spec = tunnel_update.spec
+    if tunnel_update.quota_mb is not None:
+        tunnel.quota_mb = tunnel_update.quota_mb
+    if "expires_at" in tunnel_update.model_fields_set:
+        tunnel.expires_at = _naive_utc(tunnel_update.expires_at)
     
     tunnel.revision += 1
     tunnel.updated_at = datetime.utcnow()
@@ -1280,7 +1347,8 @@ async def update_tunnel(
                                     "tunnel_id": tunnel.id,
                                     "core": tunnel.core,
                                     "type": tunnel.type,
-                                    "spec": spec_for_node
+                                    "spec": spec_for_node,
+                                    "revision": tunnel.revision
                                 }
                             )
                             
@@ -1314,6 +1382,7 @@ async def update_tunnel(
             await db.commit()
             await db.refresh(tunnel)
     
+    quota_enforcer.track(tunnel)
     return tunnel
 
 
@@ -1325,6 +1394,10 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
     if not tunnel:
         raise HTTPException(status_code=404, detail="Tunnel not found")
     
+    reason = limit_reason(tunnel)
+    if reason:
+        raise HTTPException(status_code=409, detail=f"Tunnel cannot be applied: {reason}")
+    
     client = NodeClient()
     
     is_reverse_tunnel = tunnel.core in {"rathole", "backhaul", "chisel", "frp"}
@@ -1577,7 +1650,9 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                 
                 if not iran_node.node_metadata.get("api_address"):
                     iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
+                    flag_modified(iran_node, "node_metadata")
                     await db.commit()
+                    node_routes.invalidate_node(iran_node.id)
                 
                 logger.info(f"Reapplying tunnel {tunnel.id}: applying server config to iran node {iran_node.id}")
                 server_response = await client.send_to_node(
@@ -1587,7 +1662,8 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                         "tunnel_id": tunnel.id,
                         "core": tunnel.core,
                         "type": tunnel.type,
-                        "spec": server_spec if tunnel.core in ["backhaul", "frp", "rathole", "chisel"] else spec
+                        "spec": server_spec if tunnel.core in ["backhaul", "frp", "rathole", "chisel"] else spec,
+                        "revision": tunnel.revision
                     }
                 )
                 
@@ -1600,7 +1676,9 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                 
                 if not foreign_node.node_metadata.get("api_address"):
                     foreign_node.node_metadata["api_address"] = f"http://{foreign_node.node_metadata.get('ip_address', foreign_node.fingerprint)}:{foreign_node.node_metadata.get('api_port', 8888)}"
+                    flag_modified(foreign_node, "node_metadata")
                     await db.commit()
+                    node_routes.invalidate_node(foreign_node.id)
                 
                 logger.info(f"Reapplying tunnel {tunnel.id}: applying client config to foreign node {foreign_node.id}")
                 client_response = await client.send_to_node(
@@ -1610,7 +1688,8 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                         "tunnel_id": tunnel.id,
                         "core": tunnel.core,
                         "type": tunnel.type,
-                        "spec": client_spec if tunnel.core in ["backhaul", "frp", "rathole", "chisel"] else spec
+                        "spec": client_spec if tunnel.core in ["backhaul", "frp", "rathole", "chisel"] else spec,
+                        "revision": tunnel.revision
                     }
                 )
                 
@@ -1625,6 +1704,7 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                     tunnel.status = "active"
                     tunnel.error_message = None
                     await db.commit()
+                    quota_enforcer.track(tunnel)
                     return {"status": "applied", "message": "Tunnel reapplied successfully to both nodes"}
                 else:
                     tunnel.status = "error"
@@ -1647,7 +1727,9 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
     try:
         if not node.node_metadata.get("api_address"):
             node.node_metadata["api_address"] = f"http://{node.fingerprint}:8888"
+            flag_modified(node, "node_metadata")
             await db.commit()
+            node_routes.invalidate_node(node.id)
         
         spec_for_node = tunnel.spec.copy() if tunnel.spec else {}
         logger.info(f"Reapplying tunnel {tunnel.id} (core={tunnel.core}, type={tunnel.type}): original spec={spec_for_node}")
@@ -1672,7 +1754,8 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
                 "tunnel_id": tunnel.id,
                 "core": tunnel.core,
                 "type": tunnel.type,
-                "spec": spec_for_node
+                "spec": spec_for_node,
+                "revision": tunnel.revision
             }
         )
         
@@ -1680,6 +1763,7 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
             tunnel.status = "active"
             tunnel.error_message = None
             await db.commit()
+            quota_enforcer.track(tunnel)
             return {"status": "applied", "message": "Tunnel reapplied successfully"}
         else:
             error_msg = response.get("message", "Failed to apply tunnel")
@@ -1697,50 +1781,51 @@ async def apply_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depe
 
 
 @router.post("/reapply-all")
-async def reapply_all_tunnels(request: Request, db: AsyncSession = Depends(get_db)):
-    """Reapply all tunnels"""
-    result = await db.execute(select(Tunnel))
-    tunnels = result.scalars().all()
+async def reapply_all_tunnels(request: Request, background: bool = False, db: AsyncSession = Depends(get_db)):
+    """Reapply all tunnels
+    
+    Tunnels are applied concurrently (bounded globally and per node) by the
+    reapply engine, each in its own database session. With background=true the
+    job is returned immediately and can be polled via /reapply-jobs/{job_id}.
+    """
+    result = await db.execute(select(Tunnel.id, Tunnel.name))
+    rows = result.all()
     
-    if not tunnels:
+    if not rows:
         return {"status": "success", "message": "No tunnels to reapply", "applied": 0, "failed": 0}
     
-    applied = 0
-    failed = 0
-    errors = []
+    tunnel_ids = [row[0] for row in rows]
+    labels = {row[0]: row[1] for row in rows}
     
-    # Call apply_tunnel for each tunnel
-    for tunnel in tunnels:
-        try:
-            # Call apply_tunnel directly - it's in the same module
-            try:
-                result_data = await apply_tunnel(tunnel.id, request, db)
-                if result_data and result_data.get("status") == "applied":
-                    applied += 1
-                else:
-                    failed += 1
-                    errors.append(f"Tunnel {tunnel.name}: Failed to apply")
-            except HTTPException as e:
-                failed += 1
-                errors.append(f"Tunnel {tunnel.name}: {e.detail}")
-            except Exception as e:
-                failed += 1
-                error_msg = str(e)
-                errors.append(f"Tunnel {tunnel.name}: {error_msg}")
-        except Exception as e:
-            logger.error(f"Error reapplying tunnel {tunnel.id}: {e}", exc_info=True)
-            failed += 1
-            errors.append(f"Tunnel {tunnel.name}: {str(e)}")
+    async def apply_one(tunnel_id: str):
+        async with AsyncSessionLocal() as session:
+            return await apply_tunnel(tunnel_id, request, session)
+    
+    job = reapply_engine.start(tunnel_ids, apply_one, labels)
+    if background:
+        return job.to_dict()
+    
+    await asyncio.shield(job.task)
     
     return {
         "status": "success",
-        "message": f"Reapplied {applied} tunnels, {failed} failed",
-        "applied": applied,
-        "failed": failed,
-        "errors": errors[:10]  # Limit errors to first 10
+        "message": f"Reapplied {job.applied} tunnels, {job.failed} failed",
+        "applied": job.applied,
+        "failed": job.failed,
+        "errors": job.errors[:10],  # Limit errors to first 10
+        "job_id": job.id
     }
 
 
+@router.get("/reapply-jobs/{job_id}")
+async def get_reapply_job(job_id: str):
+    """Get progress of a reapply job"""
+    job = reapply_engine.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Reapply job not found")
+    return job.to_dict()
+
+
 @router.delete("/{tunnel_id}")
 async def delete_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """Delete a tunnel"""
@@ -1806,6 +1891,7 @@ async def delete_tunnel(tunnel_id: str, request: Request, db: AsyncSession = Dep
             except:
                 pass
     
+    quota_enforcer.forget(tunnel.id)
     await db.delete(tunnel)
     await db.commit()
     return {"status": "deleted"}
@@ -0,0 +1,122 @@
+"""Background restore of tunnels after a panel restart"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RestorePhase:
+    """Progress of one restore step"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "pending"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def begin(self, total: int):
+        self.state = "running"
+        self.total = total
+        self.started_at = time.time()
+    
+    def advance(self, ok: bool = True, count: int = 1):
+        if ok:
+            self.done += count
+        else:
+            self.failed += count
+    
+    def to_dict(self) -> Dict[str, Any]:
+        duration = None
+        if self.started_at:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "state": self.state,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "error": self.error,
+            "duration": duration,
+        }
+
+
+class StartupRestore:
+    """Runs the restore steps concurrently while the panel already serves HTTP
+    
+    Each step is a coroutine function that reports into its own RestorePhase.
+    Steps share one semaphore, so blocking work such as spawning local core
+    processes (run in threads) is bounded, and it overlaps with the pushes to
+    remote nodes instead of waiting for them.
+    """
+    
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.phases: Dict[str, RestorePhase] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def start(self, steps: Dict[str, Callable[[RestorePhase], Awaitable[None]]]):
+        """Start the restore in the background"""
+        self.phases = {name: RestorePhase(name) for name in steps}
+        self.started_at = time.time()
+        self.finished_at = None
+        self.task = asyncio.create_task(self._run(steps))
+    
+    async def stop(self):
+        """Cancel a restore that is still running"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def _run(self, steps: Dict[str, Callable[[RestorePhase], Awaitable[None]]]):
+        async def run_step(name: str, step: Callable[[RestorePhase], Awaitable[None]]):
+            phase = self.phases[name]
+            try:
+                await step(phase)
+                phase.state = "failed" if phase.error else "done"
+            except asyncio.CancelledError:
+                phase.state = "cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Startup restore step {name} failed: {e}", exc_info=True)
+                phase.state = "failed"
+                phase.error = str(e)
+            finally:
+                phase.finished_at = time.time()
+        
+        try:
+            await asyncio.gather(*(run_step(name, step) for name, step in steps.items()))
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Startup restore finished in {self.finished_at - self.started_at:.2f}s: {self.get_status()['phases']}")
+    
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call in a worker thread, bounded by the shared semaphore"""
+        async with self.semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+    
+    def get_status(self) -> Dict[str, Any]:
+        running = self.task is not None and not self.task.done()
+        state = "running" if running else ("done" if self.finished_at else "pending")
+        duration = None
+        if self.started_at:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "state": state,
+            "duration": duration,
+            "phases": {name: phase.to_dict() for name, phase in self.phases.items()},
+        }
+
+
+startup_restore = StartupRestore(settings.startup_restore_concurrency)
@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.database import AsyncSessionLocal
 from app.models import Settings, Tunnel
-from app.node_client import NodeClient
+from app.tunnel_sync import TunnelSyncPlan, tunnel_syncer
 from fastapi import Request
 
 logger = logging.getLogger(__name__)
@@ -87,7 +87,7 @@ class TunnelReapplyManager:
             logger.error(f"Tunnel reapply loop error: {e}", exc_info=True)
     
     async def _reapply_all_tunnels(self):
-        """Reapply all tunnels"""
+        """Reapply all active tunnels, pushing only specs the nodes do not already run"""
         from app.routers.tunnels import prepare_frp_spec_for_node
         from app.models import Node
         from fastapi import Request
@@ -101,8 +101,7 @@ class TunnelReapplyManager:
                 logger.debug("No active tunnels to reapply")
                 return
             
-            client = NodeClient()
-            applied = 0
+            plan = TunnelSyncPlan()
             failed = 0
             
             from starlette.requests import Request as StarletteRequest
@@ -181,43 +180,8 @@ class TunnelReapplyManager:
                             else:
                                 spec_for_foreign["ports"] = ports
                             
-                            server_response = await client.send_to_node(
-                                node_id=iran_node.id,
-                                endpoint="/api/agent/tunnels/apply",
-                                data={
-                                    "tunnel_id": tunnel.id,
-                                    "core": tunnel.core,
-                                    "type": tunnel.type,
-                                    "spec": spec_for_iran
-                                }
-                            )
-                            
-                            if server_response.get("status") == "error":
-                                logger.error(f"Failed to reapply tunnel {tunnel.id} to iran node: {server_response.get('message')}")
-                                failed += 1
-                                continue
-                            
-                            client_response = await client.send_to_node(
-                                node_id=foreign_node.id,
-                                endpoint="/api/agent/tunnels/apply",
-                                data={
-                                    "tunnel_id": tunnel.id,
-                                    "core": tunnel.core,
-                                    "type": tunnel.type,
-                                    "spec": spec_for_foreign
-                                }
-                            )
-                            
-                            if client_response.get("status") == "error":
-                                logger.error(f"Failed to reapply tunnel {tunnel.id} to foreign node: {client_response.get('message')}")
-                                failed += 1
-                                continue
-                            
-                            if server_response.get("status") == "success" and client_response.get("status") == "success":
-                                applied += 1
-                                logger.info(f"Successfully reapplied tunnel {tunnel.id} ({tunnel.core})")
-                            else:
-                                failed += 1
+                            plan.add(tunnel, iran_node.id, tunnel.core, spec_for_iran)
+                            plan.add(tunnel, foreign_node.id, tunnel.core, spec_for_foreign)
                         else:
                             server_spec = spec.copy()
                             server_spec["mode"] = "server"
@@ -312,43 +276,8 @@ class TunnelReapplyManager:
                                 client_spec["mode"] = "client"
                                 client_spec["reverse_port"] = listen_port
                             
-                            server_response = await client.send_to_node(
-                                node_id=iran_node.id,
-                                endpoint="/api/agent/tunnels/apply",
-                                data={
-                                    "tunnel_id": tunnel.id,
-                                    "core": tunnel.core,
-                                    "type": tunnel.type,
-                                    "spec": server_spec
-                                }
-                            )
-                            
-                            if server_response.get("status") == "error":
-                                logger.error(f"Failed to reapply tunnel {tunnel.id} to iran node: {server_response.get('message')}")
-                                failed += 1
-                                continue
-                            
-                            client_response = await client.send_to_node(
-                                node_id=foreign_node.id,
-                                endpoint="/api/agent/tunnels/apply",
-                                data={
-                                    "tunnel_id": tunnel.id,
-                                    "core": tunnel.core,
-                                    "type": tunnel.type,
-                                    "spec": client_spec
-                                }
-                            )
-                            
-                            if client_response.get("status") == "error":
-                                logger.error(f"Failed to reapply tunnel {tunnel.id} to foreign node: {client_response.get('message')}")
-                                failed += 1
-                                continue
-                            
-                            if server_response.get("status") == "success" and client_response.get("status") == "success":
-                                applied += 1
-                                logger.info(f"Successfully reapplied tunnel {tunnel.id} ({tunnel.core})")
-                            else:
-                                failed += 1
+                            plan.add(tunnel, iran_node.id, tunnel.core, server_spec)
+                            plan.add(tunnel, foreign_node.id, tunnel.core, client_spec)
                     else:
                         result = await session.execute(select(Node).where(Node.id == tunnel.node_id))
                         node = result.scalar_one_or_none()
@@ -363,28 +292,15 @@ class TunnelReapplyManager:
                         if tunnel.core == "frp":
                             spec = prepare_frp_spec_for_node(spec, node, fake_request)
                         
-                        response = await client.send_to_node(
-                            node_id=node.id,
-                            endpoint="/api/agent/tunnels/apply",
-                            data={
-                                "tunnel_id": tunnel.id,
-                                "core": tunnel.core,
-                                "type": tunnel.type,
-                                "spec": spec
-                            }
-                        )
-                        
-                        if response.get("status") == "success":
-                            applied += 1
-                            logger.info(f"Successfully reapplied tunnel {tunnel.id} ({tunnel.core})")
-                        else:
-                            failed += 1
-                            logger.error(f"Failed to reapply tunnel {tunnel.id}: {response.get('message')}")
+                        plan.add(tunnel, node.id, tunnel.core, spec)
                 except Exception as e:
                     logger.error(f"Error reapplying tunnel {tunnel.id}: {e}", exc_info=True)
                     failed += 1
             
-            logger.info(f"Auto reapply completed: {applied} applied, {failed} failed")
+        result = await tunnel_syncer.sync(plan)
+        for tunnel_id, error in result["errors"].items():
+            logger.error(f"Failed to reapply tunnel {tunnel_id} to {error}")
+        logger.info(f"Auto reapply completed: {result['applied']} applied, {result['unchanged']} unchanged, {result['removed']} removed, {result['failed'] + failed} failed")
     
     def set_request(self, request: Request):
         """Set request object for reapply operations"""
@@ -0,0 +1,146 @@
+"""Desired-state sync of tunnels to nodes"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Set
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
+from app.models import Tunnel, Node
+from app.node_client import NodeClient
+
+logger = logging.getLogger(__name__)
+
+
+def spec_hash(tunnel_core: str, spec: Dict[str, Any]) -> str:
+    """Stable hash of a tunnel's effective spec (must match the node agent's)"""
+    payload = json.dumps({"core": tunnel_core, "spec": spec}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TunnelSyncPlan:
+    """Ordered node applies that make up the desired state of the tunnels"""
+    
+    def __init__(self):
+        self.steps: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    
+    def add(self, tunnel: Tunnel, node_id: str, tunnel_core: str, spec: Dict[str, Any]):
+        """Add an apply for a tunnel; applies for one tunnel run in the order added"""
+        self.steps.setdefault(tunnel.id, []).append((node_id, {
+            "tunnel_id": tunnel.id,
+            "core": tunnel_core,
+            "type": tunnel.type,
+            "spec": spec,
+            "revision": tunnel.revision
+        }))
+    
+    def node_ids(self) -> Set[str]:
+        return {node_id for steps in self.steps.values() for node_id, _ in steps}
+
+
+class TunnelSyncer:
+    """Pushes only the tunnel specs a node does not already run
+    
+    Each node is asked once for its manifest (spec hash, revision and running
+    state per tunnel). Tunnels that are missing, changed or stopped are applied,
+    and tunnels the panel no longer knows about are removed. When nothing
+    changed, a sync costs one manifest request per node.
+    """
+    
+    async def sync(self, plan: TunnelSyncPlan, remove_unknown: bool = True) -> Dict[str, Any]:
+        client = NodeClient()
+        node_ids = plan.node_ids()
+        known_ids: Set[str] = set()
+        
+        if remove_unknown:
+            # Every registered node is checked so tunnels deleted while it was offline get removed
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Node.id))
+                node_ids |= {row[0] for row in result.all()}
+        
+        manifests: Dict[str, Optional[Dict[str, Any]]] = {}
+        
+        async def fetch_manifest(node_id: str):
+            response = await client.get_tunnel_manifest(node_id)
+            if response.get("status") == "ok":
+                manifests[node_id] = response.get("tunnels") or {}
+            else:
+                # Unreachable or older node: fall back to pushing everything
+                logger.debug(f"No tunnel manifest from node {node_id}: {response.get('message')}")
+                manifests[node_id] = None
+        
+        await asyncio.gather(*(fetch_manifest(node_id) for node_id in node_ids))
+        
+        if remove_unknown:
+            # Read after the manifests so a tunnel created while they were fetched is not removed
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Tunnel.id))
+                known_ids = {row[0] for row in result.all()}
+        
+        applied: Set[str] = set()
+        failed: Dict[str, str] = {}
+        unchanged = 0
+        
+        def needs_apply(node_id: str, payload: Dict[str, Any]) -> bool:
+            manifest = manifests.get(node_id)
+            if manifest is None:
+                return True
+            current = manifest.get(payload["tunnel_id"])
+            if not current or not current.get("running"):
+                return True
+            if current.get("revision") != payload["revision"]:
+                return True
+            return current.get("spec_hash") != spec_hash(payload["core"], payload["spec"])
+        
+        async def apply_step(tunnel_id: str, node_id: str, payload: Dict[str, Any]):
+            response = await client.apply_tunnel(node_id, payload)
+            if response.get("status") == "error":
+                failed[tunnel_id] = f"node {node_id}: {response.get('message', 'Unknown error')}"
+            else:
+                applied.add(tunnel_id)
+        
+        # Apply step N of every tunnel before step N+1 so servers start before their clients
+        max_steps = max((len(steps) for steps in plan.steps.values()), default=0)
+        for index in range(max_steps):
+            pending = []
+            for tunnel_id, steps in plan.steps.items():
+                if index >= len(steps) or tunnel_id in failed:
+                    continue
+                node_id, payload = steps[index]
+                if needs_apply(node_id, payload):
+                    pending.append(apply_step(tunnel_id, node_id, payload))
+            await asyncio.gather(*pending)
+        
+        for tunnel_id in plan.steps:
+            if tunnel_id not in applied and tunnel_id not in failed:
+                unchanged += 1
+        
+        removed = 0
+        if remove_unknown:
+            removals = [
+                (node_id, tunnel_id)
+                for node_id, manifest in manifests.items() if manifest
+                for tunnel_id in manifest
+                if tunnel_id not in known_ids
+            ]
+            
+            async def remove(node_id: str, tunnel_id: str):
+                nonlocal removed
+                response = await client.send_to_node(node_id, "/api/agent/tunnels/remove", {"tunnel_id": tunnel_id})
+                if response.get("status") == "error":
+                    logger.warning(f"Failed to remove stale tunnel {tunnel_id} from node {node_id}: {response.get('message')}")
+                else:
+                    removed += 1
+            
+            await asyncio.gather(*(remove(node_id, tunnel_id) for node_id, tunnel_id in removals))
+        
+        return {
+            "applied": len(applied - set(failed)),
+            "unchanged": unchanged,
+            "failed": len(failed),
+            "removed": removed,
+            "errors": failed,
+        }
+
+
+tunnel_syncer = TunnelSyncer()
@@ -0,0 +1,66 @@
+"""Tunnel traffic accounting"""
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import select, update, func
+from app.database import AsyncSessionLocal
+from app.models import Tunnel, Usage
+from app.quota_enforcer import quota_enforcer
+
+logger = logging.getLogger(__name__)
+
+BYTES_PER_MB = 1024 * 1024
+
+
+class UsageRecorder:
+    """Turns batched byte deltas from nodes into Usage rows and Tunnel.used_mb
+    
+    Nodes resend a batch until it is acknowledged, so batch ids seen recently
+    are remembered and repeats are dropped. Recorded usage is passed on to the
+    quota enforcer, which suspends tunnels that go over their quota.
+    """
+    
+    MAX_SEEN_BATCHES = 1000
+    
+    def __init__(self):
+        self.seen_batches: "OrderedDict[str, None]" = OrderedDict()
+    
+    async def record(self, node_id: str, samples: Dict[str, int], batch_id: Optional[str] = None) -> int:
+        """Record a node's byte deltas, returning how many tunnels were updated"""
+        batch_key = f"{node_id}:{batch_id}" if batch_id else None
+        if batch_key and batch_key in self.seen_batches:
+            logger.debug(f"Ignoring duplicate usage batch {batch_id} from node {node_id}")
+            return 0
+        
+        samples = {tunnel_id: int(used) for tunnel_id, used in samples.items() if int(used) > 0}
+        if not samples:
+            return 0
+        
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Tunnel.id).where(Tunnel.id.in_(list(samples))))
+            tunnel_ids = [row[0] for row in result.all()]
+            
+            for tunnel_id in tunnel_ids:
+                used = samples[tunnel_id]
+                session.add(Usage(tunnel_id=tunnel_id, node_id=node_id, bytes_used=used, timestamp=now))
+                await session.execute(
+                    update(Tunnel)
+                    .where(Tunnel.id == tunnel_id)
+                    .values(used_mb=func.coalesce(Tunnel.used_mb, 0) + used / BYTES_PER_MB)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        
+        if batch_key:
+            self.seen_batches[batch_key] = None
+            while len(self.seen_batches) > self.MAX_SEEN_BATCHES:
+                self.seen_batches.popitem(last=False)
+        
+        for tunnel_id in tunnel_ids:
+            quota_enforcer.add_usage(tunnel_id, samples[tunnel_id] / BYTES_PER_MB)
+        return len(tunnel_ids)
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,210 @@
+"""Time-bucketed usage rollups with per-tier retention"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Usage, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+# Rollup tiers in seconds, finest first; each tier is built from the one before it
+TIERS = [60, 3600, 86400]
+RAW = 0
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def floor_time(value: datetime, step: int) -> datetime:
+    """Round a naive UTC datetime down to a multiple of step seconds since the epoch"""
+    seconds = int((value - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % step)
+
+
+class UsageRollupManager:
+    """Compacts raw Usage samples into 1-minute, 1-hour and 1-day buckets
+    
+    Every interval, each tier is extended up to the last complete bucket from
+    the tier below it (raw samples for the minute tier). A tier's watermark is
+    the end of its newest bucket, so no extra bookkeeping is stored. Rows
+    older than a tier's retention are pruned, but only once the next tier has
+    already absorbed them.
+    """
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.interval = settings.usage_rollup_interval
+        self.retention = {
+            RAW: timedelta(hours=settings.usage_raw_retention_hours),
+            60: timedelta(days=settings.usage_minute_retention_days),
+            3600: timedelta(days=settings.usage_hour_retention_days),
+            86400: timedelta(days=settings.usage_day_retention_days),
+        }
+    
+    async def start(self):
+        """Start the rollup task"""
+        await self.stop()
+        self.task = asyncio.create_task(self._rollup_loop())
+        logger.info(f"Usage rollup task started: interval={self.interval}s")
+    
+    async def stop(self):
+        """Stop the rollup task"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            logger.info("Usage rollup task stopped")
+    
+    async def _rollup_loop(self):
+        try:
+            while True:
+                try:
+                    await self.rollup_once()
+                except Exception as e:
+                    logger.error(f"Error rolling up usage: {e}", exc_info=True)
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            raise
+    
+    async def _watermark(self, session: AsyncSession, step: int) -> Optional[datetime]:
+        """End of the newest bucket of a tier"""
+        result = await session.execute(select(func.max(UsageRollup.bucket)).where(UsageRollup.step == step))
+        newest = result.scalar()
+        return newest + timedelta(seconds=step) if newest else None
+    
+    async def _source_rows(self, session: AsyncSession, source: int, start: Optional[datetime], end: datetime) -> List[Tuple[str, str, datetime, int]]:
+        if source == RAW:
+            query = select(Usage.tunnel_id, Usage.node_id, Usage.timestamp, Usage.bytes_used).where(Usage.timestamp < end)
+            if start:
+                query = query.where(Usage.timestamp >= start)
+        else:
+            query = select(UsageRollup.tunnel_id, UsageRollup.node_id, UsageRollup.bucket, UsageRollup.bytes_used).where(
+                UsageRollup.step == source,
+                UsageRollup.bucket < end
+            )
+            if start:
+                query = query.where(UsageRollup.bucket >= start)
+        result = await session.execute(query)
+        return result.all()
+    
+    async def rollup_once(self, now: Optional[datetime] = None) -> Dict[int, int]:
+        """Extend every tier up to its last complete bucket and apply retention"""
+        now = now or datetime.utcnow()
+        created: Dict[int, int] = {}
+        async with AsyncSessionLocal() as session:
+            for index, step in enumerate(TIERS):
+                source = TIERS[index - 1] if index else RAW
+                start = await self._watermark(session, step)
+                end = floor_time(now, step)
+                if start and start >= end:
+                    continue
+                
+                buckets: Dict[Tuple[str, str, datetime], int] = {}
+                for tunnel_id, node_id, timestamp, used in await self._source_rows(session, source, start, end):
+                    key = (tunnel_id, node_id, floor_time(timestamp, step))
+                    buckets[key] = buckets.get(key, 0) + (used or 0)
+                
+                session.add_all([
+                    UsageRollup(tunnel_id=tunnel_id, node_id=node_id, step=step, bucket=bucket, bytes_used=used)
+                    for (tunnel_id, node_id, bucket), used in buckets.items()
+                ])
+                await session.flush()
+                created[step] = len(buckets)
+            
+            await self._apply_retention(session, now)
+            await session.commit()
+        
+        if any(created.values()):
+            logger.debug(f"Usage rollup created buckets: {created}")
+        return created
+    
+    async def _apply_retention(self, session: AsyncSession, now: datetime):
+        levels = [RAW] + TIERS
+        for index, level in enumerate(levels):
+            cutoff = now - self.retention[level]
+            if index + 1 < len(levels):
+                # Never drop rows the next tier has not absorbed yet
+                absorbed = await self._watermark(session, levels[index + 1])
+                if absorbed is None:
+                    continue
+                cutoff = min(cutoff, absorbed)
+            if level == RAW:
+                await session.execute(delete(Usage).where(Usage.timestamp < cutoff))
+            else:
+                await session.execute(delete(UsageRollup).where(UsageRollup.step == level, UsageRollup.bucket < cutoff))
+    
+    async def query(self, tunnel_id: str, start: datetime, end: datetime, step: int) -> Dict[str, Any]:
+        """Usage of a tunnel in step-sized buckets between start and end
+        
+        Reads the coarsest tier whose buckets fit evenly into step for as much
+        of the range as it covers, then finer tiers, then raw samples for the
+        part that has not been rolled up yet.
+        """
+        start = floor_time(start, step)
+        totals: Dict[datetime, int] = {}
+        sources: List[str] = []
+        cursor = start
+        
+        async with AsyncSessionLocal() as session:
+            for tier in reversed(TIERS):
+                if cursor >= end:
+                    break
+                if step % tier:
+                    continue
+                watermark = await self._watermark(session, tier)
+                if not watermark or watermark <= cursor:
+                    continue
+                segment_end = min(end, watermark)
+                result = await session.execute(
+                    select(UsageRollup.bucket, func.sum(UsageRollup.bytes_used))
+                    .where(
+                        UsageRollup.tunnel_id == tunnel_id,
+                        UsageRollup.step == tier,
+                        UsageRollup.bucket >= cursor,
+                        UsageRollup.bucket < segment_end
+                    )
+                    .group_by(UsageRollup.bucket)
+                )
+                for bucket, used in result.all():
+                    key = floor_time(bucket, step)
+                    totals[key] = totals.get(key, 0) + (used or 0)
+                sources.append(f"{tier}s")
+                cursor = segment_end
+            
+            if cursor < end:
+                result = await session.execute(
+                    select(Usage.timestamp, Usage.bytes_used).where(
+                        Usage.tunnel_id == tunnel_id,
+                        Usage.timestamp >= cursor,
+                        Usage.timestamp < end
+                    )
+                )
+                for timestamp, used in result.all():
+                    key = floor_time(timestamp, step)
+                    totals[key] = totals.get(key, 0) + (used or 0)
+                sources.append("raw")
+        
+        points = []
+        bucket = start
+        while bucket < end:
+            points.append({"timestamp": bucket.isoformat(), "bytes": totals.get(bucket, 0)})
+            bucket += timedelta(seconds=step)
+        
+        return {
+            "tunnel_id": tunnel_id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "step": step,
+            "sources": sources,
+            "total_bytes": sum(totals.values()),
+            "points": points,
+        }
+
+
+usage_rollup_manager = UsageRollupManager()
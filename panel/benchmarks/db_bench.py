@@ -0,0 +1,152 @@
+"""Panel database benchmark: list and filter latency at 10k tunnels
+
+Builds two databases with the same data, one with SQLite defaults and no
+secondary indexes, one set up by init_db (WAL, tuned pragmas, indexes), and
+times the queries the panel's background loops and API run most.
+
+Run from panel/:
+
+    python -m benchmarks.db_bench --tunnels 10000 --usage 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix="smite-db-bench-")
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "tuned.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func, or_, insert, text  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession  # noqa: E402
+from app.database import Base, engine as tuned_engine, init_db  # noqa: E402
+from app.models import Tunnel, Node, Usage, generate_uuid  # noqa: E402
+
+CORES = ["gost", "rathole", "backhaul", "chisel", "frp"]
+STATUSES = ["active"] * 8 + ["error", "suspended"]
+
+
+def _rows(tunnel_count, usage_count, node_count):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    nodes = [{"id": generate_uuid(), "name": f"node-{i}", "fingerprint": f"fp-{i}", "status": "active", "node_metadata": {}} for i in range(node_count)]
+    tunnels = []
+    for i in range(tunnel_count):
+        tunnels.append({
+            "id": generate_uuid(),
+            "name": f"tunnel-{i}",
+            "core": rng.choice(CORES),
+            "type": "tcp",
+            "node_id": rng.choice(nodes)["id"],
+            "foreign_node_id": rng.choice(nodes)["id"],
+            "spec": {"ports": [10000 + i]},
+            "status": rng.choice(STATUSES),
+        })
+    usage = [{
+        "id": generate_uuid(),
+        "tunnel_id": rng.choice(tunnels)["id"],
+        "node_id": rng.choice(nodes)["id"],
+        "bytes_used": rng.randint(1, 10_000_000),
+        "timestamp": now - timedelta(seconds=rng.randint(0, 3 * 86400)),
+    } for _ in range(usage_count)]
+    return nodes, tunnels, usage
+
+
+async def _populate(engine, nodes, tunnels, usage):
+    async with engine.begin() as conn:
+        await conn.execute(insert(Node), nodes)
+        await conn.execute(insert(Tunnel), tunnels)
+        for start in range(0, len(usage), 10000):
+            await conn.execute(insert(Usage), usage[start:start + 10000])
+
+
+async def _baseline_engine():
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(WORKDIR, 'baseline.db')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    return engine
+
+
+async def _time(engine, statement, repeat, scalars=False):
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    samples = []
+    for _ in range(repeat):
+        async with sessions() as session:
+            started = time.perf_counter()
+            result = await session.execute(statement())
+            result.scalars().all() if scalars else result.all()
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def _time_writes(engine, node_id, tunnel_ids, batches):
+    """Usage batches as usage_recorder writes them: one small transaction each"""
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    started = time.perf_counter()
+    for _ in range(batches):
+        async with sessions() as session:
+            for tunnel_id in random.sample(tunnel_ids, 20):
+                session.add(Usage(tunnel_id=tunnel_id, node_id=node_id, bytes_used=1000))
+            await session.commit()
+    return (time.perf_counter() - started) * 1000 / batches
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tunnels", type=int, default=10000)
+    parser.add_argument("--usage", type=int, default=200000)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--write-batches", type=int, default=200)
+    args = parser.parse_args()
+    
+    nodes, tunnels, usage = _rows(args.tunnels, args.usage, args.nodes)
+    await init_db()
+    baseline = await _baseline_engine()
+    for engine in (baseline, tuned_engine):
+        await _populate(engine, nodes, tunnels, usage)
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+    
+    node_id = nodes[0]["id"]
+    tunnel_id = tunnels[0]["id"]
+    since = datetime.utcnow() - timedelta(hours=24)
+    cases = [
+        ("list all tunnels", lambda: select(Tunnel), True),
+        ("active tunnels", lambda: select(Tunnel).where(Tunnel.status == "active"), True),
+        ("active tunnels of one core", lambda: select(Tunnel).where(Tunnel.core == "rathole", Tunnel.status == "active"), True),
+        ("count active", lambda: select(func.count(Tunnel.id)).where(Tunnel.status == "active"), False),
+        ("tunnels on one node", lambda: select(Tunnel).where(or_(Tunnel.node_id == node_id, Tunnel.foreign_node_id == node_id, Tunnel.iran_node_id == node_id)), True),
+        ("24h usage of one tunnel", lambda: select(func.sum(Usage.bytes_used)).where(Usage.tunnel_id == tunnel_id, Usage.timestamp >= since), False),
+    ]
+    
+    print(f"{args.tunnels} tunnels, {args.usage} usage rows, {args.nodes} nodes (median of {args.repeat}, ms)")
+    print(f"{'query':<30} {'baseline':>10} {'tuned':>10} {'speedup':>8}")
+    for label, statement, scalars in cases:
+        before = await _time(baseline, statement, args.repeat, scalars)
+        after = await _time(tuned_engine, statement, args.repeat, scalars)
+        print(f"{label:<30} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+    
+    tunnel_ids = [t["id"] for t in tunnels]
+    before = await _time_writes(baseline, node_id, tunnel_ids, args.write_batches)
+    after = await _time_writes(tuned_engine, node_id, tunnel_ids, args.write_batches)
+    print(f"{'usage batch commit':<30} {before:>10.2f} {after:>10.2f} {before / after:>7.1f}x")
+    
+    await baseline.dispose()
+    await tuned_engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
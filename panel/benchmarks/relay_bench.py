@@ -0,0 +1,200 @@
+"""PortForwarder benchmark: throughput and connection rate per relay engine
+
+Puts a PortForwarder with each relay engine in front of a local server and
+measures, over loopback:
+- MiB/s: bulk uploads into a sink server on parallel connections
+- conn/s: short connections that each send one small request to an echo
+  server and wait for the reply
+
+The servers and the clients run in threads so the event loop only does the
+relaying. Each engine is measured on the default asyncio loop and, if it
+is installed, on uvloop.
+
+Run from panel/:
+
+    python -m benchmarks.relay_bench --megabytes 512 --connections 4
+    python -m benchmarks.relay_bench --workers 4 --engines buffer splice
+    python -m benchmarks.relay_bench --loops asyncio uvloop --engines stream protocol
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.port_forwarder import PortForwarder  # noqa: E402
+from app.relay import ENGINES, install_uvloop, resolve_engine  # noqa: E402
+
+CHUNK = 256 * 1024
+REQUEST = b"x" * 64
+
+
+def _sink(listener: socket.socket, connections: int, received: list):
+    """Accept connections and drain them, counting bytes"""
+    def drain(conn):
+        total = 0
+        buffer = bytearray(CHUNK)
+        with conn:
+            while True:
+                n = conn.recv_into(buffer)
+                if not n:
+                    break
+                total += n
+            conn.sendall(b"ok")
+        received.append(total)
+    
+    threads = []
+    for _ in range(connections):
+        conn, _ = listener.accept()
+        thread = threading.Thread(target=drain, args=(conn,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+def _send(port: int, size: int):
+    payload = os.urandom(CHUNK)
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sent = 0
+        while sent < size:
+            sock.sendall(payload)
+            sent += len(payload)
+        sock.shutdown(socket.SHUT_WR)
+        sock.recv(2)
+
+
+def _transfer(port: int, sink: socket.socket, connections: int, size: int) -> float:
+    received = []
+    sink_thread = threading.Thread(target=_sink, args=(sink, connections, received), daemon=True)
+    sink_thread.start()
+    started = time.perf_counter()
+    senders = [threading.Thread(target=_send, args=(port, size)) for _ in range(connections)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    sink_thread.join()
+    elapsed = time.perf_counter() - started
+    if sum(received) < connections * size:
+        raise RuntimeError(f"sink received {sum(received)} of {connections * size} bytes")
+    return elapsed
+
+
+def _echo_server() -> socket.socket:
+    """Echo server that answers each request and closes after the client does"""
+    listener = _listener()
+    
+    def serve(conn):
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                conn.sendall(data)
+    
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+    
+    threading.Thread(target=accept, daemon=True).start()
+    return listener
+
+
+def _connection_rate(port: int, clients: int, per_client: int) -> float:
+    def client():
+        for _ in range(per_client):
+            with socket.create_connection(("127.0.0.1", port)) as sock:
+                sock.sendall(REQUEST)
+                received = 0
+                while received < len(REQUEST):
+                    data = sock.recv(4096)
+                    if not data:
+                        raise RuntimeError("connection closed before the reply")
+                    received += len(data)
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * per_client / (time.perf_counter() - started)
+
+
+def _listener() -> socket.socket:
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1024)
+    return listener
+
+
+async def _run_engine(args, engine: str, port: int, sink: socket.socket, echo_port: int) -> Tuple[float, float]:
+    forwarder = PortForwarder(engine, workers=args.workers)
+    for local_port, target_port in ((port, sink.getsockname()[1]), (port + 1, echo_port)):
+        if not await forwarder.start_forward(local_port, "127.0.0.1", target_port, wait=not args.workers):
+            raise RuntimeError(f"could not forward port {local_port}")
+    await asyncio.sleep(0.2)
+    try:
+        elapsed = await asyncio.to_thread(_transfer, port, sink, args.connections, args.megabytes * 1024 * 1024)
+        rate = await asyncio.to_thread(_connection_rate, port + 1, args.clients, args.requests)
+        return elapsed, rate
+    finally:
+        await forwarder.cleanup_all()
+
+
+async def _run_loop(args, loop_name: str, sink: socket.socket, echo: socket.socket):
+    total_mb = args.connections * args.megabytes
+    echo_port = echo.getsockname()[1]
+    for offset, engine in enumerate(args.engines):
+        elapsed, rate = await _run_engine(args, engine, args.port + 2 * offset, sink, echo_port)
+        label = engine if resolve_engine(engine) == engine else f"{engine}*"
+        print(f"{loop_name:<8} {label:<10} {total_mb / elapsed:>9.0f} {rate:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=int, default=512, help="bytes sent per connection, in MiB")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8, help="parallel clients in the connection-rate test")
+    parser.add_argument("--requests", type=int, default=250, help="connections per client in the connection-rate test")
+    parser.add_argument("--port", type=int, default=20100, help="first listen port; keep it below the ephemeral port range")
+    parser.add_argument("--workers", type=int, default=0, help="forwarder worker processes (0 runs in-process)")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--loops", nargs="+", default=["asyncio", "uvloop"], choices=["asyncio", "uvloop"])
+    args = parser.parse_args()
+    
+    sink = _listener()
+    echo = _echo_server()
+    
+    direct = _transfer(sink.getsockname()[1], sink, args.connections, args.megabytes * 1024 * 1024)
+    direct_rate = _connection_rate(echo.getsockname()[1], args.clients, args.requests)
+    print(f"{args.connections} x {args.megabytes} MiB uploads, {args.clients} x {args.requests} short connections, {args.workers or 'no'} workers")
+    print(f"{'loop':<8} {'engine':<10} {'MiB/s':>9} {'conn/s':>9}")
+    print(f"{'-':<8} {'direct':<10} {args.connections * args.megabytes / direct:>9.0f} {direct_rate:>9.0f}")
+    for loop_name in args.loops:
+        if loop_name == "uvloop":
+            if not install_uvloop():
+                print("uvloop   (not installed)")
+                continue
+        else:
+            asyncio.set_event_loop_policy(None)
+        asyncio.run(_run_loop(args, loop_name, sink, echo))
+    if any(resolve_engine(engine) != engine for engine in args.engines):
+        print("* splice is not available here; measured the buffer engine instead")
+    sink.close()
+    echo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.database import AsyncSessionLocal
-from app.models import Tunnel, Node, CoreResetConfig
+from app.models import Tunnel, CoreResetConfig
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,7 +17,8 @@ from fastapi.staticfiles import StaticFiles
 
 from app.config import settings
 from app.database import init_db
-from app.routers import nodes, tunnels, panel, status, logs, auth, core_health
+from app.migrations import migration_runner
+from app.routers import nodes, tunnels, panel, status, logs, auth, core_health, metrics
 from app.routers import settings as settings_router
 from app.node_server import NodeServer
 from app.gost_forwarder import gost_forwarder
@@ -27,7 +28,15 @@ from app.chisel_server import chisel_server_manager
 from app.frp_server import frp_server_manager
 from app.frp_comm_manager import frp_comm_manager
 from app.telegram_bot import telegram_bot
-from app.node_client import NodeClient
+from app.node_client import node_pool
+from app.tunnel_sync import TunnelSyncPlan, tunnel_syncer
+from app.node_index import NodeIndex, node_role
+from app.node_health import node_health_poller
+from app.core_supervisor import core_supervisor
+from app.usage_rollup import usage_rollup_manager
+from app.quota_enforcer import quota_enforcer, limit_reason
+from app.startup_restore import startup_restore, RestorePhase
+from app.metrics import loop_lag_monitor, RequestMetricsMiddleware
 from app.models import Settings
 import logging
 
@@ -41,7 +50,10 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
+    await loop_lag_monitor.start()
     await init_db()
+    migration_runner.start_backfills()
+    app.state.migration_runner = migration_runner
     
     h2_server = NodeServer()
     await h2_server.start()
@@ -82,14 +94,28 @@ async def lifespan(app: FastAPI):
     app.state.chisel_server_manager = chisel_server_manager
     app.state.frp_server_manager = frp_server_manager
     app.state.frp_comm_manager = frp_comm_manager
+    app.state.node_pool = node_pool
+    
+    await core_supervisor.start()
+    app.state.core_supervisor = core_supervisor
     
     await _load_and_start_frp_comm()
+    await node_health_poller.start()
+    app.state.node_health_poller = node_health_poller
+    await usage_rollup_manager.start()
+    app.state.usage_rollup_manager = usage_rollup_manager
     await _load_and_start_telegram_bot()
     await _load_and_start_tunnel_reapply()
     
-    await _restore_forwards()
+    await quota_enforcer.start()
+    app.state.quota_enforcer = quota_enforcer
     
-    await _restore_node_tunnels()
+    # Restore in the background so the API is up while tunnels come back
+    startup_restore.start({
+        "forwards": _restore_forwards,
+        "node_tunnels": _restore_node_tunnels,
+    })
+    app.state.startup_restore = startup_restore
     
     reset_task = asyncio.create_task(_auto_reset_scheduler(app))
     app.state.reset_task = reset_task
@@ -103,6 +129,12 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
     
+    await startup_restore.stop()
+    await node_health_poller.stop()
+    await usage_rollup_manager.stop()
+    await quota_enforcer.stop()
+    await migration_runner.stop()
+    
     if hasattr(app.state, 'h2_server'):
         await app.state.h2_server.stop()
     
@@ -111,52 +143,71 @@ async def lifespan(app: FastAPI):
     
     await telegram_bot.stop()
     
+    await core_supervisor.stop()
     gost_forwarder.cleanup_all()
+    
+    await node_pool.close()
+    await loop_lag_monitor.stop()
 
 
-async def _restore_forwards():
-    """Restore forwarding for active tunnels on startup"""
+async def _restore_forwards(phase: RestorePhase):
+    """Restore panel-side gost forwarding for active tunnels on startup
+    
+    Forwards are started concurrently in worker threads, since each start
+    blocks until its gost process is listening.
+    """
     try:
         logger.info("Starting to restore forwarding for active tunnels...")
         async with AsyncSessionLocal() as db:
             result = await db.execute(select(Tunnel).where(Tunnel.status == "active"))
             tunnels = result.scalars().all()
-            logger.info(f"Found {len(tunnels)} active tunnels to restore")
+        logger.info(f"Found {len(tunnels)} active tunnels to restore")
+        
+        forwards = []
+        for tunnel in tunnels:
+            logger.info(f"Checking tunnel {tunnel.id}: type={tunnel.type}, core={tunnel.core}, node_id={tunnel.node_id}")
+            needs_gost_forwarding = tunnel.type in ["tcp", "udp", "ws", "grpc", "tcpmux"] and tunnel.core == "gost" and not tunnel.node_id
+            if not needs_gost_forwarding or limit_reason(tunnel):
+                continue
             
-            for tunnel in tunnels:
-                logger.info(f"Checking tunnel {tunnel.id}: type={tunnel.type}, core={tunnel.core}, node_id={tunnel.node_id}")
-                needs_gost_forwarding = tunnel.type in ["tcp", "udp", "ws", "grpc", "tcpmux"] and tunnel.core == "gost" and not tunnel.node_id
-                if not needs_gost_forwarding:
-                    continue
-                
-                listen_port = tunnel.spec.get("listen_port")
-                forward_to = tunnel.spec.get("forward_to")
-                
-                if not forward_to:
-                    remote_ip = tunnel.spec.get("remote_ip", "127.0.0.1")
-                    remote_port = tunnel.spec.get("remote_port", 8080)
-                    forward_to = f"{remote_ip}:{remote_port}"
-                
-                panel_port = listen_port or tunnel.spec.get("remote_port")
-                if not panel_port or not forward_to:
-                    logger.warning(f"Tunnel {tunnel.id}: Missing panel_port or forward_to, skipping restore")
-                    continue
-                
-                try:
-                    use_ipv6 = tunnel.spec.get("use_ipv6", False)
-                    logger.info(f"Restoring gost forwarding for tunnel {tunnel.id}: {tunnel.type}://:{panel_port} -> {forward_to}, use_ipv6={use_ipv6}")
-                    gost_forwarder.start_forward(
-                        tunnel_id=tunnel.id,
-                        local_port=int(panel_port),
-                        forward_to=forward_to,
-                        tunnel_type=tunnel.type,
-                        use_ipv6=bool(use_ipv6)
-                    )
-                    logger.info(f"Successfully restored gost forwarding for tunnel {tunnel.id}")
-                except Exception as e:
-                    logger.error(f"Failed to restore forwarding for tunnel {tunnel.id}: {e}", exc_info=True)
+            listen_port = tunnel.spec.get("listen_port")
+            forward_to = tunnel.spec.get("forward_to")
+            
+            if not forward_to:
+                remote_ip = tunnel.spec.get("remote_ip", "127.0.0.1")
+                remote_port = tunnel.spec.get("remote_port", 8080)
+                forward_to = f"{remote_ip}:{remote_port}"
+            
+            panel_port = listen_port or tunnel.spec.get("remote_port")
+            if not panel_port or not forward_to:
+                logger.warning(f"Tunnel {tunnel.id}: Missing panel_port or forward_to, skipping restore")
+                continue
+            forwards.append((tunnel, int(panel_port), forward_to))
+        
+        phase.begin(len(forwards))
+        
+        async def restore(tunnel: Tunnel, panel_port: int, forward_to: str):
+            try:
+                use_ipv6 = tunnel.spec.get("use_ipv6", False)
+                logger.info(f"Restoring gost forwarding for tunnel {tunnel.id}: {tunnel.type}://:{panel_port} -> {forward_to}, use_ipv6={use_ipv6}")
+                await startup_restore.run_blocking(
+                    gost_forwarder.start_forward,
+                    tunnel_id=tunnel.id,
+                    local_port=panel_port,
+                    forward_to=forward_to,
+                    tunnel_type=tunnel.type,
+                    use_ipv6=bool(use_ipv6)
+                )
+                logger.info(f"Successfully restored gost forwarding for tunnel {tunnel.id}")
+                phase.advance()
+            except Exception as e:
+                logger.error(f"Failed to restore forwarding for tunnel {tunnel.id}: {e}", exc_info=True)
+                phase.advance(ok=False)
+        
+        await asyncio.gather(*(restore(*forward) for forward in forwards))
     except Exception as e:
         logger.error(f"Error restoring forwards: {e}")
+        phase.error = str(e)
 
 
 async def _restore_rathole_servers():
@@ -287,7 +338,7 @@ async def _restore_frp_servers():
         logger.error("Error restoring FRP servers: %s", exc)
 
 
-async def _restore_node_tunnels():
+async def _restore_node_tunnels(phase: RestorePhase):
     """Sync node-side tunnels with panel database after panel restart
     
     Note: Nodes restore their own tunnels on startup independently.
@@ -302,8 +353,10 @@ async def _restore_node_tunnels():
             
             logger.info(f"Found {len(tunnels)} active tunnels to check for sync")
             
+            tunnels = [t for t in tunnels if not limit_reason(t)]
             reverse_tunnels = [t for t in tunnels if t.core in ["rathole", "backhaul", "chisel", "frp"]]
             gost_tunnels = [t for t in tunnels if t.core == "gost" and t.node_id]
+            phase.begin(len(reverse_tunnels) + len(gost_tunnels))
             
             if not reverse_tunnels and not gost_tunnels:
                 logger.info("No node-side tunnels to sync")
@@ -311,40 +364,14 @@ async def _restore_node_tunnels():
             
             logger.info(f"Found {len(reverse_tunnels)} active reverse tunnels and {len(gost_tunnels)} node-side GOST tunnels to sync")
             
-            client = NodeClient()
-            restored_count = 0
+            plan = TunnelSyncPlan()
             failed_count = 0
             skipped_count = 0
+            nodes = await NodeIndex.load(db)
             
             for tunnel in reverse_tunnels:
                 try:
-                    iran_node = None
-                    foreign_node = None
-                    
-                    if tunnel.node_id:
-                        result = await db.execute(select(Node).where(Node.id == tunnel.node_id))
-                        iran_node = result.scalar_one_or_none()
-                        if iran_node and iran_node.node_metadata.get("role") != "iran":
-                            foreign_node = iran_node
-                            iran_node = None
-                    
-                    if not foreign_node:
-                        result = await db.execute(select(Node))
-                        all_nodes = result.scalars().all()
-                        foreign_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "foreign"]
-                        if foreign_nodes:
-                            foreign_node = foreign_nodes[0]
-                    
-                    if not iran_node:
-                        if tunnel.node_id:
-                            result = await db.execute(select(Node).where(Node.id == tunnel.node_id))
-                            iran_node = result.scalar_one_or_none()
-                        if not iran_node:
-                            result = await db.execute(select(Node))
-                            all_nodes = result.scalars().all()
-                            iran_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "iran"]
-                            if iran_nodes:
-                                iran_node = iran_nodes[0]
+                    iran_node, foreign_node = nodes.reverse_pair(tunnel)
                     
                     if not foreign_node or not iran_node:
                         logger.warning(f"Tunnel {tunnel.id}: Missing foreign or iran node, skipping sync (nodes will restore themselves)")
@@ -499,51 +526,11 @@ async def _restore_node_tunnels():
                         if token:
                             client_spec["token"] = token
                     
-                    if not iran_node.node_metadata.get("api_address"):
-                        iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
-                        await db.commit()
+                    nodes.ensure_api_address(iran_node)
+                    nodes.ensure_api_address(foreign_node)
                     
-                    logger.info(f"Restoring tunnel {tunnel.id}: applying server config to iran node {iran_node.id}")
-                    server_response = await client.send_to_node(
-                        node_id=iran_node.id,
-                        endpoint="/api/agent/tunnels/apply",
-                        data={
-                            "tunnel_id": tunnel.id,
-                            "core": tunnel.core,
-                            "type": tunnel.type,
-                            "spec": server_spec
-                        }
-                    )
-                    
-                    if server_response.get("status") == "error":
-                        error_msg = server_response.get("message", "Unknown error from iran node")
-                        logger.error(f"Failed to restore tunnel {tunnel.id} on iran node {iran_node.id}: {error_msg}")
-                        failed_count += 1
-                        continue
-                    
-                    if not foreign_node.node_metadata.get("api_address"):
-                        foreign_node.node_metadata["api_address"] = f"http://{foreign_node.node_metadata.get('ip_address', foreign_node.fingerprint)}:{foreign_node.node_metadata.get('api_port', 8888)}"
-                        await db.commit()
-                    
-                    logger.info(f"Restoring tunnel {tunnel.id}: applying client config to foreign node {foreign_node.id}")
-                    client_response = await client.send_to_node(
-                        node_id=foreign_node.id,
-                        endpoint="/api/agent/tunnels/apply",
-                        data={
-                            "tunnel_id": tunnel.id,
-                            "core": tunnel.core,
-                            "type": tunnel.type,
-                            "spec": client_spec
-                        }
-                    )
-                    
-                    if client_response.get("status") == "error":
-                        error_msg = client_response.get("message", "Unknown error from foreign node")
-                        logger.error(f"Failed to restore tunnel {tunnel.id} on foreign node {foreign_node.id}: {error_msg}")
-                        failed_count += 1
-                    else:
-                        logger.info(f"Successfully restored tunnel {tunnel.id} on both nodes")
-                        restored_count += 1
+                    plan.add(tunnel, iran_node.id, tunnel.core, server_spec)
+                    plan.add(tunnel, foreign_node.id, tunnel.core, client_spec)
                         
                 except Exception as e:
                     logger.error(f"Failed to restore tunnel {tunnel.id}: {e}", exc_info=True)
@@ -580,20 +567,13 @@ async def _restore_node_tunnels():
                         logger.info(f"GOST tunnel {tunnel.id}: No node_id, this is a panel-side forwarding tunnel (handled by _restore_forwards)")
                         continue
                     
-                    iran_node = None
-                    if tunnel.node_id:
-                        result = await db.execute(select(Node).where(Node.id == tunnel.node_id))
-                        iran_node = result.scalar_one_or_none()
-                        if iran_node and iran_node.node_metadata.get("role") != "iran":
-                            logger.warning(f"GOST tunnel {tunnel.id}: node_id points to non-iran node, skipping")
-                            continue
+                    iran_node = nodes.get(tunnel.node_id)
+                    if iran_node and node_role(iran_node) != "iran":
+                        logger.warning(f"GOST tunnel {tunnel.id}: node_id points to non-iran node, skipping")
+                        continue
                     
                     if not iran_node:
-                        result = await db.execute(select(Node))
-                        all_nodes = result.scalars().all()
-                        iran_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "iran"]
-                        if iran_nodes:
-                            iran_node = iran_nodes[0]
+                        iran_node = nodes.first("iran")
                     
                     if not iran_node:
                         logger.warning(f"GOST tunnel {tunnel.id}: No iran node found, skipping sync (node will restore itself)")
@@ -601,11 +581,8 @@ async def _restore_node_tunnels():
                         continue
                     
                     if not foreign_ip or foreign_ip in ["127.0.0.1", "localhost"]:
-                        result = await db.execute(select(Node))
-                        all_nodes = result.scalars().all()
-                        foreign_nodes = [n for n in all_nodes if n.node_metadata and n.node_metadata.get("role") == "foreign"]
-                        if foreign_nodes:
-                            foreign_node = foreign_nodes[0]
+                        foreign_node = nodes.first("foreign")
+                        if foreign_node:
                             foreign_ip = foreign_node.node_metadata.get("ip_address")
                     
                     if not foreign_ip:
@@ -621,40 +598,28 @@ async def _restore_node_tunnels():
                         "use_ipv6": use_ipv6
                     }
                     
-                    client = NodeClient()
-                    if not iran_node.node_metadata.get("api_address"):
-                        iran_node.node_metadata["api_address"] = f"http://{iran_node.node_metadata.get('ip_address', iran_node.fingerprint)}:{iran_node.node_metadata.get('api_port', 8888)}"
-                        await db.commit()
-                    
-                    logger.info(f"Restoring GOST tunnel {tunnel.id}: applying to iran node {iran_node.id}, spec={gost_spec}")
-                    response = await client.send_to_node(
-                        node_id=iran_node.id,
-                        endpoint="/api/agent/tunnels/apply",
-                        data={
-                            "tunnel_id": tunnel.id,
-                            "core": "gost",
-                            "type": tunnel.type,
-                            "spec": gost_spec
-                        }
-                    )
+                    nodes.ensure_api_address(iran_node)
                     
-                    if response.get("status") != "success":
-                        error_msg = response.get("message", "Unknown error from iran node")
-                        logger.error(f"Failed to restore GOST tunnel {tunnel.id} on iran node {iran_node.id}: {error_msg}")
-                        failed_count += 1
-                    else:
-                        logger.info(f"Successfully restored GOST tunnel {tunnel.id} on iran node {iran_node.id}")
-                        restored_count += 1
+                    plan.add(tunnel, iran_node.id, "gost", gost_spec)
                         
                 except Exception as e:
                     logger.error(f"Failed to restore GOST tunnel {tunnel.id}: {e}", exc_info=True)
                     failed_count += 1
             
-            logger.info(f"Tunnel sync completed: {restored_count} synced, {failed_count} failed, {skipped_count} skipped out of {len(reverse_tunnels) + len(gost_tunnels)} total")
+            await nodes.save(db)
+            
+            result = await tunnel_syncer.sync(plan)
+            for tunnel_id, error in result["errors"].items():
+                logger.error(f"Failed to restore tunnel {tunnel_id} on {error}")
+            failed_count += result["failed"]
+            phase.advance(count=result["applied"] + result["unchanged"])
+            phase.advance(ok=False, count=failed_count)
+            logger.info(f"Tunnel sync completed: {result['applied']} synced, {result['unchanged']} already up to date, {result['removed']} stale removed, {failed_count} failed, {skipped_count} skipped out of {len(reverse_tunnels) + len(gost_tunnels)} total")
             logger.info("Note: Nodes restore their own tunnels on startup, so tunnels work even if panel is down")
                     
     except Exception as e:
         logger.error(f"Error restoring node tunnels: {e}", exc_info=True)
+        phase.error = str(e)
 
 
 async def _load_and_start_frp_comm():
@@ -751,6 +716,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(panel.router, prefix="/api/panel", tags=["panel"])
@@ -760,6 +726,7 @@ app.include_router(status.router, prefix="/api/status", tags=["status"])
 app.include_router(logs.router, prefix="/api/logs", tags=["logs"])
 app.include_router(core_health.router, prefix="/api/core-health", tags=["core-health"])
 app.include_router(settings_router.router)
+app.include_router(metrics.router, tags=["metrics"])
 
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 static_path = Path(static_dir)